@@ -0,0 +1,151 @@
+"""
+Chat stream latency while a storm of logins hits the same worker, with bcrypt run
+inline in the login handler (the old code) against the bounded hashing pool of
+utils/passwords.py. Also times authMiddleware per request with and without the
+verified-token cache.
+
+Chat requests stream --chunks chunks paced by asyncio.sleep, standing in for model
+tokens; each of --logins concurrent logins checks a password hashed at
+PASSWORD_HASH_ROUNDS. Runs in-process over httpx's ASGI transport against a
+throwaway SQLite database.
+
+    cd backend
+    python -m benchmarks.auth_storm --logins 40 --chats 40
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import bcrypt
+import httpx
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.responses import StreamingResponse
+from tortoise import Tortoise
+
+
+def _percentiles(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+def _build_app(chunks: int) -> FastAPI:
+    from middleware.authMiddleware import authMiddleware
+    from routes.auth import AuthPayload, router as auth_router
+    from db.models import User
+
+    legacy = APIRouter(prefix="/legacy")
+
+    @legacy.post("/login")
+    async def legacy_login(payload: AuthPayload):
+        user = await User.get(email=payload.email)
+        if not bcrypt.checkpw(payload.password.encode("utf-8"), user.password.encode("utf-8")):
+            return {"message": "Failed to login", "error": "Invalid Password"}
+        return {"message": "Login successful"}
+
+    app = FastAPI()
+    app.include_router(auth_router)
+    app.include_router(legacy)
+
+    @app.get("/stream")
+    async def stream(user: dict = Depends(authMiddleware)):
+        async def body():
+            for i in range(chunks):
+                await asyncio.sleep(0.005)
+                yield f"chunk {i} "
+
+        return StreamingResponse(body(), media_type="text/plain")
+
+    return app
+
+
+async def _chat(client: httpx.AsyncClient, token: str) -> float:
+    started = time.perf_counter()
+    async with client.stream("GET", "/stream", cookies={"access_token": token}) as response:
+        async for _ in response.aiter_bytes():
+            pass
+    return (time.perf_counter() - started) * 1000
+
+
+async def _scenario(client: httpx.AsyncClient, token: str, login_path, args) -> dict:
+    async def chats() -> list[float]:
+        # A few at a time, as separate users would stream answers.
+        results = []
+        for start in range(0, args.chats, 4):
+            results += await asyncio.gather(*(_chat(client, token) for _ in range(min(4, args.chats - start))))
+        return results
+
+    async def login() -> float:
+        started = time.perf_counter()
+        response = await client.post(login_path, json={"email": "storm@example.com", "password": "hunter22"})
+        assert response.json().get("message") == "Login successful", response.text
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if login_path is None:
+        chat_ms, login_ms = await chats(), []
+    else:
+        chat_ms, *login_ms = await asyncio.gather(chats(), *(login() for _ in range(args.logins)))
+    report = {"chat": _percentiles(chat_ms), "wall_seconds": round(time.perf_counter() - started, 2)}
+    if login_ms:
+        report["login"] = _percentiles(login_ms)
+    return report
+
+
+async def _run(args, db_url: str) -> dict:
+    import jwt
+
+    await Tortoise.init(db_url=db_url, modules={"models": ["db.models"]})
+    await Tortoise.generate_schemas(safe=True)
+    try:
+        from db.models import User
+        from middleware import authMiddleware as auth
+        from utils.passwords import hashPassword
+
+        user = await User.create(email="storm@example.com", password=await hashPassword("hunter22"))
+        token = jwt.encode({"id": str(user.id)}, os.environ["JWT_SECRET"], algorithm="HS256")
+        transport = httpx.ASGITransport(app=_build_app(args.chunks))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            report = {
+                "baseline": await _scenario(client, token, None, args),
+                "inline_bcrypt": await _scenario(client, token, "/legacy/login", args),
+                "hash_pool": await _scenario(client, token, "/auth/login", args),
+            }
+
+        class _Request:
+            cookies = {"access_token": token}
+
+        for name, size in (("uncached", "0"), ("cached", "10000")):
+            os.environ["AUTH_TOKEN_CACHE_SIZE"] = size
+            auth.forgetToken(token)
+            started = time.perf_counter()
+            for _ in range(args.auth_calls):
+                await auth.authMiddleware(_Request())
+            report[f"auth_{name}_us"] = round((time.perf_counter() - started) / args.auth_calls * 1e6, 2)
+        return report
+    finally:
+        await Tortoise.close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--chunks", type=int, default=40, help="streamed chunks per chat response")
+    parser.add_argument("--auth-calls", type=int, default=20000)
+    args = parser.parse_args()
+    os.environ.setdefault("JWT_SECRET", "benchmark-secret-of-at-least-32-bytes")
+    with tempfile.TemporaryDirectory() as tmp:
+        report = asyncio.run(_run(args, f"sqlite://{os.path.join(tmp, 'bench.sqlite3')}"))
+    print(json.dumps({"password_hash_rounds": int(os.getenv("PASSWORD_HASH_ROUNDS", "12")), **report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Chat query latency against Chroma while a large upload is being upserted.
+
+Compares the old pattern (synchronous collection calls on the event loop) with the
+thread-pool access layer in utils/vectorstore.py. Needs a running Chroma server
+(CHROMA_HOST/CHROMA_PORT); no OpenAI calls are made, vectors are random.
+
+    cd backend
+    python -m benchmarks.chroma_upload_latency --rows 20000 --queries 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.clients import getChromaCollection
+from utils.vectorstore import queryVectors, upsertVectors
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _random_vectors(count: int, dim: int) -> list[list[float]]:
+    return [[random.random() for _ in range(dim)] for _ in range(count)]
+
+
+async def _upload(mode: str, chat_id: str, rows: int, dim: int, batch: int):
+    collection = getChromaCollection()
+    for start in range(0, rows, batch):
+        count = min(batch, rows - start)
+        ids = [f"bench:{chat_id}:{start + i}" for i in range(count)]
+        metadatas = [{"chat_id": chat_id, "chunk_index": start + i} for i in range(count)]
+        embeddings = _random_vectors(count, dim)
+        if mode == "sync":
+            collection.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas)
+            await asyncio.sleep(0)
+        else:
+            await upsertVectors(ids, embeddings, metadatas)
+
+
+async def _queries(mode: str, chat_id: str, count: int, dim: int, interval: float) -> list[float]:
+    """
+    Issues queries on a fixed schedule and measures from the scheduled arrival time,
+    so time spent waiting behind a blocked event loop is included in the latency.
+    """
+    collection = getChromaCollection()
+    latencies = []
+    where = {"chat_id": {"$eq": chat_id}}
+    next_at = time.perf_counter()
+    for _ in range(count):
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        query = _random_vectors(1, dim)
+        if mode == "sync":
+            collection.query(query_embeddings=query, n_results=5, where=where)
+        else:
+            await queryVectors(query_embeddings=query, n_results=5, where=where)
+        finished = time.perf_counter()
+        latencies.append((finished - next_at) * 1000)
+        next_at = max(next_at + interval, finished)
+    return latencies
+
+
+async def _run_mode(mode: str, args) -> dict:
+    chat_id = f"bench-{uuid.uuid4()}"
+    # Seed a little data so queries have something to match before the upload grows.
+    await _upload("async", chat_id, args.batch, args.dim, args.batch)
+
+    idle = await _queries(mode, chat_id, max(10, args.queries // 10), args.dim, args.interval)
+    started = time.perf_counter()
+    upload_task = asyncio.create_task(_upload(mode, chat_id, args.rows, args.dim, args.batch))
+    busy = await _queries(mode, chat_id, args.queries, args.dim, args.interval)
+    await upload_task
+    upload_seconds = time.perf_counter() - started
+
+    getChromaCollection().delete(where={"chat_id": chat_id})
+    return {
+        "mode": mode,
+        "idle_p50_ms": round(_percentile(idle, 50), 2),
+        "idle_p99_ms": round(_percentile(idle, 99), 2),
+        "during_upload_p50_ms": round(_percentile(busy, 50), 2),
+        "during_upload_p99_ms": round(_percentile(busy, 99), 2),
+        "during_upload_mean_ms": round(statistics.fmean(busy), 2) if busy else 0.0,
+        "upload_rows": args.rows,
+        "upload_seconds": round(upload_seconds, 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between chat queries")
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    results = [await _run_mode(mode.strip(), args) for mode in args.modes.split(",") if mode.strip()]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
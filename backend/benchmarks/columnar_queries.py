@@ -0,0 +1,72 @@
+"""
+Build and scan times of the per-file column store for analytical questions that
+top-5 similarity search cannot answer. Rows are streamed into a throwaway
+COLUMNAR_DIR in ingest-sized windows, then each query is planned and run.
+
+    cd backend
+    python -m benchmarks.columnar_queries --rows 1000000
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from itertools import islice
+
+QUERIES = [
+    "average price of new homes in E06000042",
+    "cheapest 10 flats with low flood risk",
+    "how many 3 bed houses under £400k",
+    "median price by property type",
+    "top 5 most expensive detached houses",
+    "average price per area",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["COLUMNAR_DIR"] = tmp
+        from benchmarks.datasets import iterSyntheticRows
+        from utils.columnar import ColumnarWriter, planAnalyticalQuery, renderAnalyticalContext, runAnalyticalQuery
+
+        started = time.perf_counter()
+        writer = ColumnarWriter("bench-chat", "bench-file")
+        rows = iterSyntheticRows(args.rows)
+        while True:
+            window = list(islice(rows, args.window))
+            if not window:
+                break
+            writer.append(window)
+        writer.finalize()
+        report = {"rows": args.rows, "build_seconds": round(time.perf_counter() - started, 2), "queries": []}
+
+        for query in QUERIES:
+            plan = planAnalyticalQuery(query)
+            if plan is None:
+                report["queries"].append({"query": query, "plan": None})
+                continue
+            timings = []
+            for _ in range(args.repeats):
+                started = time.perf_counter()
+                result = runAnalyticalQuery("bench-chat", plan)
+                timings.append((time.perf_counter() - started) * 1000)
+            report["queries"].append(
+                {
+                    "query": query,
+                    "median_ms": round(statistics.median(timings), 1),
+                    "rows_matched": result["rows_matched"],
+                    "context_chars": len(renderAnalyticalContext(result)),
+                }
+            )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Prompt context before and after context packing: the top five rows rendered as JSON
+against CONTEXT_CANDIDATES over-fetched rows re-ranked, de-duplicated and packed by
+utils/context.packContext.
+
+Rows are embedded with a hashed bag of words so vector similarity tracks wording the
+way a real embedding roughly does, and a share of listings is uploaded twice. A row
+counts as useful when it satisfies every constraint the rule parser finds in the
+question.
+
+    cd backend
+    python -m benchmarks.context_packing --rows 20000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.datasets import bagOfWordsVector, syntheticRows
+
+
+def _matches(row: dict, filters: list[dict]) -> bool:
+    for clause in filters:
+        for key, condition in clause.items():
+            value = row.get(key)
+            for op, expected in condition.items():
+                if value is None:
+                    return False
+                if op == "$eq" and str(value).lower() != str(expected).lower():
+                    return False
+                if op == "$gte" and value < expected:
+                    return False
+                if op == "$lte" and value > expected:
+                    return False
+    return True
+
+
+def _questions(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    types = ["flat", "detached house", "bungalow", "terraced house"]
+    return [
+        rng.choice(
+            [
+                f"{rng.randint(1, 5)} bedroom {rng.choice(types)} under {rng.randint(2, 12) * 50}k",
+                f"{rng.choice(types)} with low flood risk and at least {rng.randint(1, 3)} bathrooms",
+                f"new build {rng.choice(types)} near {rng.choice(['Mill', 'Station', 'Park'])} Road under {rng.randint(3, 9)}00k",
+            ]
+        )
+        for _ in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="share of listings uploaded twice")
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+
+    rows = syntheticRows(args.rows)
+    rng = random.Random(1)
+    rows += [dict(row) for row in rng.sample(rows, int(len(rows) * args.duplicates))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["LOCAL_INDEX_DIR"] = tmp
+        from utils.context import packContext, renderRowText
+        from utils.filters import filtersFromArgs, parsePropertyFilters
+        from utils.localindex import LocalVectorStore
+        from utils.scheduler import estimateTokens
+
+        store = LocalVectorStore(tmp)
+        metadatas = [{**row, "chat_id": "chat-0", "chunk_index": i} for i, row in enumerate(rows)]
+        vectors = np.stack([bagOfWordsVector(json.dumps(row), args.dim) for row in rows])
+        for start in range(0, len(rows), 2000):
+            store.upsert(
+                [f"row-{i}" for i in range(start, min(start + 2000, len(rows)))],
+                vectors[start : start + 2000],
+                metadatas[start : start + 2000],
+            )
+
+        candidates = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+        totals = {name: {"tokens": [], "rows": [], "unique": [], "useful": []} for name in ("old", "packed")}
+        pack_ms = []
+        for question in _questions(args.queries, 2):
+            filters = filtersFromArgs(parsePropertyFilters(question)[0])
+            res = store.query([bagOfWordsVector(question, args.dim)], candidates, {"chat_id": {"$eq": "chat-0"}})
+            metas, distances = res["metadatas"][0], res["distances"][0]
+
+            old = [renderRowText(m) for m in metas[:5]]
+            old_rows = metas[:5]
+            started = time.perf_counter()
+            packed = packContext(question, metas, distances, filters)
+            pack_ms.append((time.perf_counter() - started) * 1000)
+            by_address = {m["address"]: m for m in metas}
+            packed_rows = [by_address[line.split(" | ")[0]] for line in packed.splitlines()[1:]]
+
+            for name, text, chosen in (("old", "\n\n".join(old), old_rows), ("packed", packed, packed_rows)):
+                totals[name]["tokens"].append(estimateTokens(text))
+                totals[name]["rows"].append(len(chosen))
+                totals[name]["unique"].append(len({m["address"] for m in chosen}))
+                totals[name]["useful"].append(len({m["address"] for m in chosen if _matches(m, filters)}))
+        store.close()
+
+    report = {
+        name: {f"mean_{key}": round(statistics.mean(values), 2) for key, values in metrics.items()}
+        for name, metrics in totals.items()
+    }
+    report["packed"]["pack_p50_ms"] = round(statistics.median(pack_ms), 3)
+    print(json.dumps({"rows": len(rows), "queries": args.queries, "candidates": candidates, **report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
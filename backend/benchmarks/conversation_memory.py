@@ -0,0 +1,119 @@
+"""
+Prompt size, request size and history-assembly latency per turn as a conversation
+grows, for client-shipped history (the last five turns in every request) against
+the server-side window plus running summary of utils/memory.py.
+
+Folding needs the chat model and runs after the response, so it is not timed here:
+at every checkpoint the summary is set to HISTORY_SUMMARY_TOKENS worth of text and
+its cursor --window-hint messages back, about where background folding keeps it. Runs on a throwaway SQLite file by default; pass --db-url for Postgres.
+
+    cd backend
+    python -m benchmarks.conversation_memory --messages 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from tortoise import Tortoise
+
+from db.models import Chat, Message, User
+from utils.memory import loadConversation
+from utils.pagination import encodeCursor
+from utils.scheduler import estimateTokens
+
+
+def _content(i: int) -> str:
+    if i % 2 == 0:
+        return f"Question {i}: which of the flats with at least 2 bedrooms under 450k have low flood risk?"
+    return f"Answer {i}: " + "The flat at 12 Harbour Road has 2 bedrooms, costs £420,000 and low flood risk. " * (2 + i % 5)
+
+
+async def _run(args) -> dict:
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["db.models"]})
+    await Tortoise.generate_schemas(safe=True)
+    report = []
+    try:
+        user = await User.create(email=f"bench-{uuid.uuid4().hex[:8]}@example.com", password="x")
+        chat = await Chat.create(user=user, title="long chat")
+        began = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        summary = "The user is looking for flats near the harbour. " * (int(os.getenv("HISTORY_SUMMARY_TOKENS", "400")) // 12)
+        seeded = 0
+        checkpoints = sorted({c for c in args.checkpoints if c <= args.messages} | {args.messages})
+        for checkpoint in checkpoints:
+            messages = [
+                Message(
+                    id=uuid.uuid4(),
+                    chat=chat,
+                    role="USER" if i % 2 == 0 else "ASSISTANT",
+                    content=_content(i),
+                    created_at=began + timedelta(seconds=i),
+                )
+                for i in range(seeded, checkpoint)
+            ]
+            for start in range(0, len(messages), 5000):
+                await Message.bulk_create(messages[start : start + 5000])
+            seeded = checkpoint
+            question = await Message.create(
+                chat=chat, role="USER", content=_content(0), created_at=began + timedelta(seconds=checkpoint)
+            )
+
+            # Emulate folding having kept up: everything older than --window-hint turns is summarised.
+            folded = (
+                await Message.filter(chat=chat, created_at__lt=question.created_at)
+                .order_by("-created_at")
+                .offset(args.window_hint)
+                .first()
+            )
+            chat.summary = summary if folded else None
+            chat.summary_cursor = encodeCursor(folded.created_at, folded.id) if folded else None
+
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                history, _ = await loadConversation(chat, question)
+                samples.append((time.perf_counter() - started) * 1000)
+            legacy = [
+                {"role": "USER" if i % 2 == 0 else "ASSISTANT", "content": _content(i)}
+                for i in range(max(0, seeded - 5), seeded)
+            ]
+            report.append(
+                {
+                    "messages": seeded,
+                    "legacy_request_bytes": len(json.dumps({"role": "USER", "content": _content(0), "history": legacy})),
+                    "legacy_history_tokens": sum(estimateTokens(m["content"]) for m in legacy),
+                    "server_request_bytes": len(json.dumps({"role": "USER", "content": _content(0)})),
+                    "server_history_tokens": sum(estimateTokens(m["content"]) for m in history),
+                    "server_verbatim_turns": sum(1 for m in history if m["role"] != "system"),
+                    "full_history_tokens": sum(estimateTokens(_content(i)) for i in range(seeded)),
+                    "load_p50_ms": round(statistics.median(samples), 2),
+                }
+            )
+            print(json.dumps(report[-1]))
+            await question.delete()
+        await User.filter(id=user.id).delete()
+    finally:
+        await Tortoise.close_connections()
+    return {"history_token_budget": int(os.getenv("HISTORY_TOKEN_BUDGET", "1500")), "report": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--checkpoints", type=int, nargs="*", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--window-hint", type=int, default=40, help="messages left unsummarised at each checkpoint")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db-url", default=None)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        args.db_url = args.db_url or f"sqlite://{os.path.join(tmp, 'bench.sqlite3')}"
+        print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Rows/sec parsing a property CSV with the old row-by-row type detection (csv.DictReader
+plus an int()/float() attempt per cell) against the schema-inferred, column-wise
+conversion in utils/extract.py, and the number of columns each leaves with mixed
+Python types.
+
+The file is the synthetic listings plus a floor area that is usually whole and
+sometimes has a decimal, and an EPC rating that is often blank.
+
+    cd backend
+    python -m benchmarks.csv_parsing --rows 1000000
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.datasets import iterSyntheticRows
+from utils.extract import iterDataFromFile
+
+
+def _legacy_convert(value: str):
+    val_lower = value.strip().lower()
+    if val_lower == "true":
+        return True
+    if val_lower == "false":
+        return False
+    try:
+        return int(value.strip())
+    except (ValueError, TypeError):
+        pass
+    try:
+        return float(value.strip())
+    except (ValueError, TypeError):
+        pass
+    return value
+
+
+def _legacy_rows(stream):
+    for row in csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8", newline="")):
+        processed = {
+            key: _legacy_convert(value) for key, value in row.items() if value is not None and value.strip() != ""
+        }
+        if processed:
+            yield processed
+
+
+def _write_csv(path: str, count: int):
+    rng = random.Random(3)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = None
+        for row in iterSyntheticRows(count):
+            row["floor_area_sqm"] = rng.randint(30, 300) if rng.random() < 0.9 else round(rng.uniform(30, 300), 1)
+            row["epc_rating"] = rng.choice("ABCDEFG") if rng.random() < 0.4 else ""
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def _measure(rows) -> dict:
+    types = defaultdict(set)
+    count = 0
+    started = time.perf_counter()
+    for row in rows:
+        count += 1
+        for key, value in row.items():
+            types[key].add(type(value).__name__)
+    seconds = time.perf_counter() - started
+    return {
+        "rows": count,
+        "seconds": round(seconds, 2),
+        "rows_per_sec": round(count / seconds),
+        "mixed_type_columns": sorted(key for key, names in types.items() if len(names) > 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "listings.csv")
+        _write_csv(path, args.rows)
+        with open(path, "rb") as f:
+            legacy = _measure(_legacy_rows(f))
+        schema = {}
+        with open(path, "rb") as f:
+            inferred = _measure(iterDataFromFile("listings.csv", "text/csv", f, schema))
+        size = os.path.getsize(path)
+
+    inferred["schema"] = schema
+    print(
+        json.dumps(
+            {
+                "file_mb": round(size / 1e6, 1),
+                "row_by_row": legacy,
+                "schema_inferred": inferred,
+                "speedup": round(inferred["rows_per_sec"] / legacy["rows_per_sec"], 2),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
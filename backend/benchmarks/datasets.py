@@ -0,0 +1,36 @@
+import hashlib
+import random
+from typing import Iterator
+
+import numpy as np
+
+
+def syntheticRows(count: int, seed: int = 7) -> list[dict]:
+    return list(iterSyntheticRows(count, seed))
+
+
+def iterSyntheticRows(count: int, seed: int = 7) -> Iterator[dict]:
+    """Property listings shaped like the uploads the app is built for."""
+    rng = random.Random(seed)
+    types = ["Flat", "Detached house", "Semi-detached house", "Terraced house", "Bungalow"]
+    for i in range(count):
+        yield {
+            "address": f"{rng.randint(1, 250)} {rng.choice(['High', 'Mill', 'Church', 'Station', 'Park'])} Road, Town {i % 97}",
+            "price": rng.randint(90, 1500) * 1000,
+            "bedrooms": rng.randint(1, 6),
+            "bathrooms": rng.randint(1, 4),
+            "property_type_full_description": rng.choice(types),
+            "flood_risk": rng.choice(["Very Low", "Low", "Medium", "High"]),
+            "is_new_home": rng.random() < 0.15,
+            "laua": f"E0{6000001 + rng.randrange(350)}",
+            "crime_score_weight": round(rng.uniform(0, 10), 2),
+            "listing_update_date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        }
+
+
+def bagOfWordsVector(text: str, dim: int) -> np.ndarray:
+    """Hashed bag of words, unit length: similarity tracks shared wording, as real embeddings roughly do."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().replace(",", " ").split():
+        vector[int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % dim] += 1.0
+    return vector / max(1e-6, float(np.linalg.norm(vector)))
@@ -0,0 +1,181 @@
+"""
+Cost of a nightly listings refresh. A chat's file of --rows listings is re-uploaded
+with --change of its rows different (a third edited, a third removed, a third new),
+once as a new chat through /app/newChat, which embeds and upserts every row, and
+once as a new version of the existing file through /app/chats/{id}/files, which is
+diffed on --key-column and only embeds new or changed rows.
+
+The app runs as in benchmarks/load_test.py, with the embedding cache off so the
+full upload's embedding work is not hidden by it. Reports rows embedded, inputs
+sent to the embedding API and job time for both, then checks the refreshed file in
+the local vector index and column store: row count, removed rows gone and an edited
+row's new price.
+
+    cd backend
+    python -m benchmarks.delta_refresh --rows 20000 --change 0.02
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import tempfile
+from datetime import datetime
+
+import httpx
+
+from benchmarks.datasets import iterSyntheticRows
+from benchmarks.fake_openai import FakeOpenAIConfig, startFakeOpenAI
+from benchmarks.load_test import freePort, startApp
+
+
+def _listings(rows: int, change: float, seed: int) -> tuple[list[dict], list[dict], dict]:
+    """The original file, its new version, and which listing ids were edited and removed."""
+    original = [{"listing_id": f"L{i:07d}", **row} for i, row in enumerate(iterSyntheticRows(rows, seed))]
+    rng = random.Random(seed)
+    touched = rng.sample(range(rows), int(rows * change * 2 / 3))
+    edited, removed = set(touched[::2]), set(touched[1::2])
+    refreshed = []
+    for i, row in enumerate(original):
+        if i in removed:
+            continue
+        refreshed.append({**row, "price": row["price"] + 5000} if i in edited else row)
+    added = len(touched) // 2
+    for i, row in enumerate(iterSyntheticRows(added, seed + 1)):
+        refreshed.append({"listing_id": f"N{i:07d}", **row})
+    changes = {
+        "edited": sorted(original[i]["listing_id"] for i in edited),
+        "removed": sorted(original[i]["listing_id"] for i in removed),
+        "added": added,
+    }
+    return original, refreshed, changes
+
+
+def _write_csv(path: str, rows: list[dict]):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+async def _wait(client: httpx.AsyncClient, job_id: str) -> dict:
+    while True:
+        job = (await client.get(f"/app/jobs/{job_id}")).json()
+        if job["status"] in ("COMPLETED", "FAILED"):
+            return job
+        await asyncio.sleep(0.2)
+
+
+def _job_seconds(job: dict) -> float:
+    return round((datetime.fromisoformat(job["finished_at"]) - datetime.fromisoformat(job["started_at"])).total_seconds(), 2)
+
+
+async def _drive(base_url: str, fake_url: str, original: str, refreshed: str, key_column: str) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(600.0)) as client:
+        credentials = {"email": "refresh@example.com", "password": "refresh-test-password"}
+        (await client.post("/auth/signup", json=credentials)).raise_for_status()
+        (await client.post("/auth/login", json=credentials)).raise_for_status()
+
+        async def upload(path: str, url: str, data: dict) -> tuple[dict, dict]:
+            before = httpx.get(f"{fake_url}/stats").json()["inputs"]
+            with open(path, "rb") as f:
+                response = await client.post(url, data=data, files={"file": (os.path.basename(path), f, "text/csv")})
+            response.raise_for_status()
+            created = response.json()
+            job = await _wait(client, created["jobId"])
+            job["embedding_inputs"] = httpx.get(f"{fake_url}/stats").json()["inputs"] - before
+            return created, job
+
+        created, first = await upload(original, "/app/newChat", {"title": "listings", "key_column": key_column})
+        chat_id, file_id = created["chat"]["id"], created["fileId"]
+        _, full = await upload(refreshed, "/app/newChat", {"title": "listings, re-uploaded"})
+        _, delta = await upload(refreshed, f"/app/chats/{chat_id}/files", {"file_id": file_id})
+
+    def summary(job: dict) -> dict:
+        return {
+            "status": job["status"],
+            "error": job["error"],
+            "rows": job["rows_parsed"],
+            "rows_embedded": job["rows_embedded"],
+            "rows_unchanged": job["rows_unchanged"],
+            "rows_deleted": job["rows_deleted"],
+            "embedding_inputs": job["embedding_inputs"],
+            "seconds": _job_seconds(job),
+        }
+
+    return {
+        "chat_id": chat_id,
+        "file_id": file_id,
+        "initial": summary(first),
+        "full_reupload": summary(full),
+        "refresh": summary(delta),
+    }
+
+
+def _check(tmp: str, chat_id: str, file_id: str, refreshed: list[dict], changes: dict) -> dict:
+    """Reads the refreshed file back from the stores the app wrote."""
+    os.environ["COLUMNAR_DIR"] = os.path.join(tmp, "columnar")
+    from utils.columnar import openFileColumns
+    from utils.localindex import LocalVectorStore
+
+    store = LocalVectorStore(os.path.join(tmp, "vectors"))
+    where = {"$and": [{"chat_id": {"$eq": chat_id}}, {"file_id": {"$eq": file_id}}]}
+    metadatas = store.get(where=where, include=["metadatas"])["metadatas"]
+    store.close()
+    by_id = {meta["listing_id"]: meta for meta in metadatas}
+    expected = {row["listing_id"]: row for row in refreshed}
+    edited = changes["edited"][0] if changes["edited"] else None
+    columns = openFileColumns(chat_id, file_id)
+    return {
+        "vectors": len(metadatas),
+        "expected_rows": len(refreshed),
+        "removed_still_present": sum(listing in by_id for listing in changes["removed"]),
+        "edited_price_updated": edited is None or by_id[edited]["price"] == expected[edited]["price"],
+        "column_store_rows": columns.rows if columns else None,
+        "chunk_indexes_unique": len({meta["chunk_index"] for meta in metadatas}) == len(metadatas),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--change", type=float, default=0.02, help="share of rows edited, removed or added")
+    parser.add_argument("--key-column", default="listing_id")
+    parser.add_argument("--seed", type=int, default=5)
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    args = parser.parse_args()
+
+    original, refreshed, changes = _listings(args.rows, args.change, args.seed)
+    fake_port, app_port = freePort(), freePort()
+    fake = startFakeOpenAI(FakeOpenAIConfig(base_latency_ms=args.embed_latency_ms), fake_port)
+    with tempfile.TemporaryDirectory() as tmp:
+        original_path, refreshed_path = os.path.join(tmp, "listings.csv"), os.path.join(tmp, "listings-next.csv")
+        _write_csv(original_path, original)
+        _write_csv(refreshed_path, refreshed)
+        server, base_url = startApp(tmp, app_port, fake_port, {"EMBED_CACHE_DB": "", "EMBED_CACHE_SIZE": "1"})
+        try:
+            results = asyncio.run(
+                _drive(base_url, f"http://127.0.0.1:{fake_port}", original_path, refreshed_path, args.key_column)
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            fake.should_exit = True
+        check = _check(tmp, results.pop("chat_id"), results.pop("file_id"), refreshed, changes)
+
+    print(
+        json.dumps(
+            {
+                "rows": args.rows,
+                "changed": {"edited": len(changes["edited"]), "removed": len(changes["removed"]), "added": changes["added"]},
+                **results,
+                "check": check,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
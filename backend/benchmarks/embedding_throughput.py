@@ -0,0 +1,98 @@
+"""
+Embedding throughput of the old fixed batching (EMBED_BATCH_SIZE rows under a
+static semaphore) versus the token-packed AIMD EmbeddingScheduler, both against
+the local fake OpenAI server started in-process.
+
+    cd backend
+    python -m benchmarks.embedding_throughput --rows 20000 --tokens-per-sec 400000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks.datasets import syntheticRows
+from benchmarks.fake_openai import FakeOpenAIConfig, startFakeOpenAI
+
+
+async def _fixed(texts: list[str], batch_size: int, concurrency: int) -> dict:
+    from openai import RateLimitError, APIError, APIConnectionError
+    from utils.clients import getAsyncOpenai, getEmbeddingModelName
+
+    client = getAsyncOpenai()
+    model = getEmbeddingModelName()
+    sem = asyncio.Semaphore(concurrency)
+    counters = {"requests": 0, "rate_limited": 0}
+
+    async def embed_batch(chunk: list[str]):
+        async with sem:
+            for attempt in range(6):
+                try:
+                    counters["requests"] += 1
+                    await client.embeddings.create(model=model, input=chunk)
+                    return
+                except (RateLimitError, APIError, APIConnectionError) as e:
+                    if isinstance(e, RateLimitError):
+                        counters["rate_limited"] += 1
+                    if attempt == 5:
+                        raise
+                    await asyncio.sleep((2 ** attempt) * 0.5 + random.randint(0, 250) / 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(embed_batch(texts[i : i + batch_size]) for i in range(0, len(texts), batch_size)))
+    elapsed = time.perf_counter() - started
+    return {"strategy": "fixed", "rows_per_sec": round(len(texts) / elapsed, 1), "seconds": round(elapsed, 2), **counters}
+
+
+async def _adaptive(texts: list[str], window: int) -> dict:
+    from utils.scheduler import EmbeddingScheduler
+
+    scheduler = EmbeddingScheduler()
+    started = time.perf_counter()
+    for i in range(0, len(texts), window):
+        await scheduler.embed(texts[i : i + window])
+    elapsed = time.perf_counter() - started
+    stats = scheduler.stats()
+    return {
+        "strategy": "adaptive",
+        "rows_per_sec": round(len(texts) / elapsed, 1),
+        "seconds": round(elapsed, 2),
+        "requests": stats["requests"],
+        "rate_limited": stats["rate_limited"],
+        "final_concurrency": stats["concurrency_limit"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--tokens-per-sec", type=float, default=400000.0)
+    parser.add_argument("--batch-size", type=int, default=100, help="fixed strategy EMBED_BATCH_SIZE")
+    parser.add_argument("--concurrency", type=int, default=3, help="fixed strategy EMBED_CONCURRENCY")
+    parser.add_argument("--window", type=int, default=2000, help="adaptive strategy INGEST_WINDOW_ROWS")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    # The scheduler's shared budget is configured to match the provider's advertised limit.
+    os.environ.setdefault("EMBED_TPM", str(int(args.tokens_per_sec * 60)))
+    startFakeOpenAI(
+        FakeOpenAIConfig(base_latency_ms=args.latency_ms, capacity=args.capacity, tokens_per_sec=args.tokens_per_sec),
+        args.port,
+    )
+
+    texts = [json.dumps(row, sort_keys=True) for row in syntheticRows(args.rows)]
+    results = [
+        await _fixed(texts, args.batch_size, args.concurrency),
+        await _adaptive(texts, args.window),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
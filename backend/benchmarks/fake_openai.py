@@ -0,0 +1,232 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs.
+
+Embedding latency grows with request size and with concurrent requests beyond
+--capacity, and requests beyond the --tokens-per-sec budget get a 429 with
+retry-after, so client-side batching and concurrency control have something
+realistic to adapt to. Chat completions answer after --first-token-ms and, when
+streamed, send --completion-tokens tokens --token-interval-ms apart; a share
+--chat-429-rate of chat calls is rejected with a 429.
+
+    cd backend
+    python -m benchmarks.fake_openai --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from collections import deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FakeOpenAIConfig:
+    def __init__(
+        self,
+        dim: int = 64,
+        base_latency_ms: float = 80.0,
+        per_token_us: float = 2.0,
+        capacity: int = 8,
+        tokens_per_sec: float = 0.0,
+        chars_per_token: float = 3.0,
+        first_token_ms: float = 300.0,
+        completion_tokens: int = 120,
+        token_interval_ms: float = 10.0,
+        chat_429_rate: float = 0.0,
+    ):
+        self.dim = dim
+        self.base_latency_ms = base_latency_ms
+        self.per_token_us = per_token_us
+        self.capacity = capacity
+        self.tokens_per_sec = tokens_per_sec
+        self.chars_per_token = chars_per_token
+        self.first_token_ms = first_token_ms
+        self.completion_tokens = completion_tokens
+        self.token_interval_ms = token_interval_ms
+        self.chat_429_rate = chat_429_rate
+
+
+def fakeVector(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+def createFakeOpenAI(config: FakeOpenAIConfig) -> FastAPI:
+    app = FastAPI()
+    state = {"in_flight": 0, "requests": 0, "inputs": 0, "rate_limited": 0, "chat_requests": 0, "chat_rate_limited": 0}
+    window: deque = deque()
+
+    def over_budget(tokens: int) -> bool:
+        if config.tokens_per_sec <= 0:
+            return False
+        now = time.monotonic()
+        while window and now - window[0][0] > 1.0:
+            window.popleft()
+        used = sum(t for _, t in window)
+        if used + tokens > config.tokens_per_sec:
+            return True
+        window.append((now, tokens))
+        return False
+
+    def rate_limited() -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": "0.5"},
+            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+        )
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        tokens = sum(max(1, int(len(t) / config.chars_per_token)) for t in inputs)
+
+        if over_budget(tokens):
+            state["rate_limited"] += 1
+            return rate_limited()
+
+        state["in_flight"] += 1
+        state["requests"] += 1
+        state["inputs"] += len(inputs)
+        try:
+            congestion = 1.0 + max(0, state["in_flight"] - config.capacity) / max(1, config.capacity)
+            delay_ms = (config.base_latency_ms + tokens * config.per_token_us / 1000) * congestion
+            await asyncio.sleep(delay_ms / 1000)
+        finally:
+            state["in_flight"] -= 1
+
+        base64_output = body.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(inputs):
+            vec = fakeVector(text, body.get("dimensions") or config.dim)
+            if base64_output:
+                embedding = base64.b64encode(struct.pack(f"<{len(vec)}f", *vec)).decode()
+            else:
+                embedding = vec
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if config.chat_429_rate > 0 and random.random() < config.chat_429_rate:
+            state["chat_rate_limited"] += 1
+            return rate_limited()
+        state["chat_requests"] += 1
+        model = body.get("model", "fake-chat")
+        words = [f"w{i} " for i in range(config.completion_tokens)]
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4
+        created = int(time.time())
+
+        if body.get("stream"):
+
+            def chunk(delta: dict, finish_reason=None) -> str:
+                event = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                return f"data: {json.dumps(event)}\n\n"
+
+            async def events():
+                await asyncio.sleep(config.first_token_ms / 1000)
+                yield chunk({"role": "assistant", "content": ""})
+                for word in words:
+                    yield chunk({"content": word})
+                    if config.token_interval_ms > 0:
+                        await asyncio.sleep(config.token_interval_ms / 1000)
+                yield chunk({}, "stop")
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        # Non-streamed calls (filter extraction, history folding) answer in one piece.
+        # Tool definitions are accepted but never called, so those answers are empty.
+        if body.get("tools"):
+            words = []
+        await asyncio.sleep((config.first_token_ms + config.token_interval_ms * len(words)) / 1000)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words),
+            },
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return state
+
+    return app
+
+
+def startFakeOpenAI(config: FakeOpenAIConfig, port: int, host: str = "127.0.0.1") -> uvicorn.Server:
+    """Serves the fake API from a daemon thread; returns once it accepts connections."""
+    server = uvicorn.Server(uvicorn.Config(createFakeOpenAI(config), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--per-token-us", type=float, default=2.0)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="0 disables 429 injection")
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--token-interval-ms", type=float, default=10.0)
+    parser.add_argument("--chat-429-rate", type=float, default=0.0, help="share of chat calls answered with a 429")
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(
+        dim=args.dim,
+        base_latency_ms=args.latency_ms,
+        per_token_us=args.per_token_us,
+        capacity=args.capacity,
+        tokens_per_sec=args.tokens_per_sec,
+        first_token_ms=args.first_token_ms,
+        completion_tokens=args.completion_tokens,
+        token_interval_ms=args.token_interval_ms,
+        chat_429_rate=args.chat_429_rate,
+    )
+    uvicorn.run(createFakeOpenAI(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
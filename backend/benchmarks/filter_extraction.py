@@ -0,0 +1,98 @@
+"""
+Accuracy and latency of structured filter extraction on a labelled query corpus.
+
+Always runs the rule-based parser. With --llm it also runs the tool-calling model
+path (needs OPENAI_API_KEY) and the combined rules-then-LLM path used in production.
+
+    cd backend
+    python -m benchmarks.filter_extraction [--llm]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.extract import getStructuredVectorQuery
+from utils.filters import filtersFromArgs, parsePropertyFilters
+
+CORPUS = os.path.join(os.path.dirname(__file__), "filter_queries.jsonl")
+
+
+def _canonical(filters: list[dict]) -> list[str]:
+    return sorted(json.dumps(f, sort_keys=True) for f in filters)
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _load() -> list[dict]:
+    with open(CORPUS) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _bench_rules(corpus: list[dict], repeats: int) -> dict:
+    threshold = float(os.getenv("FILTER_RULES_MIN_CONFIDENCE", "0.75"))
+    confident = correct = 0
+    for item in corpus:
+        args, confidence = parsePropertyFilters(item["query"])
+        if confidence >= threshold:
+            confident += 1
+            if _canonical(filtersFromArgs(args)) == _canonical(filtersFromArgs(item["expected"])):
+                correct += 1
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for item in corpus:
+            parsePropertyFilters(item["query"])
+    per_query_us = (time.perf_counter() - started) / (repeats * len(corpus)) * 1e6
+
+    return {
+        "path": "rules",
+        "queries": len(corpus),
+        "coverage": round(confident / len(corpus), 3),
+        "accuracy_when_confident": round(correct / confident, 3) if confident else None,
+        "mean_latency_us": round(per_query_us, 1),
+    }
+
+
+async def _bench_async(corpus: list[dict], use_rules: bool) -> dict:
+    correct = 0
+    latencies = []
+    for item in corpus:
+        started = time.perf_counter()
+        filters = await getStructuredVectorQuery(item["query"], use_rules=use_rules)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if _canonical(filters) == _canonical(filtersFromArgs(item["expected"])):
+            correct += 1
+    return {
+        "path": "rules+llm" if use_rules else "llm",
+        "queries": len(corpus),
+        "accuracy": round(correct / len(corpus), 3),
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm", action="store_true", help="also benchmark the model-backed paths")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = _load()
+    results = [_bench_rules(corpus, args.repeats)]
+    if args.llm:
+        results.append(await _bench_async(corpus, use_rules=False))
+        results.append(await _bench_async(corpus, use_rules=True))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Exact-match lookups (street addresses and local authority codes) answered by vector
+search alone, by the per-chat BM25 inverted index alone, and by both fused with
+reciprocal rank fusion.
+
+Rows are embedded with a hashed bag of words (benchmarks/datasets.py), which is
+kinder to exact tokens than a real embedding model, so vector recall here is an upper
+bound. "routed" is what the chat route retrieves: the index alone for queries
+isExactLookup recognises, fused candidates otherwise. Also reports how long the index takes to build window by window and its size
+on disk.
+
+    cd backend
+    python -m benchmarks.hybrid_search --rows 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.datasets import bagOfWordsVector, syntheticRows
+
+
+def _p50(samples: list[float]) -> float:
+    return round(statistics.median(samples), 3)
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--window", type=int, default=2000, help="rows per ingest window")
+    args = parser.parse_args()
+
+    rows = syntheticRows(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("LOCAL_INDEX_DIR", "LEXICAL_INDEX_DIR", "COLUMNAR_DIR"):
+            os.environ[name] = os.path.join(tmp, name.lower())
+        from utils.columnar import ColumnarWriter
+        from utils.lexicalindex import LexicalWriter, fuseCandidates, isExactLookup, lexicalCandidates
+        from utils.localindex import LocalVectorStore
+
+        chat_id, file_id = "chat-0", "file-0"
+        columns = ColumnarWriter(chat_id, file_id)
+        lexical = LexicalWriter(chat_id, file_id)
+        store = LocalVectorStore(os.environ["LOCAL_INDEX_DIR"])
+        index_seconds = 0.0
+        for start in range(0, len(rows), args.window):
+            window = rows[start : start + args.window]
+            columns.append(window)
+            started = time.perf_counter()
+            lexical.append(window)
+            index_seconds += time.perf_counter() - started
+            store.upsert(
+                [f"{file_id}-{i}" for i in range(start, start + len(window))],
+                np.stack([bagOfWordsVector(" ".join(map(str, row.values())), args.dim) for row in window]),
+                [{**row, "chat_id": chat_id, "file_id": file_id, "chunk_index": start + i} for i, row in enumerate(window)],
+            )
+        columns.finalize()
+        lexical.finalize()
+
+        rng = random.Random(4)
+        targets = rng.sample(range(len(rows)), args.queries)
+        where = {"chat_id": {"$eq": chat_id}}
+        report = {}
+        for kind in ("address", "laua"):
+            hits = {"vector": 0, "lexical": 0, "fused": 0, "routed": 0}
+            latency = {"vector": [], "lexical": []}
+            for target in targets:
+                row = rows[target]
+                query = f"tell me about {row['address']}" if kind == "address" else f"homes in {row['laua']}"
+
+                def relevant(meta: dict) -> bool:
+                    if kind == "address":
+                        return meta.get("chunk_index") == target
+                    return meta.get("laua") == row["laua"]
+
+                started = time.perf_counter()
+                vector = store.query([bagOfWordsVector(query, args.dim)], args.k * 4, where)["metadatas"][0]
+                latency["vector"].append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                found = lexicalCandidates(chat_id, query, args.k * 4)
+                latency["lexical"].append((time.perf_counter() - started) * 1000)
+                fused = fuseCandidates(vector, found)
+                # The chat route skips the embedding and answers from the index alone for exact lookups.
+                routed = found if isExactLookup(query) else fused
+                for name, ranked in (("vector", vector), ("lexical", found), ("fused", fused), ("routed", routed)):
+                    top = ranked[: args.k]
+                    # Address lookups score a hit for the exact row, area lookups the share of in-area rows.
+                    hits[name] += any(map(relevant, top)) if kind == "address" else sum(map(relevant, top)) / args.k
+            report[kind] = {
+                **{f"{name}_hit@{args.k}": round(value / args.queries, 4) for name, value in hits.items()},
+                "vector_p50_ms": _p50(latency["vector"]),
+                "lexical_p50_ms": _p50(latency["lexical"]),
+            }
+        store.close()
+        lexical_bytes = _dir_bytes(os.environ["LEXICAL_INDEX_DIR"])
+
+    print(
+        json.dumps(
+            {
+                "rows": args.rows,
+                "lexical_index_seconds": round(index_seconds, 2),
+                "lexical_index_bytes_per_row": round(lexical_bytes / args.rows, 1),
+                **report,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
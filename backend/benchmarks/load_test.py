@@ -0,0 +1,322 @@
+"""
+End-to-end load test of the API with no external services: the app runs under
+uvicorn in a subprocess against the fake OpenAI server (benchmarks/fake_openai.py,
+embeddings and streamed chat with configurable latency and 429s), the local vector
+store (VECTOR_STORE=local) and SQLite, all in a throwaway directory.
+
+It uploads --uploads files of --rows synthetic listings through /app/newChat and
+waits for their ingestion jobs, then sends --messages questions to
+/app/chats/{id}/messages/stream with --concurrency in flight. Reported: rows/sec
+ingested, time to first token and total latency (p50/p99), chat requests/sec,
+error counts and the app's peak RSS, as JSON. --output saves the report as a
+baseline; --compare prints each metric's change against a saved baseline.
+
+    cd backend
+    python -m benchmarks.load_test --rows 20000 --uploads 2 --messages 200 --concurrency 16 --output baseline.json
+    python -m benchmarks.load_test --rows 20000 --uploads 2 --messages 200 --concurrency 16 --compare baseline.json
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from tortoise import Tortoise
+
+from benchmarks.datasets import iterSyntheticRows
+from benchmarks.fake_openai import FakeOpenAIConfig, startFakeOpenAI
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metrics compared against a baseline, and whether higher is better.
+COMPARED = {
+    "ingest.rows_per_sec": True,
+    "chat.requests_per_sec": True,
+    "chat.ttft_p50_ms": False,
+    "chat.ttft_p99_ms": False,
+    "chat.latency_p50_ms": False,
+    "chat.latency_p99_ms": False,
+    "server.peak_rss_mb": False,
+}
+
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(samples: list[float], q: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1)
+
+
+def _peak_rss_mb(pid: int) -> float | None:
+    # VmHWM is the kernel's resident-set high-water mark for the process (Linux only).
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _write_csv(path: str, rows: int, seed: int):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = None
+        for row in iterSyntheticRows(rows, seed):
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def startApp(tmp: str, port: int, fake_port: int, env: dict | None = None) -> tuple[subprocess.Popen, str]:
+    """
+    Runs the app under uvicorn against the fake OpenAI server, the local vector store
+    and a SQLite database, all under `tmp`; returns once /health answers.
+    """
+    db_url = f"sqlite://{os.path.join(tmp, 'app.sqlite3')}"
+    asyncio.run(_create_schema(db_url))
+    env = {
+        **os.environ,
+        "DATABASE_URL": db_url,
+        "JWT_SECRET": "load-test-secret-of-at-least-32-bytes",
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "EMBEDDING_PROVIDER": "openai",
+        "VECTOR_STORE": "local",
+        "LOCAL_INDEX_DIR": os.path.join(tmp, "vectors"),
+        "COLUMNAR_DIR": os.path.join(tmp, "columnar"),
+        "LEXICAL_INDEX_DIR": os.path.join(tmp, "lexical"),
+        "INGEST_UPLOAD_DIR": os.path.join(tmp, "uploads"),
+        "EMBED_CACHE_DB": os.path.join(tmp, "embeddings.sqlite"),
+        **(env or {}),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+        + ["--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            if httpx.get(f"{base_url}/health").status_code == 200:
+                return server, base_url
+        except httpx.HTTPError:
+            pass
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            raise RuntimeError("The app did not start; see its output above")
+        time.sleep(0.2)
+
+
+def _questions(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    types = ["flats", "detached houses", "bungalows", "terraced houses"]
+    templates = [
+        lambda: f"{rng.randint(1, 5)} bedroom {rng.choice(types)} under {rng.randint(2, 12) * 50}k",
+        lambda: f"{rng.choice(types)} with low flood risk and at least {rng.randint(1, 3)} bathrooms",
+        lambda: f"what is the average price of {rng.choice(types)} in E0{6000001 + rng.randrange(350)}",
+        lambda: f"tell me about {rng.randint(1, 250)} {rng.choice(['High', 'Mill', 'Station'])} Road",
+    ]
+    return [rng.choice(templates)() for _ in range(count)]
+
+
+async def _create_schema(db_url: str):
+    await Tortoise.init(db_url=db_url, modules={"models": ["db.models", "aerich.models"]})
+    await Tortoise.generate_schemas(safe=True)
+    await Tortoise.close_connections()
+
+
+async def _ingest(client: httpx.AsyncClient, paths: list[str], rows: int) -> tuple[dict, list[str]]:
+    started = time.perf_counter()
+
+    async def upload(path: str) -> dict:
+        with open(path, "rb") as f:
+            response = await client.post(
+                "/app/newChat", data={"title": "load test"}, files={"file": (os.path.basename(path), f, "text/csv")}
+            )
+        response.raise_for_status()
+        created = response.json()
+        while True:
+            job = (await client.get(f"/app/jobs/{created['jobId']}")).json()
+            if job["status"] in ("COMPLETED", "FAILED"):
+                return {"chat_id": created["chat"]["id"], **job}
+            await asyncio.sleep(0.2)
+
+    jobs = await asyncio.gather(*(upload(path) for path in paths))
+    elapsed = time.perf_counter() - started
+    completed = [job for job in jobs if job["status"] == "COMPLETED"]
+    report = {
+        "files": len(paths),
+        "rows": rows * len(paths),
+        "failed_jobs": len(jobs) - len(completed),
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(sum(job["rows_upserted"] for job in completed) / elapsed, 1),
+        "job_rows_per_sec": [job["rows_per_sec"] for job in jobs],
+    }
+    return report, [job["chat_id"] for job in completed]
+
+
+async def _chat(client: httpx.AsyncClient, chat_ids: list[str], questions: list[str], concurrency: int) -> dict:
+    ttft: list[float] = []
+    latency: list[float] = []
+    errors: dict[str, int] = {}
+    cache_hits = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def ask(i: int, question: str):
+        nonlocal cache_hits
+        async with sem:
+            started = time.perf_counter()
+            first = None
+            try:
+                async with client.stream(
+                    "POST",
+                    f"/app/chats/{chat_ids[i % len(chat_ids)]}/messages/stream",
+                    json={"role": "USER", "content": question},
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                        return
+                    cache_hits += response.headers.get("X-Response-Cache") == "hit"
+                    async for chunk in response.aiter_bytes():
+                        if chunk and first is None:
+                            first = time.perf_counter()
+            except httpx.HTTPError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                return
+            ended = time.perf_counter()
+            if first is not None:
+                ttft.append((first - started) * 1000)
+            latency.append((ended - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(ask(i, question) for i, question in enumerate(questions)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(questions),
+        "completed": len(latency),
+        "errors": errors,
+        "response_cache_hits": cache_hits,
+        "requests_per_sec": round(len(latency) / elapsed, 2),
+        "ttft_p50_ms": _percentile(ttft, 0.5),
+        "ttft_p99_ms": _percentile(ttft, 0.99),
+        "latency_p50_ms": _percentile(latency, 0.5),
+        "latency_p99_ms": _percentile(latency, 0.99),
+    }
+
+
+async def _drive(base_url: str, paths: list[str], args) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=httpx.Timeout(600.0)) as client:
+        credentials = {"email": "load@example.com", "password": "load-test-password"}
+        (await client.post("/auth/signup", json=credentials)).raise_for_status()
+        (await client.post("/auth/login", json=credentials)).raise_for_status()
+        ingest, chat_ids = await _ingest(client, paths, args.rows)
+        chat = {"requests": 0}
+        if chat_ids and args.messages:
+            chat = await _chat(client, chat_ids, _questions(args.messages, args.seed), args.concurrency)
+        return {"ingest": ingest, "chat": chat}
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _compare(report: dict, baseline: dict) -> dict:
+    changes = {}
+    for path, higher_is_better in COMPARED.items():
+        section, key = path.split(".")
+        new, old = report.get(section, {}).get(key), baseline.get(section, {}).get(key)
+        if new is None or not old:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        changes[path] = {"baseline": old, "current": new, "change_pct": round(change, 1), "better": better}
+    return {"baseline_commit": baseline.get("commit"), "changes": changes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000, help="rows per uploaded file")
+    parser.add_argument("--uploads", type=int, default=2, help="files uploaded concurrently, one chat each")
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8, help="chat requests in flight")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    parser.add_argument("--embed-tokens-per-sec", type=float, default=0.0, help="embedding budget; 0 never sends 429s")
+    parser.add_argument("--first-token-ms", type=float, default=300.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--token-interval-ms", type=float, default=10.0)
+    parser.add_argument("--chat-429-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write the report here as a baseline")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    args = parser.parse_args()
+
+    fake_port, app_port = freePort(), freePort()
+    fake = startFakeOpenAI(
+        FakeOpenAIConfig(
+            base_latency_ms=args.embed_latency_ms,
+            tokens_per_sec=args.embed_tokens_per_sec,
+            first_token_ms=args.first_token_ms,
+            completion_tokens=args.completion_tokens,
+            token_interval_ms=args.token_interval_ms,
+            chat_429_rate=args.chat_429_rate,
+        ),
+        fake_port,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.uploads):
+            paths.append(os.path.join(tmp, f"listings-{i}.csv"))
+            # Distinct seeds, so uploads are not linked to each other as duplicates.
+            _write_csv(paths[-1], args.rows, args.seed + i)
+
+        server, base_url = startApp(tmp, app_port, fake_port)
+        try:
+            results = asyncio.run(_drive(base_url, paths, args))
+            peak_rss = _peak_rss_mb(server.pid)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            fake.should_exit = True
+
+    report = {
+        "commit": _git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        **results,
+        "server": {"peak_rss_mb": peak_rss},
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = _compare(report, json.load(f))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Recall and latency of the per-chat local vector index (brute force and, when hnswlib
+is installed, HNSW) against a Chroma collection holding every chat's vectors, as the
+shared collection does in production. Ground truth is an exact numpy scan.
+
+Chroma runs in-process by default; pass --chroma-host to use a server instead.
+
+    cd backend
+    python -m benchmarks.local_index --chats 10 --rows 20000 --queries 200
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks.datasets import syntheticRows
+
+
+def _percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+    }
+
+
+def _run(name: str, query_fn, queries: np.ndarray, wheres: list, truth: list[list[str]], k: int) -> dict:
+    latencies = []
+    hits = 0
+    for query, where, expected in zip(queries, wheres, truth):
+        started = time.perf_counter()
+        ids = query_fn(query, where)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(ids) & set(expected))
+    return {"backend": name, f"recall@{k}": round(hits / max(1, sum(len(t) for t in truth)), 4), **_percentiles(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=10, help="tenants sharing the Chroma collection")
+    parser.add_argument("--rows", type=int, default=20000, help="rows per chat")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chroma-host", default=None)
+    parser.add_argument("--chroma-port", type=int, default=8000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    rows = syntheticRows(args.rows)
+    target_chat = "chat-0"
+    vectors = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["LOCAL_INDEX_DIR"] = tmp
+        import chromadb
+        from utils.localindex import LocalVectorStore
+
+        local = LocalVectorStore(tmp)
+        if args.chroma_host:
+            client = chromadb.HttpClient(host=args.chroma_host, port=args.chroma_port)
+        else:
+            client = chromadb.EphemeralClient()
+        collection = client.create_collection(f"bench-{uuid.uuid4().hex[:8]}")
+
+        started = time.perf_counter()
+        for c in range(args.chats):
+            chat_id = f"chat-{c}"
+            chat_vectors = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+            vectors[chat_id] = chat_vectors
+            for start in range(0, args.rows, 1000):
+                ids = [f"{chat_id}-{i}" for i in range(start, min(start + 1000, args.rows))]
+                metadatas = [{**rows[i], "chat_id": chat_id, "chunk_index": i} for i in range(start, start + len(ids))]
+                collection.upsert(ids=ids, embeddings=chat_vectors[start : start + len(ids)].tolist(), metadatas=metadatas)
+                local.upsert(ids, chat_vectors[start : start + len(ids)], metadatas)
+        load_seconds = round(time.perf_counter() - started, 1)
+
+        # Half the queries are plain chat-scoped searches, half also carry property filters.
+        base = {"chat_id": {"$eq": target_chat}}
+        filtered = {"$and": [base, {"bedrooms": {"$gte": 3}}, {"price": {"$lte": 600000}}]}
+        match = np.array([r["bedrooms"] >= 3 and r["price"] <= 600000 for r in rows])
+        queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+        wheres = [base if i % 2 == 0 else filtered for i in range(args.queries)]
+        truth = []
+        chat_vectors = vectors[target_chat]
+        for query, where in zip(queries, wheres):
+            dist = ((chat_vectors - query) ** 2).sum(axis=1)
+            if where is filtered:
+                dist[~match] = np.inf
+            truth.append([f"{target_chat}-{i}" for i in np.argsort(dist)[: args.k]])
+
+        def chroma_query(query, where):
+            res = collection.query(query_embeddings=[query.tolist()], n_results=args.k, where=where, include=["metadatas", "distances"])
+            return res["ids"][0]
+
+        def local_query(query, where):
+            return local.query([query], args.k, where)["ids"][0]
+
+        results = [_run("chroma", chroma_query, queries, wheres, truth, args.k)]
+        os.environ["LOCAL_INDEX_ALGORITHM"] = "brute"
+        # A resident chat has already parsed its filter columns; warm that once.
+        local_query(queries[1], filtered)
+        results.append(_run("local-brute", local_query, queries, wheres, truth, args.k))
+        try:
+            import hnswlib  # noqa: F401
+
+            os.environ["LOCAL_INDEX_ALGORITHM"] = "hnsw"
+            os.environ.setdefault("LOCAL_INDEX_BRUTE_FORCE_MAX", "0")
+            local_query(queries[0], base)  # builds the graph
+            results.append(_run("local-hnsw", local_query, queries, wheres, truth, args.k))
+        except ImportError:
+            pass
+        local.close()
+
+    print(json.dumps({"chats": args.chats, "rows_per_chat": args.rows, "load_seconds": load_seconds, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Latency of opening and paging through a long chat: the old unpaginated history load
+against the keyset pages of GET /app/chats/{id}/messages, plus OFFSET paging for
+comparison at the same depth.
+
+Runs on a throwaway SQLite file by default; pass --db-url to use Postgres (the
+schema, including the (chat_id, created_at) index, is generated in that database,
+so point it at an empty one).
+
+    cd backend
+    python -m benchmarks.message_history --messages 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from tortoise import Tortoise
+
+from db.models import Chat, Message, User
+from utils.pagination import messagePage
+from utils.serializers import serialize_message, serialize_message_values
+
+
+async def _timed(fn, repeat: int) -> dict:
+    samples = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        size = len(json.dumps(rows))
+    return {"p50_ms": round(statistics.median(samples), 2), "max_ms": round(max(samples), 2), "response_bytes": size}
+
+
+async def _seed(chat: Chat, count: int, started_at: datetime, batch: int = 5000):
+    for start in range(0, count, batch):
+        await Message.bulk_create(
+            [
+                Message(
+                    id=uuid.uuid4(),
+                    chat=chat,
+                    role="USER" if i % 2 == 0 else "ASSISTANT",
+                    content=f"Message {i}: " + "three bedroom semi-detached near the station, " * (1 + i % 8),
+                    created_at=started_at + timedelta(seconds=i),
+                )
+                for i in range(start, min(start + batch, count))
+            ]
+        )
+
+
+async def _run(args) -> dict:
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["db.models"]})
+    await Tortoise.generate_schemas(safe=True)
+    try:
+        user = await User.create(email=f"bench-{uuid.uuid4().hex[:8]}@example.com", password="x")
+        chat = await Chat.create(user=user, title="long chat")
+        began = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        started = time.perf_counter()
+        await _seed(chat, args.messages, began)
+        for _ in range(args.other_chats):
+            await _seed(await Chat.create(user=user, title="other chat"), args.messages // 5, began)
+        seed_seconds = round(time.perf_counter() - started, 1)
+
+        chat_id = str(chat.id)
+        depth = int(args.messages * 0.9)
+
+        async def full_history():
+            messages = await Message.filter(chat=chat).order_by("created_at")
+            return [serialize_message(m) for m in messages]
+
+        async def latest_page():
+            rows, _ = await messagePage(chat_id, args.page, latest=True)
+            return [serialize_message_values(r) for r in rows]
+
+        async def latest_page_projected():
+            rows, _ = await messagePage(chat_id, args.page, fields=("id", "role", "created_at"), latest=True)
+            return [serialize_message_values(r) for r in rows]
+
+        # A cursor sitting `depth` messages back from the newest one.
+        cursor = None
+        remaining = depth
+        while remaining > 0:
+            _, cursor = await messagePage(chat_id, min(remaining, 1000), fields=("id",), before=cursor, latest=True)
+            remaining -= 1000
+
+        async def keyset_deep_page():
+            rows, _ = await messagePage(chat_id, args.page, before=cursor)
+            return [serialize_message_values(r) for r in rows]
+
+        async def offset_deep_page():
+            rows = await Message.filter(chat=chat).order_by("-created_at").offset(depth).limit(args.page)
+            return [serialize_message(m) for m in rows]
+
+        results = {
+            "full_history": await _timed(full_history, args.repeat),
+            f"latest_{args.page}": await _timed(latest_page, args.repeat),
+            f"latest_{args.page}_projected": await _timed(latest_page_projected, args.repeat),
+            f"keyset_page_at_{depth}": await _timed(keyset_deep_page, args.repeat),
+            f"offset_page_at_{depth}": await _timed(offset_deep_page, args.repeat),
+        }
+        await User.filter(id=user.id).delete()
+    finally:
+        await Tortoise.close_connections()
+    return {"messages": args.messages, "other_chats": args.other_chats, "seed_seconds": seed_seconds, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--other-chats", type=int, default=4, help="chats of messages/5 each sharing the table")
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db-url", default=None)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        args.db_url = args.db_url or f"sqlite://{os.path.join(tmp, 'bench.sqlite3')}"
+        print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Metadata footprint of the compact layout (typed columns only, prompt text rendered
+at query time) versus the previous layout that also stored the row JSON as a
+`text` blob.
+
+Serialized sizes are streamed over --rows synthetic listings (1M by default) without
+holding them in memory. With --chroma-rows N, both layouts are also written to
+throwaway embedded Chroma stores and their on-disk sizes compared.
+
+    cd backend
+    python -m benchmarks.metadata_footprint --rows 1000000 --chroma-rows 50000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import uuid
+
+from benchmarks.datasets import iterSyntheticRows
+from utils.ingest import _build_metadata
+
+
+def _layouts(doc: dict, chunk_index: int) -> tuple[dict, dict]:
+    text = json.dumps(doc, sort_keys=True)
+    compact = _build_metadata(doc, text, "chat", "user", "file", chunk_index, "listings.csv")
+    legacy = {k: v for k, v in compact.items() if k != "content_hash"}
+    legacy["text"] = text[: int(os.getenv("MAX_CHUNK_TEXT_CHARS", "2000"))]
+    return legacy, compact
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def _chroma_sizes(rows: int, dim: int) -> dict:
+    import chromadb
+
+    sizes = {}
+    rng = random.Random(3)
+    for layout in ("legacy", "compact"):
+        with tempfile.TemporaryDirectory() as tmp:
+            collection = chromadb.PersistentClient(path=tmp).get_or_create_collection(f"bench-{uuid.uuid4().hex[:8]}")
+            batch_ids, batch_vecs, batch_meta = [], [], []
+            for i, doc in enumerate(iterSyntheticRows(rows)):
+                legacy, compact = _layouts(doc, i)
+                batch_ids.append(str(i))
+                batch_vecs.append([rng.random() for _ in range(dim)])
+                batch_meta.append(legacy if layout == "legacy" else compact)
+                if len(batch_ids) == 1000:
+                    collection.upsert(ids=batch_ids, embeddings=batch_vecs, metadatas=batch_meta)
+                    batch_ids, batch_vecs, batch_meta = [], [], []
+            if batch_ids:
+                collection.upsert(ids=batch_ids, embeddings=batch_vecs, metadatas=batch_meta)
+            sizes[f"{layout}_disk_bytes"] = _dir_size(tmp)
+    sizes["disk_reduction"] = round(1 - sizes["compact_disk_bytes"] / sizes["legacy_disk_bytes"], 3)
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chroma-rows", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=8, help="vector size for the Chroma run; small to isolate metadata")
+    parser.add_argument("--n-results", type=int, default=5)
+    args = parser.parse_args()
+
+    legacy_bytes = compact_bytes = 0
+    for i, doc in enumerate(iterSyntheticRows(args.rows)):
+        legacy, compact = _layouts(doc, i)
+        legacy_bytes += len(json.dumps(legacy))
+        compact_bytes += len(json.dumps(compact))
+
+    result = {
+        "rows": args.rows,
+        "legacy_metadata_bytes": legacy_bytes,
+        "compact_metadata_bytes": compact_bytes,
+        "metadata_reduction": round(1 - compact_bytes / legacy_bytes, 3),
+        "legacy_query_payload_bytes": round(legacy_bytes / args.rows * args.n_results),
+        "compact_query_payload_bytes": round(compact_bytes / args.rows * args.n_results),
+    }
+    if args.chroma_rows:
+        result.update(_chroma_sizes(args.chroma_rows, args.dim))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Per-stage cost of the instrumentation in utils/timing.py and utils/metrics.py: a
+StageTimer stage with metrics disabled, enabled, and enabled with per-request
+traces, against the plain Server-Timing timer it extends. Also times rendering
+/metrics once the histograms hold series for a dozen chat and ingestion stages.
+
+Metrics settings are read at import, so each mode runs in its own interpreter.
+
+    cd backend
+    python -m benchmarks.metrics_overhead --stages 200000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODES = {
+    "server_timing_only": {"METRICS_ENABLED": "false"},
+    "disabled": {"METRICS_ENABLED": "false"},
+    "enabled": {"METRICS_ENABLED": "true", "TRACE_REQUESTS": "false"},
+    "enabled_with_traces": {"METRICS_ENABLED": "true", "TRACE_REQUESTS": "true"},
+}
+STAGES = ("insert", "cache", "filters", "embed", "columnar", "lexical", "retrieve", "pack", "prompt", "history")
+
+
+def _measure(mode: str, stages: int) -> dict:
+    from utils.metrics import renderMetrics
+    from utils.timing import StageTimer
+
+    operation = None if mode == "server_timing_only" else "chat"
+    per_request = len(STAGES)
+    requests = max(1, stages // per_request)
+    sink = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        for _ in range(requests):
+            timer = StageTimer(operation)
+            for name in STAGES:
+                with timer.stage(name):
+                    pass
+            timer.header()
+            timer.finish(chat_id="bench", outcome="completed")
+    elapsed = time.perf_counter() - started
+    report = {"ns_per_stage": round(elapsed / (requests * per_request) * 1e9, 1)}
+    if operation:
+        started = time.perf_counter()
+        body = renderMetrics()
+        report["render_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        report["metrics_bytes"] = len(body)
+        report["trace_bytes_per_request"] = round(len(sink.getvalue()) / requests)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", type=int, default=200000)
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(_measure(args.mode, args.stages)))
+        return
+
+    report = {}
+    for mode, env in MODES.items():
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.metrics_overhead", "--stages", str(args.stages), "--mode", mode],
+            env={**os.environ, **env},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        report[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
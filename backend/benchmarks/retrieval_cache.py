@@ -0,0 +1,145 @@
+"""
+Hit rate and latency of the retrieval cache for a repeated-question workload.
+
+Questions are drawn from a Zipf-distributed pool spread over --chats chats, the way a
+few popular questions dominate real traffic. A miss assembles context the way
+stream_message does without the network hops (a search of the chat's local index
+plus row rendering); a hit returns the stored text. Every --upsert-every questions
+a row is upserted into one chat, which must invalidate that chat's entries.
+
+The in-process cache is used by default. --redis-url points at a Redis-compatible
+server; --fakeredis uses the in-memory stand-in from the fakeredis package.
+
+    cd backend
+    python -m benchmarks.retrieval_cache --questions 5000 --pool 300
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.datasets import syntheticRows
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+def _vector(text: str, dim: int) -> np.ndarray:
+    seed = int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def _make_cache(args):
+    from utils.retrievalcache import RedisRetrievalCache, RetrievalCache
+
+    if args.fakeredis:
+        import fakeredis
+
+        return RedisRetrievalCache(fakeredis.FakeAsyncRedis(), args.ttl)
+    if args.redis_url:
+        import redis.asyncio as redis
+
+        return RedisRetrievalCache(redis.from_url(args.redis_url), args.ttl)
+    return RetrievalCache(max_entries=args.size, max_bytes=64 * 1024 * 1024, ttl_seconds=args.ttl)
+
+
+async def _run(args) -> dict:
+    from utils.context import renderRowText
+    from utils.localindex import LocalVectorStore
+    from utils.retrievalcache import retrievalKey
+
+    rng = np.random.default_rng(3)
+    rows = syntheticRows(args.rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["LOCAL_INDEX_DIR"] = tmp
+        store = LocalVectorStore(tmp)
+        for c in range(args.chats):
+            chat_id = f"chat-{c}"
+            vectors = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+            ids = [f"{chat_id}-{i}" for i in range(args.rows)]
+            store.upsert(ids, vectors, [{**row, "chat_id": chat_id} for row in rows])
+
+        cache = _make_cache(args)
+        pool = [
+            f"{b} bedroom homes under {p * 25000} pounds, question {i}"
+            for i, (b, p) in enumerate(zip(rng.integers(1, 6, args.pool), rng.integers(8, 40, args.pool)))
+        ]
+        ranks = np.minimum(rng.zipf(args.zipf, args.questions), args.pool) - 1
+        chats = rng.integers(0, args.chats, args.questions)
+
+        async def assemble(chat_id: str, question: str) -> str:
+            res = store.query([_vector(question, args.dim)], 5, {"chat_id": {"$eq": chat_id}})
+            return "\n\n".join(renderRowText(meta) for meta in res["metadatas"][0] if meta)
+
+        hit_ms, miss_ms, uncached_ms = [], [], []
+        stale_reads = 0
+        for n, (rank, c) in enumerate(zip(ranks, chats)):
+            chat_id, question = f"chat-{c}", pool[rank]
+            key = retrievalKey(question, {}, 5)
+            started = time.perf_counter()
+            context, entry = await cache.get(chat_id, key)
+            if context is None:
+                context = await assemble(chat_id, question)
+                await cache.set(entry, context)
+                miss_ms.append((time.perf_counter() - started) * 1000)
+            else:
+                hit_ms.append((time.perf_counter() - started) * 1000)
+            if n < 200:
+                started = time.perf_counter()
+                await assemble(chat_id, question)
+                uncached_ms.append((time.perf_counter() - started) * 1000)
+
+            if args.upsert_every and (n + 1) % args.upsert_every == 0:
+                # A new row lands in the chat; its next lookup of this question must miss.
+                store.upsert([f"{chat_id}-new-{n}"], _vector(question, args.dim)[None, :], [{**rows[0], "chat_id": chat_id}])
+                await cache.invalidate(chat_id)
+                fresh, _ = await cache.get(chat_id, key)
+                stale_reads += fresh is not None
+        store.close()
+
+    return {
+        "backend": cache.backend,
+        "questions": args.questions,
+        "pool": args.pool,
+        "chats": args.chats,
+        "stats": cache.stats(),
+        "stale_reads_after_upsert": stale_reads,
+        "uncached": _percentiles(uncached_ms),
+        "hit": _percentiles(hit_ms),
+        "miss": _percentiles(miss_ms),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=5000)
+    parser.add_argument("--pool", type=int, default=300, help="distinct questions")
+    parser.add_argument("--zipf", type=float, default=1.2, help="Zipf exponent of question popularity")
+    parser.add_argument("--chats", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=20000, help="rows per chat")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--size", type=int, default=2000, help="in-process cache entries")
+    parser.add_argument("--ttl", type=float, default=600)
+    parser.add_argument("--upsert-every", type=int, default=500, help="0 disables upserts")
+    parser.add_argument("--redis-url", default=None)
+    parser.add_argument("--fakeredis", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Chat-scoped query latency as total stored data grows, for one shared collection
+(CHROMA_SHARDING=none) versus one collection per chat (CHROMA_SHARDING=chat).
+
+Chats of --rows vectors are added one at a time; after each step the first chat is
+queried with the chat_id filter in both layouts. Chroma runs in-process by default;
+pass --chroma-host to use a server instead.
+
+    cd backend
+    python -m benchmarks.shard_latency --chats 20 --rows 5000 --queries 50
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+
+import numpy as np
+
+from benchmarks.datasets import syntheticRows
+
+
+def _median_ms(collection, queries: np.ndarray, where: dict) -> float:
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        collection.query(query_embeddings=[query.tolist()], n_results=5, where=where, include=["metadatas", "distances"])
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=5000, help="vectors per chat")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--every", type=int, default=5, help="measure after every N chats")
+    parser.add_argument("--chroma-host", default=None)
+    parser.add_argument("--chroma-port", type=int, default=8000)
+    args = parser.parse_args()
+
+    import chromadb
+
+    client = (
+        chromadb.HttpClient(host=args.chroma_host, port=args.chroma_port)
+        if args.chroma_host
+        else chromadb.EphemeralClient()
+    )
+    prefix = f"bench-{uuid.uuid4().hex[:8]}"
+    shared = client.create_collection(f"{prefix}-shared")
+    per_chat = {}
+    rng = np.random.default_rng(5)
+    rows = syntheticRows(args.rows)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    where = {"chat_id": {"$eq": "chat-0"}}
+    report = []
+
+    for c in range(args.chats):
+        chat_id = f"chat-{c}"
+        per_chat[chat_id] = client.create_collection(f"{prefix}-chat-{c}")
+        vectors = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+        for start in range(0, args.rows, 1000):
+            ids = [f"{chat_id}-{i}" for i in range(start, min(start + 1000, args.rows))]
+            batch = dict(
+                ids=ids,
+                embeddings=vectors[start : start + len(ids)].tolist(),
+                metadatas=[{**rows[i], "chat_id": chat_id} for i in range(start, start + len(ids))],
+            )
+            shared.upsert(**batch)
+            per_chat[chat_id].upsert(**batch)
+        if (c + 1) % args.every == 0 or c + 1 == args.chats:
+            report.append(
+                {
+                    "total_vectors": (c + 1) * args.rows,
+                    "shared_p50_ms": _median_ms(shared, queries, where),
+                    "per_chat_p50_ms": _median_ms(per_chat["chat-0"], queries, where),
+                }
+            )
+            print(json.dumps(report[-1]))
+
+    for name in [f"{prefix}-shared"] + [f"{prefix}-chat-{c}" for c in range(args.chats)]:
+        client.delete_collection(name)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
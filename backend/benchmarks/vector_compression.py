@@ -0,0 +1,143 @@
+"""
+Memory, storage and recall of the vector-compression settings on synthetic property
+listings: EMBED_DIMENSIONS (shortened vectors) crossed with LOCAL_INDEX_QUANTIZATION
+float32 / int8 and int8 with LOCAL_INDEX_RESCORE. Recall@k is measured against exact
+search over the full-length float32 vectors.
+
+There is no network here, so rows are embedded with a hashed bag of words projected
+into a dense space whose leading dimensions carry the most signal, the property
+text-embedding-3 is trained for; shortened vectors are its leading dimensions,
+renormalised, which is what the API returns for `dimensions`. Also reports what one
+ingest window of vectors costs as Python float lists against a float32 array.
+
+    cd backend
+    python -m benchmarks.vector_compression --rows 50000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.datasets import bagOfWordsVector, syntheticRows
+
+STORAGE = {
+    "float32": {"LOCAL_INDEX_QUANTIZATION": "none", "LOCAL_INDEX_RESCORE": "0"},
+    "int8": {"LOCAL_INDEX_QUANTIZATION": "int8", "LOCAL_INDEX_RESCORE": "0"},
+    "int8_rescore": {"LOCAL_INDEX_QUANTIZATION": "int8", "LOCAL_INDEX_RESCORE": "4"},
+}
+VECTOR_FILES = ("vectors.f32", "vectors.i8", "scales.f32")
+
+
+def _embed(texts: list[str], projection: np.ndarray) -> np.ndarray:
+    sparse = np.stack([bagOfWordsVector(text, projection.shape[0]) for text in texts])
+    dense = sparse @ projection
+    return dense / np.linalg.norm(dense, axis=1, keepdims=True)
+
+
+def _shorten(vectors: np.ndarray, dim: int) -> np.ndarray:
+    head = np.ascontiguousarray(vectors[:, :dim])
+    return head / np.linalg.norm(head, axis=1, keepdims=True)
+
+
+def _exact_top(vectors: np.ndarray, query: np.ndarray, k: int) -> set[int]:
+    dist = ((vectors - query) ** 2).sum(axis=1)
+    return set(np.argpartition(dist, k)[:k].tolist())
+
+
+def _files_bytes(directory: str, names: tuple[str, ...]) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in names if os.path.exists(os.path.join(directory, name)))
+
+
+def _window_memory(window: np.ndarray) -> dict:
+    tracemalloc.start()
+    as_lists = window.tolist()
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del as_lists
+    return {"python_lists_mb": round(list_bytes / 2**20, 2), "float32_array_mb": round(window.nbytes / 2**20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--full-dim", type=int, default=1536)
+    parser.add_argument("--dims", default="1536,512,256")
+    parser.add_argument("--window", type=int, default=2000, help="rows per ingest window")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    projection = (rng.standard_normal((4096, args.full_dim)) / np.sqrt(np.arange(1, args.full_dim + 1))).astype(np.float32)
+    rows = syntheticRows(args.rows)
+    full = np.concatenate(
+        [
+            _embed([" ".join(map(str, row.values())) for row in rows[i : i + args.window]], projection)
+            for i in range(0, len(rows), args.window)
+        ]
+    ).astype(np.float32)
+
+    picker = random.Random(3)
+    targets = picker.sample(range(len(rows)), args.queries)
+    queries = _embed(
+        [
+            f"{rows[t]['bedrooms']} bedroom {rows[t]['property_type_full_description']} on {rows[t]['address']}"
+            for t in targets
+        ],
+        projection,
+    ).astype(np.float32)
+    truth = [_exact_top(full, query, args.k) for query in queries]
+
+    report = {"rows": args.rows, "window": _window_memory(full[: args.window]), "configs": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        from utils.localindex import LocalVectorStore
+
+        for dim in (int(d) for d in args.dims.split(",")):
+            vectors, probes = _shorten(full, dim), _shorten(queries, dim)
+            for storage, env in STORAGE.items():
+                os.environ.update(env)
+                root = os.path.join(tmp, f"{dim}-{storage}")
+                store = LocalVectorStore(root)
+                chat_id = "chat-0"
+                started = time.perf_counter()
+                for start in range(0, len(rows), args.window):
+                    stop = min(start + args.window, len(rows))
+                    store.upsert(
+                        [f"row-{i}" for i in range(start, stop)],
+                        vectors[start:stop],
+                        [{"chat_id": chat_id, "chunk_index": i} for i in range(start, stop)],
+                    )
+                ingest_seconds = time.perf_counter() - started
+                where = {"chat_id": {"$eq": chat_id}}
+                store.query([probes[0]], args.k, where)
+
+                hits, latency = 0, []
+                for probe, expected in zip(probes, truth):
+                    started = time.perf_counter()
+                    found = store.query([probe], args.k, where, include=["metadatas"])["metadatas"][0]
+                    latency.append((time.perf_counter() - started) * 1000)
+                    hits += len(expected & {meta["chunk_index"] for meta in found})
+                store.close()
+
+                index_dir = os.path.join(root, chat_id)
+                # What a query scans: the int8 codes plus scales, or the float32 matrix.
+                scanned = ("vectors.i8", "scales.f32") if env["LOCAL_INDEX_QUANTIZATION"] == "int8" else ("vectors.f32",)
+                report["configs"][f"{dim}/{storage}"] = {
+                    f"recall@{args.k}": round(hits / (args.k * len(probes)), 4),
+                    "query_p50_ms": round(statistics.median(latency), 3),
+                    "scanned_bytes_per_vector": round(_files_bytes(index_dir, scanned) / args.rows, 1),
+                    "stored_bytes_per_vector": round(_files_bytes(index_dir, VECTOR_FILES) / args.rows, 1),
+                    "ingest_seconds": round(ingest_seconds, 2),
+                }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,20 @@ class Chat(models.Model):
     id = fields.UUIDField(pk=True)
     user = fields.ForeignKeyField("models.User", related_name="chats", on_delete=fields.CASCADE)
     title = fields.CharField(max_length=255)
+    # Always call the model, e.g. for chats where a repeated question should get a fresh answer.
+    bypass_response_cache = fields.BooleanField(default=False)
+    # Running summary of the turns older than the prompt's history window, and the
+    # keyset cursor of the last message folded into it (see utils/memory.py).
+    summary = fields.TextField(null=True)
+    summary_cursor = fields.CharField(max_length=128, null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
     messages: fields.ReverseRelation["Message"]
     files: fields.ReverseRelation["ChatFile"]
+    jobs: fields.ReverseRelation["IngestionJob"]
+
+    class Meta:
+        # Serves keyset pagination of a user's chats, newest first (see utils/pagination.py).
+        indexes = (("user_id", "created_at"),)
 
 class Message(models.Model):
     id = fields.UUIDField(pk=True)
@@ -21,3 +33,50 @@ class Message(models.Model):
     role = fields.CharField(max_length=50, choices=ROLE_CHOICES)
     content = fields.TextField()
     created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        # Serves keyset pagination of a chat's history (see utils/pagination.py).
+        indexes = (("chat_id", "created_at"),)
+
+class ChatFile(models.Model):
+    id = fields.UUIDField(pk=True)
+    chat = fields.ForeignKeyField("models.Chat", related_name="files", on_delete=fields.CASCADE)
+    file_id = fields.CharField(max_length=64, index=True)
+    filename = fields.CharField(max_length=255, null=True)
+    content_hash = fields.CharField(max_length=64, index=True)
+    embedding_model = fields.CharField(max_length=255)
+    rows = fields.IntField(default=0)
+    # Column whose value identifies a row across refreshes of the file (see utils/ingest.py).
+    key_column = fields.CharField(max_length=255, null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+JOB_STATUS_CHOICES = ["PENDING", "RUNNING", "COMPLETED", "FAILED"]
+
+class IngestionJob(models.Model):
+    id = fields.UUIDField(pk=True)
+    chat = fields.ForeignKeyField("models.Chat", related_name="jobs", on_delete=fields.CASCADE)
+    file_id = fields.CharField(max_length=64)
+    filename = fields.CharField(max_length=255)
+    content_type = fields.CharField(max_length=255, null=True)
+    upload_path = fields.CharField(max_length=1024)
+    content_hash = fields.CharField(max_length=64, null=True)
+    # A refresh diffs the upload against the chat's existing file_id instead of adding a file.
+    refresh = fields.BooleanField(default=False)
+    key_column = fields.CharField(max_length=255, null=True)
+    status = fields.CharField(max_length=20, choices=JOB_STATUS_CHOICES, default="PENDING")
+    error = fields.TextField(null=True)
+    rows_parsed = fields.IntField(default=0)
+    rows_embedded = fields.IntField(default=0)
+    rows_upserted = fields.IntField(default=0)
+    rows_unchanged = fields.IntField(default=0)
+    rows_deleted = fields.IntField(default=0)
+    resumed_from = fields.IntField(default=0)
+    bytes_read = fields.BigIntField(default=0)
+    bytes_total = fields.BigIntField(default=0)
+    # bytes_read when the current run started, so rates and the ETA only count this run's progress.
+    resumed_from_bytes = fields.BigIntField(default=0)
+    # Column name -> type settled by CSV schema inference (see utils/extract.py); null for JSON.
+    inferred_schema = fields.JSONField(null=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    started_at = fields.DatetimeField(null=True)
+    finished_at = fields.DatetimeField(null=True)
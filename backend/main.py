@@ -1,10 +1,19 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from tortoise.contrib.fastapi import register_tortoise
 from config import TORTOISE_ORM
+from middleware.authMiddleware import authTokenCacheStats
 from routes.app import router as app_router
 from routes.auth import router as auth_router
+from utils.embeddings import getEmbeddingCache
+from utils.jobs import startIngestionWorkers, stopIngestionWorkers
+from utils.metrics import metricsEnabled, renderMetrics
+from utils.passwords import passwordHashStats, shutdownPasswordHashing
+from utils.responsecache import getResponseCache
+from utils.retrievalcache import getRetrievalCache
+from utils.scheduler import getEmbeddingScheduler
+from utils.vectorstore import shutdownVectorStore
 
 app = FastAPI()
 app.add_middleware(
@@ -13,18 +22,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Next-Cursor", "X-Response-Cache"],
 )
 app.include_router(auth_router)
 app.include_router(app_router)
+
+
+# Registered before Tortoise so workers stop before its connections are closed.
+@app.on_event("shutdown")
+async def stop_workers():
+    await stopIngestionWorkers()
+    shutdownVectorStore()
+    shutdownPasswordHashing()
+
+
 register_tortoise(
     app,
     config=TORTOISE_ORM,
     generate_schemas=False,
     add_exception_handlers=True,
 )
+
+
+@app.on_event("startup")
+async def start_workers():
+    await startIngestionWorkers()
+
+
 @app.get("/health")
 def health():
     return {"message": "Health OK"}
 
+
+@app.get("/metrics")
+def metrics():
+    # Prometheus text exposition; empty while METRICS_ENABLED=false.
+    body = renderMetrics() if metricsEnabled() else ""
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "embeddingCache": getEmbeddingCache().stats(),
+        "embeddingScheduler": getEmbeddingScheduler().stats(),
+        "retrievalCache": getRetrievalCache().stats(),
+        "responseCache": getResponseCache().stats(),
+        "passwordHashing": passwordHashStats(),
+        "authTokenCache": authTokenCacheStats(),
+    }
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=3001, reload=True)
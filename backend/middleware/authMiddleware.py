@@ -1,4 +1,7 @@
 import os
+import time
+from collections import OrderedDict
+
 import jwt
 from fastapi import HTTPException
 from fastapi import Request
@@ -9,13 +12,57 @@ load_dotenv()
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
 
-def authMiddleware(request: Request) -> dict:
-    token = request.cookies.get("access_token")
+# Verified tokens are remembered for AUTH_TOKEN_CACHE_TTL_SECONDS (never past their
+# own `exp`), so the requests of a chat session skip re-decoding the same cookie.
+# Only successfully verified tokens are cached; a token is its own key because the
+# signature already binds it to the payload.
+_verified: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+_hits = 0
+_misses = 0
+
+
+def _decode(token: str) -> dict:
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    return payload
\ No newline at end of file
+
+async def authMiddleware(request: Request) -> dict:
+    global _hits, _misses
+    token = request.cookies.get("access_token")
+    now = time.time()
+    entry = _verified.get(token) if token else None
+    if entry is not None and now < entry[0]:
+        _verified.move_to_end(token)
+        _hits += 1
+        return entry[1]
+    _misses += 1
+    payload = _decode(token)
+
+    max_entries = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+    if max_entries > 0:
+        expires_at = now + float(os.getenv("AUTH_TOKEN_CACHE_TTL_SECONDS", "300"))
+        if isinstance(payload.get("exp"), (int, float)):
+            expires_at = min(expires_at, payload["exp"])
+        _verified[token] = (expires_at, payload)
+        _verified.move_to_end(token)
+        while len(_verified) > max_entries:
+            _verified.popitem(last=False)
+    return payload
+
+
+def forgetToken(token: str) -> None:
+    _verified.pop(token, None)
+
+
+def authTokenCacheStats() -> dict:
+    total = _hits + _misses
+    return {
+        "entries": len(_verified),
+        "hits": _hits,
+        "misses": _misses,
+        "hit_rate": round(_hits / total, 4) if total else 0.0,
+    }
@@ -0,0 +1,19 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "chatfile" ADD "key_column" VARCHAR(255);
+        ALTER TABLE "ingestionjob" ADD "refresh" BOOL NOT NULL DEFAULT False;
+        ALTER TABLE "ingestionjob" ADD "key_column" VARCHAR(255);
+        ALTER TABLE "ingestionjob" ADD "rows_unchanged" INT NOT NULL DEFAULT 0;
+        ALTER TABLE "ingestionjob" ADD "rows_deleted" INT NOT NULL DEFAULT 0;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "chatfile" DROP COLUMN "key_column";
+        ALTER TABLE "ingestionjob" DROP COLUMN "refresh";
+        ALTER TABLE "ingestionjob" DROP COLUMN "key_column";
+        ALTER TABLE "ingestionjob" DROP COLUMN "rows_unchanged";
+        ALTER TABLE "ingestionjob" DROP COLUMN "rows_deleted";"""
@@ -0,0 +1,16 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "chat" ADD "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
+        UPDATE "chat" SET "created_at" = "first"."created_at"
+            FROM (SELECT "chat_id", MIN("created_at") AS "created_at" FROM "message" GROUP BY "chat_id") AS "first"
+            WHERE "first"."chat_id" = "chat"."id";
+        CREATE INDEX IF NOT EXISTS "idx_chat_user_id_3a9c51" ON "chat" ("user_id", "created_at");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_chat_user_id_3a9c51";
+        ALTER TABLE "chat" DROP COLUMN "created_at";"""
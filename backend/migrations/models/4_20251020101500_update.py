@@ -0,0 +1,29 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "ingestionjob" (
+    "id" UUID NOT NULL PRIMARY KEY,
+    "file_id" VARCHAR(64) NOT NULL,
+    "filename" VARCHAR(255) NOT NULL,
+    "content_type" VARCHAR(255),
+    "upload_path" VARCHAR(1024) NOT NULL,
+    "status" VARCHAR(20) NOT NULL DEFAULT 'PENDING',
+    "error" TEXT,
+    "rows_parsed" INT NOT NULL DEFAULT 0,
+    "rows_embedded" INT NOT NULL DEFAULT 0,
+    "rows_upserted" INT NOT NULL DEFAULT 0,
+    "resumed_from" INT NOT NULL DEFAULT 0,
+    "bytes_read" BIGINT NOT NULL DEFAULT 0,
+    "bytes_total" BIGINT NOT NULL DEFAULT 0,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "started_at" TIMESTAMPTZ,
+    "finished_at" TIMESTAMPTZ,
+    "chat_id" UUID NOT NULL REFERENCES "chat" ("id") ON DELETE CASCADE
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "ingestionjob";"""
@@ -0,0 +1,24 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "chatfile" (
+    "id" UUID NOT NULL PRIMARY KEY,
+    "file_id" VARCHAR(64) NOT NULL,
+    "filename" VARCHAR(255),
+    "content_hash" VARCHAR(64) NOT NULL,
+    "embedding_model" VARCHAR(255) NOT NULL,
+    "rows" INT NOT NULL DEFAULT 0,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "chat_id" UUID NOT NULL REFERENCES "chat" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_chatfile_file_id_2fbf09" ON "chatfile" ("file_id");
+CREATE INDEX IF NOT EXISTS "idx_chatfile_content_3c8f1a" ON "chatfile" ("content_hash");
+        ALTER TABLE "ingestionjob" ADD "content_hash" VARCHAR(64);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "ingestionjob" DROP COLUMN "content_hash";
+        DROP TABLE IF EXISTS "chatfile";"""
@@ -0,0 +1,13 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "chat" ADD "summary" TEXT;
+        ALTER TABLE "chat" ADD "summary_cursor" VARCHAR(128);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "chat" DROP COLUMN "summary";
+        ALTER TABLE "chat" DROP COLUMN "summary_cursor";"""
@@ -1,52 +1,83 @@
 from fastapi import APIRouter
 import asyncio
 import os
-import random
-import hashlib
+import time
 from middleware.authMiddleware import authMiddleware
-from db.models import Chat, Message
-from utils.serializers import serialize_chat, serialize_message
-from fastapi import HTTPException, Depends, UploadFile, File, Form, BackgroundTasks
+from db.models import Chat, ChatFile, IngestionJob, Message
+from utils.serializers import serialize_chat, serialize_job, serialize_message_values
+from fastapi import HTTPException, Depends, UploadFile, File, Form, BackgroundTasks, Query, Response
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import uuid
 import json
-from utils.extract import extractDataFromFile, getStructuredVectorQuery, generateSemanticQuery
+import numpy as np
+from utils.extract import getStructuredVectorQuery
+from utils.columnar import planAnalyticalQuery, renderAnalyticalContext, runAnalyticalQuery
+from utils.context import packContext
+from utils.embeddings import embedTexts
+from utils.filters import filtersFromArgs, parsePropertyFilters
+from utils.jobs import createIngestionJob
+from utils.lexicalindex import fuseCandidates, isExactLookup, lexicalCandidates
+from utils.memory import foldHistory, loadConversation
+from utils.metrics import increment, metricsEnabled
+from utils.pagination import chatPage, messagePage, pageLimit, parseMessageFields
+from utils.responsecache import getResponseCache, replayChunks, responseKey
+from utils.retrievalcache import getRetrievalCache, retrievalKey
+from utils.scheduler import estimateTokens
+from utils.timing import StageTimer
+from utils.vectorstore import embeddingModelFor, queryVectors
 from utils.clients import (
-    getOpenai,
     getAsyncOpenai,
-    getChromaCollection,
-    getEmbeddingModelName,
     getChatModelName,
 )
-from openai import RateLimitError, APIError, APIConnectionError
 router = APIRouter(prefix="/app", tags=["app"])
 
 
-class CreateChatPayload(BaseModel):
+class UpdateChatPayload(BaseModel):
     title: str | None = None
+    bypass_response_cache: bool | None = None
 
 
 class CreateMessagePayload(BaseModel):
     role: str
     content: str
-    history: list[dict] | None = None
-
-
- 
 
 
 @router.get("/chats")
-async def list_chats(user: dict = Depends(authMiddleware)):
-    userId = user["id"]
-    chats = await Chat.filter(user_id=userId)
+async def list_chats(
+    response: Response,
+    limit: int | None = Query(None, ge=1),
+    after: str | None = None,
+    user: dict = Depends(authMiddleware),
+):
+    # Newest first, keyset on (created_at, id); the next page's cursor is returned in X-Next-Cursor.
+    try:
+        chats, next_cursor = await chatPage(user["id"], pageLimit(limit, "CHATS_PAGE_SIZE", 200), after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return [serialize_chat(c) for c in chats]
 
 
+@router.patch("/chats/{chat_id}")
+async def update_chat(chat_id: str, payload: UpdateChatPayload, user: dict = Depends(authMiddleware)):
+    chat = await Chat.get_or_none(id=chat_id, user_id=user["id"])
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    if payload.title is not None:
+        chat.title = payload.title.strip()[:255] or chat.title
+    if payload.bypass_response_cache is not None:
+        chat.bypass_response_cache = payload.bypass_response_cache
+    await chat.save()
+    return serialize_chat(chat)
+
+
 @router.post("/newChat")
 async def newChat(
     title: str | None = Form(None),
     file: UploadFile = File(...),
+    key_column: str | None = Form(None),
     user: dict = Depends(authMiddleware),
 ):
     userId = user["id"]
@@ -54,96 +85,105 @@ async def newChat(
     filename = file.filename or "uploaded"
     if not (filename.lower().endswith(".csv") or filename.lower().endswith(".json")):
         raise HTTPException(status_code=400, detail="Only .csv or .json files are allowed")
-    raw = await file.read()
-    file_id = uuid.uuid4()
-    try:
-        documents: list[dict] = extractDataFromFile(filename, file.content_type or "", raw)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    vectors = []
-    if documents:
-        asynClient = getAsyncOpenai()
-        embedding_model = getEmbeddingModelName()
-        texts_to_embed = [json.dumps(doc, sort_keys=True) for doc in documents]
-
-        batch_size = int(os.getenv("EMBED_BATCH_SIZE", "100"))
-        batches: list[tuple[int, list[str], list[dict]]] = []
-        for i in range(0, len(documents), batch_size):
-            text_chunk = texts_to_embed[i : i + batch_size]
-            doc_chunk = documents[i : i + batch_size]
-            batches.append((i, text_chunk, doc_chunk))
-
-        concurrency = int(os.getenv("EMBED_CONCURRENCY", "3"))
-        sem = asyncio.Semaphore(max(1, concurrency))
-
-        async def embed_batch(start_index: int, chunk: list[str], doc_chunk: list[dict]):
-            async with sem:
-                max_retries = int(os.getenv("EMBED_RETRIES", "6"))
-                base_delay_ms = int(os.getenv("EMBED_RETRY_BASE_MS", "500"))
-                for attempt in range(max_retries):
-                    try:
-                        resp = await asynClient.embeddings.create(model=embedding_model, input=chunk)
-                        vecs = []
-                        for j, item in enumerate(resp.data):
-                            text_val = chunk[j]
-                            original_doc = doc_chunk[j]
-                            metadata = {
-                                "chat_id": str(chat.id),
-                                "user_id": str(userId),
-                                "file_id": str(file_id),
-                                "chunk_index": start_index + j,
-                                "source": filename,
-                            }
-                            for key, value in original_doc.items():
-                                metadata[key] = value
-
-                            max_text_chars = int(os.getenv("MAX_CHUNK_TEXT_CHARS", "2000"))
-                            if isinstance(text_val, str) and len(text_val) > max_text_chars:
-                                text_val = text_val[:max_text_chars]
-
-                            metadata["text"] = text_val
-                            vecs.append(
-                                (
-                                    f"{chat.id}:{file_id}:{start_index + j}",
-                                    item.embedding,
-                                    metadata,
-                                )
-                            )
-                        return vecs
-                    except (RateLimitError, APIError, APIConnectionError) as e:
-                        if attempt == max_retries - 1:
-                            raise
-                        delay_ms = (2 ** attempt) * base_delay_ms + random.randint(0, 250)
-                        await asyncio.sleep(delay_ms / 1000)
-
-        results = await asyncio.gather(*(embed_batch(start, text_chunk, doc_chunk) for start, text_chunk, doc_chunk in batches))
-        vectors = [v for group in results if group for v in group]
-
-        if vectors:
-            collection = getChromaCollection()
-            ids = [hashlib.sha256(v[0].encode()).hexdigest() for v in vectors]
-            embeddings = [v[1] for v in vectors]
-            metadatas = [v[2] for v in vectors]
-            
-            upsert_batch = int(os.getenv("CHROMA_UPSERT_BATCH", "100"))
-            for i in range(0, len(vectors), upsert_batch):
-                collection.upsert(
-                    ids=ids[i : i + upsert_batch],
-                    embeddings=embeddings[i : i + upsert_batch],
-                    metadatas=metadatas[i : i + upsert_batch],
-                )
-                print(f"Upserted {len(ids[i:i + upsert_batch])} vectors to Chroma")
+    # Parsing, embedding and upserting are timed by the ingestion job itself.
+    timings = StageTimer("upload")
+    with timings.stage("spool"):
+        job = await createIngestionJob(chat, file, filename, key_column=key_column or os.getenv("INGEST_KEY_COLUMN") or None)
+    timings.finish(chat_id=str(chat.id), job_id=str(job.id))
 
-    return {"chat": serialize_chat(chat), "fileId": str(file_id), "upserted": len(vectors) if vectors else 0}
+    return {"chat": serialize_chat(chat), "fileId": job.file_id, "jobId": str(job.id), "status": job.status}
+
+
+@router.post("/chats/{chat_id}/files")
+async def upload_chat_file(
+    chat_id: str,
+    file: UploadFile = File(...),
+    file_id: str | None = Form(None),
+    key_column: str | None = Form(None),
+    user: dict = Depends(authMiddleware),
+):
+    """
+    Adds a file to an existing chat, or with `file_id` uploads a new version of one of
+    its files. A new version is diffed row by row: rows are matched on `key_column`
+    (default: the column the file was keyed by before, then INGEST_KEY_COLUMN, else
+    the whole row), only new or changed rows are embedded, and rows missing from the
+    upload are deleted.
+    """
+    chat = await Chat.get_or_none(id=chat_id, user_id=user["id"])
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    filename = file.filename or "uploaded"
+    if not (filename.lower().endswith(".csv") or filename.lower().endswith(".json")):
+        raise HTTPException(status_code=400, detail="Only .csv or .json files are allowed")
+    if file_id is not None:
+        chat_file = await ChatFile.get_or_none(chat=chat, file_id=file_id)
+        if not chat_file:
+            raise HTTPException(status_code=404, detail="File not found")
+        if await IngestionJob.filter(chat=chat, file_id=file_id, status__in=["PENDING", "RUNNING"]).exists():
+            raise HTTPException(status_code=409, detail="File is still being ingested")
+        key_column = key_column or chat_file.key_column
+    key_column = key_column or os.getenv("INGEST_KEY_COLUMN") or None
+    timings = StageTimer("upload")
+    with timings.stage("spool"):
+        job = await createIngestionJob(chat, file, filename, file_id=file_id, key_column=key_column)
+    timings.finish(chat_id=str(chat.id), job_id=str(job.id))
+
+    return {"fileId": job.file_id, "jobId": str(job.id), "status": job.status, "refresh": job.refresh}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user: dict = Depends(authMiddleware)):
+    job = await IngestionJob.get_or_none(id=job_id, chat__user_id=user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
+
+
+@router.get("/chats/{chat_id}/jobs")
+async def list_jobs(chat_id: str, user: dict = Depends(authMiddleware)):
+    chat = await Chat.get_or_none(id=chat_id, user_id=user["id"])
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    jobs = await IngestionJob.filter(chat=chat).order_by("created_at")
+    return [serialize_job(j) for j in jobs]
 
 
 @router.get("/chats/{chat_id}/messages")
-async def list_messages(chat_id: str, user: dict = Depends(authMiddleware)):
+async def list_messages(
+    chat_id: str,
+    response: Response,
+    limit: int | None = Query(None, ge=1),
+    before: str | None = None,
+    after: str | None = None,
+    latest: bool = False,
+    fields: str | None = None,
+    user: dict = Depends(authMiddleware),
+):
+    """
+    Messages in chronological order, one page at a time. With `latest` or `before`
+    the page ends at the newest (or the cursor's) message and X-Next-Cursor is the
+    `before` of the previous page; otherwise pages run forwards from the first
+    message (or `after`). `fields` projects a comma-separated subset of columns.
+    """
     chat = await Chat.get_or_none(id=chat_id, user_id=user["id"])
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
-    messages = await Message.filter(chat=chat).order_by("created_at")
-    return [serialize_message(m) for m in messages]
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both")
+    try:
+        rows, next_cursor = await messagePage(
+            str(chat.id),
+            pageLimit(limit, "MESSAGES_PAGE_SIZE", 100),
+            fields=parseMessageFields(fields),
+            before=before,
+            after=after,
+            latest=latest,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [serialize_message_values(row) for row in rows]
 
 @router.post("/chats/{chat_id}/messages/stream")
 async def stream_message(
@@ -158,35 +198,113 @@ async def stream_message(
 
     if payload.role != "USER":
         raise HTTPException(status_code=400, detail="Only USER role allowed for streaming")
-    user_msg = await Message.create(chat=chat, role="USER", content=payload.content)
+    timings = StageTimer("chat")
+    with timings.stage("insert"):
+        user_msg = await Message.create(chat=chat, role="USER", content=payload.content)
 
     asynClient = getAsyncOpenai()
-    collection = getChromaCollection()
-
 
-    filters = await getStructuredVectorQuery(payload.content)
-    filters =[]
-    
-    embedding_model = getEmbeddingModelName()
-    emb_resp = await asynClient.embeddings.create(model=embedding_model, input=[payload.content])
-    query_vec = emb_resp.data[0].embedding
+    async def extract_filters() -> list[dict]:
+        timeout = int(os.getenv("FILTER_EXTRACTION_TIMEOUT_MS", "1500")) / 1000
+        try:
+            return await asyncio.wait_for(getStructuredVectorQuery(payload.content), timeout=timeout)
+        except asyncio.TimeoutError:
+            print("Filter extraction timed out; using rule-based filters")
+            return filtersFromArgs(parsePropertyFilters(payload.content)[0])
+
+    async def embed_query() -> np.ndarray:
+        # Queries are embedded into the vector space of the collection the chat lives in.
+        model_id = await embeddingModelFor(str(chat.id), str(chat.user_id))
+        return (await embedTexts([payload.content], normalize=True, interactive=True, model_id=model_id))[0]
+
+    async def run_analytics() -> dict | None:
+        # Aggregates and rankings are computed over the chat's whole column store;
+        # five nearest neighbours cannot answer them.
+        plan = planAnalyticalQuery(payload.content)
+        if plan is None:
+            return None
+        try:
+            return await run_in_threadpool(runAnalyticalQuery, str(chat.id), plan)
+        except Exception as e:
+            print(f"Analytical query failed, answering from retrieval only: {e}")
+            return None
+
+    async def run_lexical(filters: list[dict]) -> list[dict]:
+        try:
+            return await run_in_threadpool(lexicalCandidates, str(chat.id), payload.content, candidates, filters)
+        except Exception as e:
+            print(f"Lexical search failed, answering from vector retrieval only: {e}")
+            return []
+
+    # The assembled context is cached per chat; a hit skips filter extraction,
+    # embedding and retrieval. Uploads into the chat invalidate its entries.
+    retrieval_cache = getRetrievalCache()
+    # Retrieval over-fetches; packContext re-ranks, de-duplicates and keeps what fits the budget.
+    candidates = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+    rule_args = parsePropertyFilters(payload.content)[0]
+    cache_key = retrievalKey(payload.content, rule_args, candidates)
+    with timings.stage("cache"):
+        context_text, cache_entry = await retrieval_cache.get(str(chat.id), cache_key)
+    if context_text is None:
+        res = None
+        analytics = None
+        lexical: list[dict] = []
+        # Addresses, postcodes and area codes are answered from the inverted index alone,
+        # without an embedding or filter-extraction call, when it has matching rows.
+        exact = isExactLookup(payload.content) and planAnalyticalQuery(payload.content) is None
+        if exact:
+            filters = filtersFromArgs(rule_args)
+            with timings.stage("lexical"):
+                lexical = await run_lexical(filters)
+            exact = bool(lexical)
+        if not exact:
+            with timings.stage("prepare"):
+                filters, query_vec, analytics, lexical = await asyncio.gather(
+                    timings.measure("filters", extract_filters()),
+                    timings.measure("embed", embed_query()),
+                    timings.measure("columnar", run_analytics()),
+                    timings.measure("lexical", run_lexical(filtersFromArgs(rule_args))),
+                )
 
-    base_filter = {"chat_id": {"$eq": str(chat.id)}}
-    if filters:
-        final_filter = {"$and": [base_filter] + filters}
-    else:
-        final_filter = base_filter
-    res = collection.query(
-        query_embeddings=[query_vec], n_results=5, where=final_filter
-    )
-    contexts: list[str] = []
-    if res and res.get("metadatas") and res["metadatas"][0]:
-        for meta in res["metadatas"][0]:
-            text = meta.get("text")
-            if text:
-                contexts.append(str(text))
-    context_text = "\n\n".join(contexts)
+            # user_id is part of the scope so per-user sharding can route the query.
+            scope = [{"chat_id": {"$eq": str(chat.id)}}, {"user_id": {"$eq": str(chat.user_id)}}]
+            # Ranked rows from the column store are the answer; similarity search would only add noise.
+            ranked = bool(analytics and analytics["op"] == "top_k" and analytics["rows"])
+            if ranked:
+                lexical = []
+            with timings.stage("retrieve"):
+                if not ranked and filters:
+                    try:
+                        res = await queryVectors(
+                            query_embeddings=[query_vec], n_results=candidates, where={"$and": scope + filters}
+                        )
+                    except Exception as e:
+                        print(f"Filtered retrieval failed, retrying without filters: {e}")
+                # Over-constrained or mis-extracted filters fall back to plain similarity search.
+                if not ranked and not (res and res.get("ids") and res["ids"][0]):
+                    if filters:
+                        increment("rag_retrieval_fallbacks_total")
+                    res = await queryVectors(query_embeddings=[query_vec], n_results=candidates, where={"$and": scope})
+        contexts: list[str] = []
+        budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+        if analytics:
+            contexts.append("Computed over the full uploaded dataset:\n" + renderAnalyticalContext(analytics))
+            budget -= estimateTokens(contexts[0])
+        metadatas = res["metadatas"][0] if res and res.get("metadatas") else []
+        distances = (res.get("distances") or [None])[0] if res else None
+        if lexical:
+            # Fused order replaces the raw distances as the similarity signal.
+            metadatas, distances = fuseCandidates(metadatas, lexical), None
+        if metadatas:
+            with timings.stage("pack"):
+                packed = packContext(payload.content, metadatas, distances, filters, token_budget=max(0, budget))
+            if packed:
+                contexts.append("Retrieved listings:\n" + packed)
+        context_text = "\n\n".join(contexts)
+        if context_text:
+            await retrieval_cache.set(cache_entry, context_text)
     model_name = getChatModelName()
+    prompt_started = time.perf_counter()
     prompt = f"""You are a helpful real estate assistant that answers questions about properties based on uploaded data.
 
 Below is the relevant property data retrieved from the database:
@@ -197,49 +315,97 @@ Instructions:
 - Answer the user's question using the property data provided above.
 - Be specific and cite actual numbers, addresses, prices, and details from the data.
 - If the data contains multiple relevant properties, compare or list them.
+- Figures computed over the full uploaded dataset are exact; use them for counts, averages, totals and rankings rather than estimating from individual rows.
 - Never make up or invent property details that aren't in the provided data.
 - If no relevant data is found, clearly state that no matching properties were found in the database.
 - include all the keys in your response: type, bedrooms, bathrooms, price, listing_update_date, property_type_full_description, flood_risk, is_new_home, laua, crime_score_weight, address
 - Keep your answers natural, clear, and helpful."""
 
+    timings.record("prompt", time.perf_counter() - prompt_started, prompt_started)
+
+    # Earlier turns come from the Message table, not the client: a running summary
+    # plus the newest turns within HISTORY_TOKEN_BUDGET.
+    with timings.stage("history"):
+        history, fold_before = await loadConversation(chat, user_msg)
+    if fold_before:
+        background_tasks.add_task(foldHistory, str(chat.id), fold_before)
+    chat_messages = [{"role": "system", "content": prompt}, *history, {"role": "user", "content": payload.content}]
+
+    # An identical prompt and history window replays the stored answer without a model call.
+    response_cache = getResponseCache()
+    temperature = 0.2
+    response_key = None
+    cached_answer = None
+    if chat.bypass_response_cache:
+        response_cache.record_bypass()
+        cache_status = "bypass"
+    else:
+        response_key = responseKey(str(chat.user_id), model_name, chat_messages, temperature)
+        cached_answer = response_cache.get(response_key)
+        cache_status = "miss" if cached_answer is None else "hit"
+
     async def token_stream():
         assistant_accum = []
-        safe_history = (payload.history or [])[-5:]
-        chat_messages = [
-            {"role": "system", "content": prompt},
-        ]
-        for item in safe_history:
-            try:
-                role = item.get("role", "USER")
-                content = item.get("content", "")
-                mapped_role = "assistant" if role == "ASSISTANT" else "user"
-                if content:
-                    chat_messages.append({"role": mapped_role, "content": content})
-            except Exception:
-                continue
-        chat_messages.append({"role": "user", "content": payload.content})
-
-        stream = await asynClient.chat.completions.create(
-            model=model_name,
-            messages=chat_messages,
-            temperature=0.2,
-            stream=True,
-        )
-        async for event in stream:
-            delta = event.choices[0].delta.content if event.choices and event.choices[0].delta else None
-            if delta:
-                assistant_accum.append(delta)
-                yield delta
+        generate_started = time.perf_counter()
+
+        def first_token():
+            if not assistant_accum:
+                # Time to first token is measured from the start of the request.
+                timings.record("first_token", time.perf_counter() - timings.started, timings.started)
+
+        try:
+            if cached_answer is not None:
+                for chunk in replayChunks(cached_answer):
+                    first_token()
+                    assistant_accum.append(chunk)
+                    yield chunk
+            else:
+                stream = await asynClient.chat.completions.create(
+                    model=model_name,
+                    messages=chat_messages,
+                    temperature=temperature,
+                    stream=True,
+                )
+                async for event in stream:
+                    delta = event.choices[0].delta.content if event.choices and event.choices[0].delta else None
+                    if delta:
+                        first_token()
+                        assistant_accum.append(delta)
+                        yield delta
+                # Reached only when the stream completed; a disconnected client stores nothing.
+                if response_key:
+                    response_cache.set(response_key, "".join(assistant_accum))
+                if metricsEnabled():
+                    increment(
+                        "rag_chat_tokens_total",
+                        sum(estimateTokens(m["content"]) for m in chat_messages),
+                        kind="prompt",
+                    )
+                    increment("rag_chat_tokens_total", estimateTokens("".join(assistant_accum)), kind="completion")
+            timings.record("generate", time.perf_counter() - generate_started, generate_started)
+        except BaseException:
+            # The client went away or the model call failed; nothing is saved.
+            timings.finish(chat_id=str(chat.id), cache=cache_status, outcome="aborted")
+            raise
 
         final_text = "".join(assistant_accum)
 
         async def save_assistant():
-            assistant_msg = await Message.create(chat=chat, role="ASSISTANT", content=final_text)
-            if (not chat.title or chat.title == "New chat") and payload.content.strip():
-                chat.title = payload.content.strip()[:32]
-                await chat.save()
+            with timings.stage("save"):
+                assistant_msg = await Message.create(chat=chat, role="ASSISTANT", content=final_text)
+                if (not chat.title or chat.title == "New chat") and payload.content.strip():
+                    chat.title = payload.content.strip()[:32]
+                    await chat.save()
+            timings.finish(chat_id=str(chat.id), cache=cache_status, outcome="completed")
             return assistant_msg
 
         background_tasks.add_task(save_assistant)
 
-    return StreamingResponse(token_stream(), media_type="text/plain; charset=utf-8")
\ No newline at end of file
+    return StreamingResponse(
+        token_stream(),
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Server-Timing": timings.header(),
+            "X-Response-Cache": cache_status,
+        },
+    )
\ No newline at end of file
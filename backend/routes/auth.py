@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Request, Response
 from pydantic import BaseModel
 from db.models import User
 import os
 from dotenv import load_dotenv
-import bcrypt
 import jwt
+from middleware.authMiddleware import forgetToken
+from utils.passwords import hashPassword, verifyPassword
 load_dotenv()
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -15,9 +16,9 @@ class AuthPayload(BaseModel):
 
 @router.post("/signup")
 async def signup(payload: AuthPayload):
-    hashed_password = bcrypt.hashpw(payload.password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = await hashPassword(payload.password)
     try:
-        user = await User.create(email=payload.email, password=hashed_password.decode('utf-8'))
+        user = await User.create(email=payload.email, password=hashed_password)
         return {"message": "Signup successful"}
     except Exception as e:
         return {"message": "Failed to signup", "error": "User Already Exists"}
@@ -27,7 +28,7 @@ async def login(payload: AuthPayload, response: Response):
     user = await User.get(email=payload.email)
     if not user:
         return {"message": "Failed to login", "error": "User Not Found"}
-    if not bcrypt.checkpw(payload.password.encode('utf-8'), user.password.encode('utf-8')):
+    if not await verifyPassword(payload.password, user.password):
         return {"message": "Failed to login", "error": "Invalid Password"}
     token = jwt.encode({"id": str(user.id)}, os.getenv("JWT_SECRET"), algorithm="HS256")
     response.set_cookie(
@@ -43,7 +44,10 @@ async def login(payload: AuthPayload, response: Response):
 
 
 @router.post("/logout")
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
+    token = request.cookies.get("access_token")
+    if token:
+        forgetToken(token)
     response.delete_cookie(
         key="access_token",
         path="/",
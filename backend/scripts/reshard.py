@@ -0,0 +1,97 @@
+"""
+Copies every vector from one Chroma sharding layout to another (see utils/sharding.py),
+e.g. from the single CHROMA_COLLECTION_NAME collection to one collection per chat:
+
+    cd backend
+    python -m scripts.reshard --from none --to chat
+    CHROMA_SHARDING=chat uvicorn main:app
+
+Upserts keep their ids, so an interrupted run can simply be started again. Source
+collections are only deleted with --delete-source, after every page was copied.
+Target collections are created recording the embedding model of the vectors copied
+into them, whatever the configured provider is; the run stops if a target already
+holds another model.
+"""
+import argparse
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.clients import forgetChromaCollection, getChromaClient, getChromaCollection, getCollectionEmbeddingModel
+from utils.sharding import SHARDING_STRATEGIES, isShardName, shardName
+
+
+def _collection_names(client) -> list[str]:
+    # Older clients return Collection objects, newer ones plain names.
+    return sorted(c if isinstance(c, str) else c.name for c in client.list_collections())
+
+
+def reshard(source: str, target: str, page_size: int, delete_source: bool) -> dict:
+    client = getChromaClient()
+    names = [name for name in _collection_names(client) if isShardName(name, source)]
+    copied = 0
+    targets: set[str] = set()
+    started = time.perf_counter()
+    for name in names:
+        collection = getChromaCollection(name)
+        source_model = getCollectionEmbeddingModel(name)
+        offset = 0
+        while True:
+            page = collection.get(limit=page_size, offset=offset, include=["embeddings", "metadatas"])
+            ids = page.get("ids") or []
+            if not ids:
+                break
+            by_shard: dict[str, list[int]] = {}
+            for i, meta in enumerate(page["metadatas"]):
+                shard = shardName(meta.get("chat_id"), meta.get("user_id"), strategy=target)
+                by_shard.setdefault(shard, []).append(i)
+            for shard, positions in by_shard.items():
+                if shard == name:
+                    continue
+                target_model = getCollectionEmbeddingModel(shard, create_with=source_model)
+                if target_model != source_model:
+                    raise SystemExit(
+                        f"{shard} holds '{target_model}' embeddings, not the '{source_model}' ones of {name}; "
+                        "stopping before mixing vector spaces"
+                    )
+                getChromaCollection(shard).upsert(
+                    ids=[ids[i] for i in positions],
+                    embeddings=[page["embeddings"][i] for i in positions],
+                    metadatas=[page["metadatas"][i] for i in positions],
+                )
+                targets.add(shard)
+            copied += len(ids)
+            offset += len(ids)
+            print(f"{name}: {offset} vectors copied")
+
+    if delete_source and source != target:
+        for name in names:
+            if name not in targets:
+                client.delete_collection(name)
+                forgetChromaCollection(name)
+                print(f"Deleted {name}")
+
+    return {
+        "source_collections": len(names),
+        "target_collections": len(targets),
+        "vectors": copied,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="source", choices=SHARDING_STRATEGIES, required=True)
+    parser.add_argument("--to", dest="target", choices=SHARDING_STRATEGIES, required=True)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--delete-source", action="store_true")
+    args = parser.parse_args()
+    if args.source == args.target:
+        parser.error("--from and --to are the same layout")
+    print(reshard(args.source, args.target, args.page_size, args.delete_source))
+
+
+if __name__ == "__main__":
+    main()
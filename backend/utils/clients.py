@@ -1,6 +1,12 @@
+import asyncio
 import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Optional
 
+import numpy as np
 from fastapi import HTTPException
 from openai import OpenAI, AsyncOpenAI
 from pinecone import Pinecone
@@ -10,7 +16,12 @@ from chromadb.types import Collection
 
 _openai: Optional[OpenAI] = None
 _openai_async: Optional[AsyncOpenAI] = None
-_chroma_collection: Optional[Collection] = None
+_chroma_client = None
+# Collection handles with the embedding model each one records, most recently used last.
+_chroma_collections: "OrderedDict[str, tuple[Collection, str]]" = OrderedDict()
+_chroma_lock = threading.Lock()
+_embedding_providers: dict[str, "EmbeddingProvider"] = {}
+_provider_lock = threading.Lock()
 
 
 def getOpenai() -> OpenAI:
@@ -23,29 +34,81 @@ def getOpenai() -> OpenAI:
     return _openai
 
 
-def getChromaCollection() -> Collection:
-    global _chroma_collection
+def getChromaClient():
+    global _chroma_client
     host = os.getenv("CHROMA_HOST", "localhost")
     port = os.getenv("CHROMA_PORT", "8000")
-    collection_name = os.getenv("CHROMA_COLLECTION_NAME", "simplyphi")
-    if not host or not port or not collection_name:
-        raise HTTPException(
-            status_code=500,
-            detail="ChromaDB configuration missing (CHROMA_HOST, CHROMA_PORT, CHROMA_COLLECTION_NAME)",
-        )
-    if _chroma_collection is None:
-        try:
-            chroma_client = chromadb.HttpClient(host=host, port=port)
-            _chroma_collection = chroma_client.get_or_create_collection(name=collection_name)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to connect to ChromaDB: {e}")
-    return _chroma_collection
+    if not host or not port:
+        raise HTTPException(status_code=500, detail="ChromaDB configuration missing (CHROMA_HOST, CHROMA_PORT)")
+    if _chroma_client is None:
+        # Called from vector-store pool threads, so guard against concurrent initialisation.
+        with _chroma_lock:
+            if _chroma_client is None:
+                try:
+                    _chroma_client = chromadb.HttpClient(host=host, port=port)
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Failed to connect to ChromaDB: {e}")
+    return _chroma_client
+
+
+def _open_collection(name: str | None, embedding_model: Optional[str] = None) -> tuple[Collection, str]:
+    name = name or os.getenv("CHROMA_COLLECTION_NAME", "simplyphi")
+    if not name:
+        raise HTTPException(status_code=500, detail="ChromaDB configuration missing (CHROMA_COLLECTION_NAME)")
+    with _chroma_lock:
+        cached = _chroma_collections.get(name)
+        if cached is not None:
+            _chroma_collections.move_to_end(name)
+            return cached
+    try:
+        metadata = {"embedding_model": embedding_model} if embedding_model else None
+        collection = getChromaClient().get_or_create_collection(name=name, metadata=metadata)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to open ChromaDB collection '{name}': {e}")
+    cached = (collection, _collection_embedding_model(collection, embedding_model))
+    with _chroma_lock:
+        _chroma_collections[name] = cached
+        while len(_chroma_collections) > max(1, int(os.getenv("CHROMA_COLLECTION_CACHE_SIZE", "256"))):
+            _chroma_collections.popitem(last=False)
+    return cached
+
+
+def getChromaCollection(name: str | None = None) -> Collection:
+    """
+    Handle for collection `name` (CHROMA_COLLECTION_NAME by default), created on
+    first use. Handles are cached, keeping the CHROMA_COLLECTION_CACHE_SIZE most
+    recently used, since sharded layouts can have one collection per chat.
+    """
+    return _open_collection(name)[0]
+
+
+def getCollectionEmbeddingModel(name: str | None = None, create_with: Optional[str] = None) -> str:
+    """
+    The embedding model id collection `name` holds vectors of (see getEmbeddingProvider).
+    A collection created by this call records `create_with`, by default the configured
+    provider's model.
+    """
+    return _open_collection(name, create_with)[1]
+
+
+def forgetChromaCollection(name: str) -> None:
+    """Drops a cached handle, e.g. after the collection was deleted."""
+    with _chroma_lock:
+        _chroma_collections.pop(name, None)
 
 
 def getEmbeddingModelName() -> str:
     return os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 
 
+def getEmbeddingDimensions() -> Optional[int]:
+    """EMBED_DIMENSIONS shortens text-embedding-3 vectors at the provider; empty keeps the model default."""
+    value = os.getenv("EMBED_DIMENSIONS", "").strip()
+    return int(value) if value else None
+
+
 def getChatModelName() -> str:
     return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
@@ -57,4 +120,165 @@ def getAsyncOpenai() -> AsyncOpenAI:
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
     if _openai_async is None:
         _openai_async = AsyncOpenAI(api_key=api_key)
-    return _openai_async
\ No newline at end of file
+    return _openai_async
+
+
+class EmbeddingProvider(ABC):
+    """
+    Turns texts into a float32 (len(texts), dim) array. `model_id` identifies the
+    vector space for caches and dedup, and is what collections record.
+    """
+
+    name = ""
+
+    @property
+    @abstractmethod
+    def model_id(self) -> str: ...
+
+    @abstractmethod
+    async def embed(self, texts: list[str], interactive: bool = False) -> np.ndarray: ...
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    name = "openai"
+
+    def __init__(self, model: str, dimensions: Optional[int] = None):
+        self.model = model
+        self.dimensions = dimensions
+
+    @property
+    def model_id(self) -> str:
+        # Shortened vectors are a different space from the model's full-length ones.
+        return f"{self.model}@{self.dimensions}" if self.dimensions else self.model
+
+    async def embed(self, texts: list[str], interactive: bool = False) -> np.ndarray:
+        from utils.scheduler import getEmbeddingScheduler
+
+        return await getEmbeddingScheduler().embed(
+            texts, interactive=interactive, model=self.model, dimensions=self.dimensions
+        )
+
+
+_local_models: dict[tuple[str, str], object] = {}
+
+
+def _load_local_model(model_name: str, backend: str):
+    model = _local_models.get((model_name, backend))
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+
+        kwargs = {} if backend == "torch" else {"backend": backend}
+        model = _local_models[(model_name, backend)] = SentenceTransformer(model_name, device="cpu", **kwargs)
+    return model
+
+
+def _local_encode(texts: list[str], model_name: str, backend: str, batch_size: int) -> np.ndarray:
+    model = _load_local_model(model_name, backend)
+    vectors = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return vectors.astype(np.float32)
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    CPU sentence-transformer (EMBED_LOCAL_MODEL, torch or onnx backend). Encoding runs
+    off the event loop: on one thread by default, or across EMBED_LOCAL_PROCESSES
+    worker processes that each load the model once.
+    """
+
+    name = "local"
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or os.getenv("EMBED_LOCAL_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        self.backend = os.getenv("EMBED_LOCAL_BACKEND", "torch")
+        self.batch_size = int(os.getenv("EMBED_LOCAL_BATCH_SIZE", "64"))
+        self.processes = int(os.getenv("EMBED_LOCAL_PROCESSES", "0"))
+        self._executor: Optional[Executor] = None
+
+    @property
+    def model_id(self) -> str:
+        return f"local:{self.model_name}"
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes > 0:
+                import multiprocessing
+
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-embed")
+        return self._executor
+
+    async def embed(self, texts: list[str], interactive: bool = False) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        loop = asyncio.get_running_loop()
+        if interactive:
+            # Chat queries run on the loop's default pool instead of queueing behind ingestion.
+            return await loop.run_in_executor(
+                None, _local_encode, texts, self.model_name, self.backend, self.batch_size
+            )
+        executor = self._get_executor()
+        workers = max(1, self.processes)
+        # Split across processes in whole model batches so each worker stays vectorised.
+        chunk = max(self.batch_size, -(-len(texts) // workers))
+        parts = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor, _local_encode, texts[i : i + chunk], self.model_name, self.backend, self.batch_size
+                )
+                for i in range(0, len(texts), chunk)
+            )
+        )
+        return np.concatenate(parts)
+
+
+def getEmbeddingProvider(model_id: Optional[str] = None) -> EmbeddingProvider:
+    """
+    Provider for `model_id`, the vector space a collection or local index records, so
+    collections embedded by different providers are each ingested into and queried
+    with their own. Without a model_id, the EMBEDDING_PROVIDER that new collections
+    are created with.
+    """
+    if model_id is None:
+        name = os.getenv("EMBEDDING_PROVIDER", "openai").lower()
+        if name == "local":
+            model_id = LocalEmbeddingProvider().model_id
+        elif name == "openai":
+            model_id = OpenAIEmbeddingProvider(getEmbeddingModelName(), getEmbeddingDimensions()).model_id
+        else:
+            raise HTTPException(status_code=500, detail=f"Unknown EMBEDDING_PROVIDER '{name}'")
+    with _provider_lock:
+        provider = _embedding_providers.get(model_id)
+        if provider is None:
+            if model_id.startswith("local:"):
+                provider = LocalEmbeddingProvider(model_id[len("local:") :])
+            else:
+                model, _, dimensions = model_id.partition("@")
+                provider = OpenAIEmbeddingProvider(model, int(dimensions) if dimensions else None)
+            _embedding_providers[model_id] = provider
+    return provider
+
+
+def _collection_embedding_model(collection: Collection, default: Optional[str] = None) -> str:
+    """
+    The embedding model a collection holds, recording `default` (the configured
+    provider's model if None) on a new one. Collections created before this was
+    tracked hold OpenAI vectors.
+    """
+    metadata = dict(collection.metadata or {})
+    recorded = metadata.get("embedding_model")
+    if recorded is not None:
+        return recorded
+    if collection.count() == 0:
+        metadata["embedding_model"] = default or getEmbeddingProvider().model_id
+        collection.modify(metadata=metadata)
+        return metadata["embedding_model"]
+    return getEmbeddingModelName()
@@ -0,0 +1,612 @@
+import json
+import os
+import re
+import shutil
+from typing import Optional
+
+import numpy as np
+
+from utils.context import INTERNAL_METADATA_KEYS
+from utils.filters import filtersFromArgs, parsePropertyFilters
+
+
+# Each ingested file is also kept as append-only binary files per column under
+# COLUMNAR_DIR/<chat_id>/<file_id>/, described by manifest.json:
+#   num   float64 with NaN for missing values (booleans included); a num column that
+#         meets a value that is not a number moves to cat, as CSV type inference widens
+#   cat   int32 dictionary codes, -1 for missing; categories live in the manifest
+#   text  UTF-8 bytes plus int64 end offsets, for strings too varied to dictionary
+#         encode (addresses); a cat column moves here past COLUMNAR_MAX_CATEGORIES
+#   slots.i64  the row's chunk_index in the vector store, written by refreshes whose
+#         kept rows retain their old index; absent, a row's index is its position
+# Readers memory-map the files, so scans touch only the columns a query needs.
+
+_MANIFEST = "manifest.json"
+
+
+def getColumnarDir() -> str:
+    return os.getenv("COLUMNAR_DIR", "./data/columnar")
+
+
+def _file_dir(chat_id: str, file_id: str) -> str:
+    return os.path.join(getColumnarDir(), chat_id, file_id)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (bool, int, float))
+
+
+def _fits_num(value) -> bool:
+    if value is None or _is_number(value):
+        return True
+    if not isinstance(value, str):
+        return False
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _label(value) -> str:
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+
+
+def _write_manifest(path: str, manifest: dict):
+    tmp = os.path.join(path, _MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, _MANIFEST))
+
+
+class ColumnarWriter:
+    """
+    Appends ingest windows to a file's column store. Opening with start_index
+    truncates columns back to that row so a resumed job re-appends cleanly; if the
+    store holds fewer rows than start_index it cannot be completed and is dropped.
+    """
+
+    def __init__(self, chat_id: str, file_id: str, start_index: int = 0):
+        self.path = _file_dir(chat_id, file_id)
+        self.max_categories = int(os.getenv("COLUMNAR_MAX_CATEGORIES", "4096"))
+        self.disabled = False
+        manifest = None
+        manifest_path = os.path.join(self.path, _MANIFEST)
+        if start_index and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        if start_index and (manifest is None or manifest["rows"] < start_index):
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.disabled = True
+            return
+        if manifest is None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)
+            manifest = {"rows": 0, "complete": False, "columns": {}}
+        elif manifest["rows"] > start_index:
+            for spec in manifest["columns"].values():
+                self._truncate(spec, start_index)
+            if manifest.get("slots"):
+                with open(os.path.join(self.path, "slots.i64"), "r+b") as f:
+                    f.truncate(start_index * 8)
+            manifest["rows"] = start_index
+        self.manifest = manifest
+        self._codes = {
+            name: {value: code for code, value in enumerate(spec["categories"])}
+            for name, spec in manifest["columns"].items()
+            if spec["kind"] == "cat"
+        }
+
+    def _file(self, spec: dict, suffix: str = "") -> str:
+        return os.path.join(self.path, spec["file"] + suffix)
+
+    def _truncate(self, spec: dict, rows: int):
+        if spec["kind"] == "text":
+            ends = np.fromfile(self._file(spec, ".off"), dtype=np.int64, count=rows)
+            spec["bytes"] = int(ends[-1]) if rows else 0
+            with open(self._file(spec, ".off"), "r+b") as f:
+                f.truncate(rows * 8)
+            with open(self._file(spec, ".str"), "r+b") as f:
+                f.truncate(spec["bytes"])
+            return
+        itemsize = 8 if spec["kind"] == "num" else 4
+        with open(self._file(spec), "r+b") as f:
+            f.truncate(rows * itemsize)
+
+    def _add_column(self, name: str, sample):
+        spec = {"file": f"c{len(self.manifest['columns'])}", "kind": "num" if _is_number(sample) else "cat"}
+        if isinstance(sample, bool):
+            spec["bool"] = True
+        if spec["kind"] == "cat":
+            spec["categories"] = []
+            self._codes[name] = {}
+        self.manifest["columns"][name] = spec
+        # Rows written before the column first appeared are missing.
+        self._encode(name, [None] * self.manifest["rows"])
+
+    def _to_cat(self, name: str):
+        spec = self.manifest["columns"][name]
+        numbers = np.fromfile(self._file(spec), dtype=np.float64)
+        os.remove(self._file(spec))
+        values = []
+        for number in numbers:
+            if np.isnan(number):
+                values.append(None)
+            elif spec.get("bool"):
+                values.append(bool(number))
+            else:
+                values.append(int(number) if float(number).is_integer() else float(number))
+        spec.pop("bool", None)
+        spec.update({"kind": "cat", "categories": []})
+        self._codes[name] = {}
+        print(f"Column store {self.path}: column '{name}' holds non-numeric values, stored as categories")
+        self._encode(name, values)
+
+    def _to_text(self, name: str):
+        spec = self.manifest["columns"][name]
+        codes = np.fromfile(self._file(spec), dtype=np.int32)
+        os.remove(self._file(spec))
+        categories = spec.pop("categories")
+        del self._codes[name]
+        spec.update({"kind": "text", "bytes": 0})
+        self._append_text(spec, [categories[code] if code >= 0 else None for code in codes])
+
+    def _append_text(self, spec: dict, values: list):
+        encoded = [b"" if value is None else _label(value).encode() for value in values]
+        ends = spec["bytes"] + np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        with open(self._file(spec, ".str"), "ab") as f:
+            f.write(b"".join(encoded))
+        with open(self._file(spec, ".off"), "ab") as f:
+            ends.tofile(f)
+        if len(encoded):
+            spec["bytes"] = int(ends[-1])
+
+    def _encode(self, name: str, values: list):
+        spec = self.manifest["columns"][name]
+        if spec["kind"] == "num" and not all(_fits_num(v) for v in values):
+            # Rather than store what does not parse as NaN, which would silently drop
+            # those rows from aggregates.
+            self._to_cat(name)
+        if spec["kind"] == "cat":
+            codes = self._codes[name]
+            fresh = {_label(v) for v in values if v is not None} - codes.keys()
+            if len(codes) + len(fresh) > self.max_categories:
+                self._to_text(name)
+        if spec["kind"] == "text":
+            self._append_text(spec, values)
+            return
+        if spec["kind"] == "num":
+            out = np.full(len(values), np.nan, dtype=np.float64)
+            for i, value in enumerate(values):
+                if _is_number(value):
+                    out[i] = float(value)
+                elif isinstance(value, str):
+                    try:
+                        out[i] = float(value)
+                    except ValueError:
+                        pass
+        else:
+            out = np.full(len(values), -1, dtype=np.int32)
+            for i, value in enumerate(values):
+                if value is None:
+                    continue
+                label = _label(value)
+                code = codes.get(label)
+                if code is None:
+                    code = codes[label] = len(spec["categories"])
+                    spec["categories"].append(label)
+                out[i] = code
+        with open(self._file(spec), "ab") as f:
+            out.tofile(f)
+
+    def append(self, documents: list[dict], slots: Optional[list[int]] = None):
+        """`slots` gives each row's chunk_index when it is not the row's position."""
+        if self.disabled or not documents:
+            return
+        if slots is not None:
+            self.manifest["slots"] = True
+            with open(os.path.join(self.path, "slots.i64"), "ab") as f:
+                np.asarray(slots, dtype=np.int64).tofile(f)
+        columns = self.manifest["columns"]
+        for doc in documents:
+            for name, value in doc.items():
+                if name not in columns and value is not None and name not in INTERNAL_METADATA_KEYS:
+                    self._add_column(name, value)
+        for name in list(columns):
+            self._encode(name, [doc.get(name) for doc in documents])
+        self.manifest["rows"] += len(documents)
+        _write_manifest(self.path, self.manifest)
+
+    def finalize(self):
+        if self.disabled:
+            return
+        self.manifest["complete"] = True
+        _write_manifest(self.path, self.manifest)
+
+
+def copyFileColumns(source_chat_id: str, source_file_id: str, chat_id: str, file_id: str) -> bool:
+    """Gives a linked upload its own copy of the source file's columns."""
+    source = _file_dir(source_chat_id, source_file_id)
+    if not os.path.exists(os.path.join(source, _MANIFEST)):
+        return False
+    dest = _file_dir(chat_id, file_id)
+    shutil.rmtree(dest, ignore_errors=True)
+    shutil.copytree(source, dest)
+    return True
+
+
+def replaceFileColumns(staged_chat_id: str, staged_file_id: str, chat_id: str, file_id: str) -> bool:
+    """
+    Swaps a column store rebuilt under a staging chat id in for the file's current
+    one. The old store is moved out of the chat directory before the new one moves
+    in, so readers never see both.
+    """
+    source = _file_dir(staged_chat_id, staged_file_id)
+    if not os.path.exists(os.path.join(source, _MANIFEST)):
+        return False
+    dest = _file_dir(chat_id, file_id)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    retired = source + ".old"
+    if os.path.exists(dest):
+        os.replace(dest, retired)
+    os.replace(source, dest)
+    shutil.rmtree(retired, ignore_errors=True)
+    shutil.rmtree(os.path.dirname(source), ignore_errors=True)
+    return True
+
+
+class _FileColumns:
+    def __init__(self, path: str, manifest: dict):
+        self.path = path
+        self.rows = manifest["rows"]
+        self.columns = manifest["columns"]
+        self.slots = None
+        if manifest.get("slots") and self.rows:
+            self.slots = np.memmap(os.path.join(path, "slots.i64"), dtype=np.int64, mode="r")[: self.rows]
+
+    def slot(self, index: int) -> int:
+        """The row's chunk_index in the vector store."""
+        return int(self.slots[index]) if self.slots is not None else index
+
+    def _map(self, name: str, suffix: str, dtype) -> np.ndarray:
+        path = os.path.join(self.path, self.columns[name]["file"] + suffix)
+        if self.rows == 0 or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def column(self, name: str) -> Optional[np.ndarray]:
+        """Numeric values or dictionary codes; None for absent and text columns."""
+        spec = self.columns.get(name)
+        if spec is None or spec["kind"] == "text":
+            return None
+        return self._map(name, "", np.float64 if spec["kind"] == "num" else np.int32)[: self.rows]
+
+    def text(self, name: str, indices: np.ndarray) -> list[Optional[str]]:
+        ends = self._map(name, ".off", np.int64)
+        data = self._map(name, ".str", np.uint8)
+        out = []
+        for i in indices:
+            start = int(ends[i - 1]) if i else 0
+            end = int(ends[i])
+            out.append(data[start:end].tobytes().decode() if end > start else None)
+        return out
+
+    def labels(self, name: str, mask: np.ndarray) -> np.ndarray:
+        """Group labels of the masked rows as strings, "n/a" where missing."""
+        spec = self.columns.get(name)
+        count = int(mask.sum())
+        if spec is None:
+            return np.full(count, "n/a")
+        if spec["kind"] == "cat":
+            # Code -1 (missing) indexes the trailing "n/a" label.
+            return np.array(spec["categories"] + ["n/a"])[np.asarray(self.column(name)[mask])]
+        if spec["kind"] == "num":
+            keys = np.asarray(self.column(name)[mask])
+            return np.where(np.isnan(keys), "n/a", np.char.mod("%g", keys))
+        return np.array([value or "n/a" for value in self.text(name, np.flatnonzero(mask))])
+
+    def value(self, name: str, index: int):
+        spec = self.columns[name]
+        if spec["kind"] == "text":
+            return self.text(name, [index])[0]
+        raw = self.column(name)[index]
+        if spec["kind"] == "num":
+            if np.isnan(raw):
+                return None
+            if spec.get("bool"):
+                return bool(raw)
+            return int(raw) if float(raw).is_integer() else float(raw)
+        return spec["categories"][raw] if raw >= 0 else None
+
+    def row(self, index: int) -> dict:
+        row = {}
+        for name in self.columns:
+            value = self.value(name, index)
+            if value is not None:
+                row[name] = value
+        return row
+
+    def mask(self, filters: list[dict]) -> np.ndarray:
+        """Evaluates Chroma-style {"column": {"$op": value}} clauses, ANDed together."""
+        mask = np.ones(self.rows, dtype=bool)
+        for clause in filters:
+            for name, condition in clause.items():
+                for op, target in condition.items():
+                    mask &= self._compare(name, op, target)
+        return mask
+
+    def _compare(self, name: str, op: str, target) -> np.ndarray:
+        spec = self.columns.get(name)
+        none = np.zeros(self.rows, dtype=bool)
+        if spec is None:
+            return none
+        if spec["kind"] == "text":
+            if op not in ("$eq", "$ne") or not isinstance(target, str):
+                return none
+            ends = self._map(name, ".off", np.int64)
+            lengths = np.diff(ends, prepend=0)
+            wanted = target.encode()
+            # Only rows of the right byte length need a string comparison.
+            candidates = np.flatnonzero(lengths == len(wanted))
+            equal = none.copy()
+            for i, value in zip(candidates, self.text(name, candidates)):
+                equal[i] = value == target
+            return equal if op == "$eq" else ~equal & (lengths > 0)
+        column = self.column(name)
+        if spec["kind"] == "cat":
+            if op not in ("$eq", "$ne"):
+                return none
+            try:
+                code = spec["categories"].index(target)
+            except ValueError:
+                code = -2
+            return column == code if op == "$eq" else (column != code) & (column >= 0)
+        if not _is_number(target):
+            return none
+        target = float(target)
+        with np.errstate(invalid="ignore"):
+            if op == "$eq":
+                return column == target
+            if op == "$ne":
+                return (column != target) & ~np.isnan(column)
+            if op == "$gt":
+                return column > target
+            if op == "$gte":
+                return column >= target
+            if op == "$lt":
+                return column < target
+            if op == "$lte":
+                return column <= target
+        return none
+
+
+def openFileColumns(chat_id: str, file_id: str) -> Optional[_FileColumns]:
+    """A file's column store, including one still being ingested."""
+    path = _file_dir(chat_id, file_id)
+    try:
+        with open(os.path.join(path, _MANIFEST)) as f:
+            return _FileColumns(path, json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def loadChatColumns(chat_id: str) -> list[_FileColumns]:
+    """Completed column stores of every file in the chat."""
+    chat_dir = os.path.join(getColumnarDir(), chat_id)
+    if not os.path.isdir(chat_dir):
+        return []
+    files = []
+    for file_id in sorted(os.listdir(chat_dir)):
+        path = os.path.join(chat_dir, file_id)
+        try:
+            with open(os.path.join(path, _MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if manifest.get("complete"):
+            files.append(_FileColumns(path, manifest))
+    return files
+
+
+_MEASURES = [
+    (r"\bprices?\b|\bcosts?\b|\bvalues?\b", "price"),
+    (r"\bbed(?:room)?s?\b", "bedrooms"),
+    (r"\bbath(?:room)?s?\b", "bathrooms"),
+    (r"\bcrime(?:\s+score)?(?:\s+weight)?s?\b", "crime_score_weight"),
+]
+_AGGREGATES = [
+    (r"\b(?:average|avg)\b|\bmean\b(?=\s+(?:price|cost|value|number|bed|bath|crime))", "avg"),
+    (r"\bmedian\b", "median"),
+    (r"\bhow\s+many\b|\bnumber\s+of\b|\bcount\b", "count"),
+    (r"\b(?:total|sum)\b", "sum"),
+]
+_RANKINGS = [
+    (r"\b(?:cheapest|least\s+expensive|lowest[\s-]priced|most\s+affordable)\b", "price", "asc"),
+    (r"\b(?:most\s+expensive|priciest|highest[\s-]priced|dearest)\b", "price", "desc"),
+    (r"\b(?:safest|lowest\s+crime)\b", "crime_score_weight", "asc"),
+    (r"\bhighest\s+crime\b", "crime_score_weight", "desc"),
+    (r"\b(?:largest|biggest|most\s+bedrooms)\b", "bedrooms", "desc"),
+    (r"\b(?:smallest|fewest\s+bedrooms)\b", "bedrooms", "asc"),
+]
+_GROUPS = [
+    (r"\b(?:laua|local\s+authorit(?:y|ies)|areas?|districts?)\b", "laua"),
+    (r"\b(?:property\s+types?|types?)\b", "property_type_full_description"),
+    (r"\bbed(?:room)?s?(?:\s+count)?\b", "bedrooms"),
+    (r"\bflood(?:ing)?\s+risk\b", "flood_risk"),
+]
+_GROUP_PREFIX = r"\b(?:by|per|for\s+each|in\s+each|across)\s+"
+_NOT_ROOMS = r"(?!\s*-?\s*(?:bed|bath|br\b|bdrm|ba\b))"
+_TOP_K = [
+    r"\b(?:top|first)\s+(\d+)\b",
+    r"\b(\d+)\s+(?=(?:cheapest|least|lowest|most|priciest|highest|dearest|safest|largest|biggest|smallest|fewest)\b)",
+    rf"\b(?:cheapest|expensive|priciest|affordable|safest|largest|biggest|smallest)\s+(\d+)\b{_NOT_ROOMS}",
+]
+
+
+def planAnalyticalQuery(query: str) -> Optional[dict]:
+    """
+    Recognises aggregate ("average price of new homes in E07000209") and ranking
+    ("cheapest 10 flats with low flood risk") questions that nearest-neighbour
+    retrieval cannot answer. Filters come from the rule-based parser; a plan is only
+    returned when those rules understood the rest of the query.
+    """
+    text = (query or "").lower()
+    plan: dict = {}
+    consumed: list[tuple[int, int]] = []
+
+    def find(pattern: str, source: str = None):
+        match = re.search(pattern, text if source is None else source)
+        if match:
+            consumed.append(match.span())
+        return match
+
+    for pattern, func in _AGGREGATES:
+        match = find(pattern)
+        if match:
+            plan = {"op": "aggregate", "func": func, "column": None if func == "count" else "price"}
+            break
+    if not plan:
+        for pattern, column, order in _RANKINGS:
+            if find(pattern):
+                plan = {"op": "top_k", "column": column, "order": order, "k": 5}
+                break
+    if not plan:
+        return None
+
+    if plan["op"] == "top_k":
+        for pattern in _TOP_K:
+            match = find(pattern)
+            if match:
+                plan["k"] = max(1, min(int(match.group(1)), int(os.getenv("COLUMNAR_TOP_K_MAX", "50"))))
+                break
+    else:
+        for pattern, column in _GROUPS:
+            match = find(_GROUP_PREFIX + f"(?:{pattern})")
+            if match:
+                plan["group_by"] = column
+                break
+        if plan["func"] != "count":
+            # The measured column is the one named right after the aggregate word.
+            after = text[consumed[0][1] :]
+            best = None
+            for pattern, column in _MEASURES:
+                match = re.search(pattern, after)
+                if match and (best is None or match.start() < best[0]):
+                    best = (match.start(), column, match)
+            if best:
+                plan["column"] = best[1]
+                start = consumed[0][1]
+                consumed.append((start + best[2].start(), start + best[2].end()))
+
+    masked = text
+    for start, end in consumed:
+        masked = masked[:start] + " " * (end - start) + masked[end:]
+    args, confidence = parsePropertyFilters(masked)
+    if confidence < float(os.getenv("FILTER_RULES_MIN_CONFIDENCE", "0.75")):
+        return None
+    plan["filters"] = filtersFromArgs(args)
+    return plan
+
+
+def _aggregate(func: str, values: np.ndarray):
+    if func == "count":
+        return int(values.size)
+    if values.size == 0:
+        return None
+    if func == "avg":
+        return float(values.mean())
+    if func == "median":
+        return float(np.median(values))
+    if func == "sum":
+        return float(values.sum())
+    return None
+
+
+def runAnalyticalQuery(chat_id: str, plan: dict) -> Optional[dict]:
+    """
+    Executes a plan from planAnalyticalQuery with vectorised scans over every file
+    of the chat. Returns None when the chat has no column store yet.
+    """
+    files = loadChatColumns(chat_id)
+    if not files:
+        return None
+    total = sum(f.rows for f in files)
+    result = {**plan, "rows_total": total}
+
+    if plan["op"] == "top_k":
+        k = plan["k"]
+        candidates = []
+        for file_index, f in enumerate(files):
+            column = f.column(plan["column"])
+            if column is None:
+                continue
+            mask = f.mask(plan["filters"]) & ~np.isnan(column)
+            indices = np.flatnonzero(mask)
+            result["rows_matched"] = result.get("rows_matched", 0) + int(indices.size)
+            if indices.size == 0:
+                continue
+            values = np.asarray(column[indices])
+            keys = values if plan["order"] == "asc" else -values
+            if indices.size > k:
+                best = np.argpartition(keys, k - 1)[:k]
+                indices, keys = indices[best], keys[best]
+            candidates.extend((float(key), file_index, int(index)) for key, index in zip(keys, indices))
+        candidates.sort()
+        result["rows"] = [files[file_index].row(index) for _, file_index, index in candidates[:k]]
+        result.setdefault("rows_matched", 0)
+        return result
+
+    measured = []
+    groups = []
+    for f in files:
+        mask = f.mask(plan["filters"])
+        if plan["func"] != "count":
+            column = f.column(plan["column"])
+            if column is None:
+                continue
+            mask &= ~np.isnan(column)
+            measured.append(np.asarray(column[mask]))
+        else:
+            measured.append(np.zeros(int(mask.sum())))
+        if plan.get("group_by"):
+            groups.append(f.labels(plan["group_by"], mask))
+
+    values = np.concatenate(measured) if measured else np.empty(0)
+    result["rows_matched"] = int(values.size)
+    result["value"] = _aggregate(plan["func"], values)
+    if plan.get("group_by") and values.size:
+        labels = np.concatenate(groups)
+        unique, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        # Only the largest groups are reported, so only those are aggregated.
+        largest = np.argsort(-counts, kind="stable")[: int(os.getenv("COLUMNAR_MAX_GROUPS", "25"))]
+        result["groups"] = [
+            {"group": str(unique[g]), "rows": int(counts[g]), "value": _aggregate(plan["func"], values[inverse == g])}
+            for g in largest
+        ]
+    return result
+
+
+def _format_number(value) -> str:
+    if value is None:
+        return "n/a"
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:,.2f}"
+    return f"{int(value):,}"
+
+
+def renderAnalyticalContext(result: dict) -> str:
+    """Summarises a computed result for the prompt."""
+    conditions = ", ".join(
+        f"{name} {op.lstrip('$')} {target}" for clause in result["filters"] for name, cond in clause.items() for op, target in cond.items()
+    )
+    scope = f"{result['rows_matched']:,} of {result['rows_total']:,} rows" + (f" matching {conditions}" if conditions else "")
+    if result["op"] == "top_k":
+        direction = "lowest" if result["order"] == "asc" else "highest"
+        lines = [f"Top {len(result['rows'])} rows by {direction} {result['column']} ({scope}):"]
+        lines.extend(json.dumps(row, sort_keys=True, separators=(",", ":")) for row in result["rows"])
+        return "\n".join(lines)
+    label = "count" if result["func"] == "count" else f"{result['func']} {result['column']}"
+    lines = [f"{label} over {scope}: {_format_number(result['value'])}"]
+    for group in result.get("groups", []):
+        lines.append(f"- {result['group_by']}={group['group']}: {_format_number(group['value'])} ({group['rows']:,} rows)")
+    return "\n".join(lines)
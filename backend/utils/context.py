@@ -0,0 +1,171 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Optional
+
+from utils.scheduler import estimateTokens
+
+# Bookkeeping fields written by ingestion; everything else in a vector's metadata is a row column.
+INTERNAL_METADATA_KEYS = frozenset({"chat_id", "user_id", "file_id", "chunk_index", "source", "content_hash"})
+
+
+def rowFromMetadata(metadata: dict) -> dict:
+    return {k: v for k, v in metadata.items() if k not in INTERNAL_METADATA_KEYS}
+
+
+def renderRowText(metadata: dict) -> str:
+    """
+    Renders a retrieved row for the prompt from its typed metadata columns.
+    Vectors ingested before compact storage carry the row JSON in a "text" blob,
+    which is used as-is.
+    """
+    text = metadata.get("text")
+    if isinstance(text, str) and text.startswith("{"):
+        return text
+    rendered = json.dumps(rowFromMetadata(metadata), sort_keys=True, separators=(",", ":"))
+    max_text_chars = int(os.getenv("MAX_CHUNK_TEXT_CHARS", "2000"))
+    return rendered[:max_text_chars]
+
+
+# Context assembly: retrieval over-fetches CONTEXT_CANDIDATES rows, which are re-ranked
+# by BM25 over their rendered values blended with vector similarity, de-duplicated by
+# listing and packed into CONTEXT_TOKEN_BUDGET as a table of the relevant columns, so
+# column names are spelled out once rather than in every row.
+
+# Columns the prompt asks the model to report; always kept when a row has them.
+PROMPT_COLUMNS = (
+    "address",
+    "type",
+    "property_type_full_description",
+    "bedrooms",
+    "bathrooms",
+    "price",
+    "listing_update_date",
+    "flood_risk",
+    "is_new_home",
+    "laua",
+    "crime_score_weight",
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _words(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+def _row(metadata: dict) -> dict:
+    text = metadata.get("text")
+    if isinstance(text, str) and text.startswith("{"):
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    return rowFromMetadata(metadata)
+
+
+def _listing_key(metadata: dict, row: dict):
+    # Re-uploads and re-listings of one property share an address; rows without one
+    # fall back to the content hash written at ingestion.
+    address = row.get("address")
+    if isinstance(address, str) and address.strip():
+        return ("address", " ".join(_words(address)))
+    if metadata.get("content_hash"):
+        return ("hash", metadata["content_hash"])
+    return ("row", json.dumps(row, sort_keys=True, default=str))
+
+
+def relevantColumns(query: str, available, filters: Optional[list[dict]] = None) -> list[str]:
+    """Prompt columns, then any column a filter or the question itself refers to."""
+    configured = [c.strip() for c in os.getenv("CONTEXT_COLUMNS", ",".join(PROMPT_COLUMNS)).split(",") if c.strip()]
+    filtered = [key for clause in filters or [] for key in clause if not key.startswith("$")]
+    query_words = set(_words(query))
+    mentioned = [c for c in available if set(_words(c.replace("_", " "))) <= query_words]
+    return [c for c in dict.fromkeys(configured + filtered + mentioned) if c in available]
+
+
+def renderTableRow(row: dict, columns: list[str]) -> str:
+    """One ` | `-separated line of values under a shared header; "-" marks a missing value."""
+    values = []
+    for column in columns:
+        value = row.get(column)
+        values.append("-" if value is None or value == "" else str(value).replace("|", "/").replace("\n", " "))
+    return " | ".join(values)
+
+
+def _bm25(query_terms: list[str], documents: list[list[str]], k1: float = 1.2, b: float = 0.75) -> list[float]:
+    n = len(documents)
+    avg_len = sum(len(d) for d in documents) / max(1, n)
+    frequencies = [Counter(d) for d in documents]
+    scores = [0.0] * n
+    for term in set(query_terms):
+        df = sum(1 for f in frequencies if term in f)
+        if not df:
+            continue
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        for i, f in enumerate(frequencies):
+            tf = f.get(term, 0)
+            if tf:
+                scores[i] += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(documents[i]) / max(1e-9, avg_len)))
+    return scores
+
+
+def _scaled(values: list[float]) -> list[float]:
+    low, high = min(values), max(values)
+    if high - low < 1e-12:
+        return [1.0] * len(values)
+    return [(v - low) / (high - low) for v in values]
+
+
+def packContext(
+    query: str,
+    metadatas: list[Optional[dict]],
+    distances: Optional[list[float]] = None,
+    filters: Optional[list[dict]] = None,
+    token_budget: Optional[int] = None,
+) -> str:
+    """
+    Re-ranks retrieved rows, drops duplicate listings and renders the best ones
+    compactly until the token budget or CONTEXT_MAX_ROWS is reached. When no row fits
+    the budget, the best one is returned cut to MAX_CHUNK_TEXT_CHARS.
+    """
+    candidates = [(i, m) for i, m in enumerate(metadatas) if m]
+    if not candidates:
+        return ""
+    rows = [_row(m) for _, m in candidates]
+    columns = relevantColumns(query, {k for row in rows for k in row}, filters)
+    header = " | ".join(columns)
+    rendered = [renderTableRow(row, columns) for row in rows]
+
+    lexical = _scaled(_bm25(_words(query), [_words(text) for text in rendered]))
+    if distances:
+        similarity = [1.0 - d for d in _scaled([distances[i] for i, _ in candidates])]
+    else:
+        similarity = _scaled([-float(i) for i, _ in candidates])
+    weight = float(os.getenv("CONTEXT_BM25_WEIGHT", "0.3"))
+    scores = [weight * lex + (1 - weight) * sim for lex, sim in zip(lexical, similarity)]
+
+    budget = token_budget if token_budget is not None else int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+    max_rows = int(os.getenv("CONTEXT_MAX_ROWS", "8"))
+    packed: list[str] = []
+    seen = set()
+    used = estimateTokens(header)
+    for j in sorted(range(len(candidates)), key=lambda j: -scores[j]):
+        key = _listing_key(candidates[j][1], rows[j])
+        if key in seen:
+            continue
+        seen.add(key)
+        tokens = estimateTokens(rendered[j])
+        if used + tokens > budget:
+            # A shorter row further down may still fit.
+            continue
+        packed.append(rendered[j])
+        used += tokens
+        if len(packed) >= max_rows:
+            break
+    if not packed:
+        best = max(range(len(candidates)), key=lambda j: scores[j])
+        packed.append(rendered[best][: int(os.getenv("MAX_CHUNK_TEXT_CHARS", "2000"))])
+    return "\n".join([header, *packed])
@@ -0,0 +1,221 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from utils.clients import getEmbeddingProvider
+
+
+def normalizeQuery(text: str) -> str:
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return text.rstrip("?!. ")
+
+
+class _SqliteTier:
+    """
+    Content-addressed on-disk tier shared by workers; vectors are stored as packed
+    float32. Entries do not expire, since a model's embedding of a given text is
+    stable, but the table is capped at `max_rows` (0 for no cap): once over it, the
+    least recently used rows are deleted down to 90% of the cap, and SQLite reuses
+    their pages so the file stops growing. last_used is refreshed at most every
+    _TOUCH_SECONDS so hits do not turn into a write each.
+    """
+
+    _TOUCH_SECONDS = 600
+
+    def __init__(self, path: str, max_rows: int = 0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_rows = max_rows
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "last_used" not in columns:
+            # Stores written before eviction existed start out ordered by when rows were added.
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            self._conn.execute("UPDATE embeddings SET last_used = created_at")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # Estimate of the row count (other workers write too); recounted before evicting.
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        now = time.time()
+        stale: list[str] = []
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, last_used FROM embeddings WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+                    if now - last_used > self._TOUCH_SECONDS:
+                        stale.append(key)
+            if stale:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in stale])
+                self._conn.commit()
+        return found
+
+    def put_many(self, items: dict[str, np.ndarray]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at, last_used) VALUES (?, ?, ?, ?)",
+                [(key, np.asarray(vec, dtype=np.float32).tobytes(), now, now) for key, vec in items.items()],
+            )
+            self._rows += len(items)
+            if self.max_rows and self._rows > self.max_rows:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._rows - int(self.max_rows * 0.9)
+        if self._rows <= self.max_rows or excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._rows -= excess
+        self.evicted += excess
+
+
+class EmbeddingCache:
+    """
+    In-process LRU with TTL, backed by a persistent SQLite store shared between
+    workers (EMBED_CACHE_DB, empty to disable). Keys combine the embedding model
+    with the text, so re-uploaded rows resolve to their existing vectors. Entries
+    are float32 arrays, 4 bytes per dimension.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: str | None = None, db_max_rows: int = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._disk = _SqliteTier(db_path, db_max_rows) if db_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds
+
+    def _remember(self, key: str, vec: np.ndarray, now: float):
+        self._entries[key] = (now, vec)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        now = time.time()
+        found: dict[str, np.ndarray] = {}
+        missing: list[str] = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[0], now):
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                missing.append(key)
+        self.hits += len(found)
+
+        if missing and self._disk is not None:
+            from_disk = await run_in_threadpool(self._disk.get_many, missing)
+            for key, vec in from_disk.items():
+                self._remember(key, vec, now)
+            found.update(from_disk)
+            self.disk_hits += len(from_disk)
+
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def put_many(self, items: dict[str, np.ndarray]):
+        if not items:
+            return
+        now = time.time()
+        for key, vec in items.items():
+            # A copy, so a cached row does not pin the whole provider batch in memory.
+            self._remember(key, np.array(vec, dtype=np.float32), now)
+        if self._disk is not None:
+            await run_in_threadpool(self._disk.put_many, items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "disk_evictions": self._disk.evicted if self._disk is not None else None,
+        }
+
+
+_cache: Optional[EmbeddingCache] = None
+
+
+def getEmbeddingCache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(
+            max_entries=int(os.getenv("EMBED_CACHE_SIZE", "10000")),
+            ttl_seconds=float(os.getenv("EMBED_CACHE_TTL_SECONDS", "86400")),
+            db_path=os.getenv("EMBED_CACHE_DB", "./data/embeddings.sqlite") or None,
+            db_max_rows=int(os.getenv("EMBED_CACHE_DB_MAX_ROWS", "500000")),
+        )
+    return _cache
+
+
+async def embedTexts(
+    texts: list[str], normalize: bool = False, interactive: bool = False, model_id: Optional[str] = None
+) -> np.ndarray:
+    """
+    Embeds texts into a float32 (len(texts), dim) array through the cache. Only texts that miss (deduplicated within the
+    call) reach the EmbeddingProvider for `model_id`, the model of the collection the
+    vectors are for (the configured provider by default). Use normalize=True for user
+    queries so trivially different phrasings share an entry; ingested rows are
+    keyed verbatim. interactive=True keeps chat queries out of the upload queue.
+    """
+    cache = getEmbeddingCache()
+    provider = getEmbeddingProvider(model_id)
+    model = provider.model_id
+    keys = [cache.key(model, normalizeQuery(t) if normalize else t) for t in texts]
+    found = await cache.get_many(list(dict.fromkeys(keys)))
+
+    pending: dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in pending:
+            pending[key] = text
+    if pending:
+        vectors = await provider.embed(list(pending.values()), interactive=interactive)
+        fresh = dict(zip(pending.keys(), vectors))
+        await cache.put_many(fresh)
+        found.update(fresh)
+
+    if not keys:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack([found[key] for key in keys])
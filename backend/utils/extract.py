@@ -1,73 +1,250 @@
 import io
+import os
 import csv
+import itertools
 import json
-from typing import List
+from typing import BinaryIO, Iterator, List, Optional, TextIO
+
+import numpy as np
+
 from utils.clients import getChatModelName
 from utils.clients import getAsyncOpenai
+from utils.filters import filtersFromArgs, parsePropertyFilters
 
-def _autodetect_and_convert(value: str):
-    if not isinstance(value, str):
-        return value
-    val_lower = value.strip().lower()
-    if val_lower == "true":
-        return True
-    if val_lower == "false":
-        return False
-    try:
-        return int(value.strip())
-    except (ValueError, TypeError):
-        pass
+JSON_READ_CHUNK_CHARS = 64 * 1024
+CSV_BLOCK_ROWS = 8192
+CSV_MAX_SCALAR_CHARS = 64
+
+
+# CSV columns get one type for the whole file, settled on the first
+# CSV_SCHEMA_SAMPLE_ROWS rows and applied to CSV_BLOCK_ROWS rows at a time with
+# vectorised NumPy casts. A later value that does not fit widens its column
+# (bool -> str, int -> float -> str) for the rest of the file.
+CSV_TYPES = ("bool", "int", "float", "str")
+_WIDER = {"bool": "str", "int": "float", "float": "str"}
+
+
+def _convert_column(values: np.ndarray, kind: str) -> list:
+    """Casts stripped, non-empty cell values to `kind`; raises ValueError if any does not fit."""
+    if kind == "bool":
+        lowered = np.char.lower(values)
+        is_true = lowered == "true"
+        if not np.all(is_true | (lowered == "false")):
+            raise ValueError("not a boolean column")
+        return is_true.tolist()
     try:
-        return float(value.strip())
-    except (ValueError, TypeError):
-        pass
-    return value
+        return values.astype(np.int64 if kind == "int" else np.float64).tolist()
+    except OverflowError as e:
+        raise ValueError(str(e)) from e
+
 
+def _infer_column_type(values: np.ndarray) -> str:
+    for kind in CSV_TYPES[:-1]:
+        try:
+            _convert_column(values, kind)
+            return kind
+        except ValueError:
+            pass
+    return "str"
 
-def extractDataFromFile(filename: str, content_type: str, raw_bytes: bytes) -> List[dict]:
+
+def _column_cells(key: str, raw: tuple[str, ...], schema: dict) -> list:
+    """One block's cells of a CSV column converted to the column's type, None where empty."""
+    kind = schema.get(key)
+    # Long text cannot be a scalar and would make the fixed-width array needlessly large.
+    if kind != "str" and max(map(len, raw)) <= CSV_MAX_SCALAR_CHARS:
+        stripped = np.char.strip(np.array(raw, dtype=str))
+        present = stripped != ""
+        values = stripped[present]
+        if not values.size:
+            return [None] * len(raw)
+        if kind is None:
+            kind = _infer_column_type(values)
+        while kind != "str":
+            try:
+                converted = _convert_column(values, kind)
+            except ValueError:
+                kind = _WIDER[kind]
+                continue
+            schema[key] = kind
+            column = np.full(len(raw), None, dtype=object)
+            column[present] = converted
+            return column.tolist()
+    schema[key] = "str"
+    # Text keeps its original spacing, as the row-by-row parser did.
+    return [value if value.strip() else None for value in raw]
+
+
+def _convert_block(header: list[str], block: list[list[str]], schema: dict) -> Iterator[dict]:
+    """Converts a block of raw CSV records column by column; empty cells are left out of the row."""
+    # Short records are padded; cells beyond the header are dropped by the zip.
+    columns = [
+        _column_cells(key, raw, schema) for key, raw in zip(header, itertools.zip_longest(*block, fillvalue=""))
+    ]
+    for values in zip(*columns):
+        row = {key: value for key, value in zip(header, values) if value is not None}
+        if row:
+            yield row
+
+
+def _is_csv(filename: str, content_type: str) -> bool:
     name = (filename or "").lower()
     ctype = (content_type or "").lower()
+    return ctype in ("text/csv", "application/csv", "application/vnd.ms-excel") or name.endswith(".csv")
+
 
-    if ctype in ("text/csv", "application/csv", "application/vnd.ms-excel") or name.endswith(".csv"):
-        stream = io.StringIO(raw_bytes.decode("utf-8"))
-        reader = csv.DictReader(stream)
-        data_list: List[dict] = []
-        for row in reader:
-            processed_row = {
-                key: _autodetect_and_convert(value) for key, value in (row or {}).items() if value is not None and value.strip() != ""
-            }
-            if processed_row:
-                data_list.append(processed_row)
-        return data_list
+def _process_json_item(item) -> dict:
+    if isinstance(item, dict):
+        return item
+    return {"text": str(item)}
 
+
+def _iter_csv_rows(stream: BinaryIO, schema: Optional[dict] = None) -> Iterator[dict]:
+    schema = {} if schema is None else schema
+    sample_rows = max(1, int(os.getenv("CSV_SCHEMA_SAMPLE_ROWS", "10000")))
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8", newline="")
     try:
-        data = json.loads(raw_bytes.decode("utf-8"))
-    except Exception as e:
-        raise ValueError("Unsupported or invalid file. Provide CSV or JSON.") from e
-
-    data_list: List[dict] = []
-    
-    items_to_process = []
-    if isinstance(data, list):
-        items_to_process = data
-    elif isinstance(data, dict) and isinstance(data.get("items"), list):
-        items_to_process = data["items"]
-    elif isinstance(data, dict):
-        return [data]
-
-    for item in items_to_process:
-        if isinstance(item, dict):
-            data_list.append(item)
-        else:
-            data_list.append({"text": str(item)})
-    
-    if not data_list and not items_to_process and isinstance(data, dict):
-         raise ValueError("Unsupported JSON structure. Expected a list of objects, a dictionary with an 'items' list, or a single object dictionary.")
-
-    return data_list
+        reader = csv.reader(text_stream)
+        header = next(reader, None)
+        if not header:
+            return
+        block: list[list[str]] = []
+        # The first block is the schema sample; later blocks only convert.
+        limit = sample_rows
+        for record in reader:
+            if record:
+                block.append(record)
+            if len(block) >= limit:
+                yield from _convert_block(header, block, schema)
+                block = []
+                limit = CSV_BLOCK_ROWS
+        if block:
+            yield from _convert_block(header, block, schema)
+    finally:
+        # Hand the underlying spool back to the caller instead of closing it.
+        text_stream.detach()
+
+
+def _iter_json_array(text_stream: TextIO, buf: str, pos: int) -> Iterator:
+    decoder = json.JSONDecoder()
+    eof = False
+
+    def refill() -> bool:
+        nonlocal buf, pos, eof
+        chunk = text_stream.read(JSON_READ_CHUNK_CHARS)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    # Values and commas must alternate as json.loads requires: "[1,,2]", "[,1]" and
+    # "[1,]" are rejected rather than read as [1, 2] and [1].
+    expect_value = True
+    first = True
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos >= len(buf):
+            if not refill():
+                raise ValueError("Unsupported or invalid file. Provide CSV or JSON.")
+            continue
+        if not expect_value:
+            if buf[pos] == "]":
+                return
+            if buf[pos] != ",":
+                raise ValueError("Unsupported or invalid file. Provide CSV or JSON.")
+            pos += 1
+            expect_value = True
+            continue
+        if buf[pos] == "]" and first:
+            return
+        if buf[pos] in ",]":
+            raise ValueError("Unsupported or invalid file. Provide CSV or JSON.")
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if refill():
+                continue
+            raise ValueError("Unsupported or invalid file. Provide CSV or JSON.") from e
+        # Only accept a value once its delimiter is buffered; otherwise it may be a
+        # truncated number such as "15" out of "1500.0".
+        delim = end
+        while delim < len(buf) and buf[delim].isspace():
+            delim += 1
+        if delim >= len(buf) or buf[delim] not in ",]":
+            if refill():
+                continue
+            raise ValueError("Unsupported or invalid file. Provide CSV or JSON.")
+        pos = end
+        expect_value = False
+        first = False
+        yield item
+
+
+def _iter_json_rows(stream: BinaryIO) -> Iterator[dict]:
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8")
+    try:
+        head = ""
+        while True:
+            chunk = text_stream.read(JSON_READ_CHUNK_CHARS)
+            if not chunk:
+                break
+            head += chunk
+            if head.strip():
+                break
+        stripped = head.lstrip()
+        if stripped.startswith("["):
+            offset = len(head) - len(stripped) + 1
+            for item in _iter_json_array(text_stream, head, offset):
+                yield _process_json_item(item)
+            return
+
+        # Object-rooted documents ({"items": [...]} or a single object) are loaded whole.
+        try:
+            data = json.loads(head + text_stream.read())
+        except Exception as e:
+            raise ValueError("Unsupported or invalid file. Provide CSV or JSON.") from e
+        if isinstance(data, dict) and isinstance(data.get("items"), list):
+            for item in data["items"]:
+                yield _process_json_item(item)
+        elif isinstance(data, dict):
+            yield data
+    finally:
+        text_stream.detach()
+
+
+def iterDataFromFile(
+    filename: str, content_type: str, stream: BinaryIO, schema: Optional[dict] = None
+) -> Iterator[dict]:
+    """
+    Incrementally parses rows from a binary file object (e.g. an UploadFile spool)
+    without loading the whole upload into memory.
+    For CSV files, `schema` is filled with the type inferred for each column
+    (one of CSV_TYPES) as soon as the first block has been read.
+    """
+    if _is_csv(filename, content_type):
+        return _iter_csv_rows(stream, schema)
+    return _iter_json_rows(stream)
+
+
+def extractDataFromFile(
+    filename: str, content_type: str, raw_bytes: bytes, schema: Optional[dict] = None
+) -> List[dict]:
+    return list(iterDataFromFile(filename, content_type, io.BytesIO(raw_bytes), schema))
 
 	
-async def getStructuredVectorQuery(query: str) -> list[dict]:
+async def getStructuredVectorQuery(query: str, use_rules: bool = True) -> list[dict]:
+    """
+    Turns a user query into Chroma metadata filters. The rule-based parser answers
+    first; the tool-calling model is only consulted when its confidence is below
+    FILTER_RULES_MIN_CONFIDENCE.
+    """
+    if use_rules:
+        args, confidence = parsePropertyFilters(query)
+        if confidence >= float(os.getenv("FILTER_RULES_MIN_CONFIDENCE", "0.75")):
+            return filtersFromArgs(args)
 
     client = getAsyncOpenai()
     model = getChatModelName()
@@ -122,30 +299,7 @@ async def getStructuredVectorQuery(query: str) -> list[dict]:
                 function_name = tool_call.function.name
                 if function_name == "get_property_filters":
                     args = json.loads(tool_call.function.arguments)
-                    if "bedrooms_min" in args:
-                        filters.append({"bedrooms": {"$gte": args["bedrooms_min"]}})
-                    if "bedrooms_max" in args:
-                        filters.append({"bedrooms": {"$lte": args["bedrooms_max"]}})
-                    if "bathrooms_min" in args:
-                        filters.append({"bathrooms": {"$gte": args["bathrooms_min"]}})
-                    if "bathrooms_max" in args:
-                        filters.append({"bathrooms": {"$lte": args["bathrooms_max"]}})
-                    if "price_min" in args:
-                        filters.append({"price": {"$gte": args["price_min"]}})
-                    if "price_max" in args:
-                        filters.append({"price": {"$lte": args["price_max"]}})
-                    if "property_type" in args:
-                        filters.append({"property_type_full_description": {"$eq": args["property_type"]}})
-                    if "is_new_home" in args:
-                        filters.append({"is_new_home": {"$eq": args["is_new_home"]}})
-                    if "crime_score_weight_min" in args:
-                        filters.append({"crime_score_weight": {"$gte": args["crime_score_weight_min"]}})
-                    if "crime_score_weight_max" in args:
-                        filters.append({"crime_score_weight": {"$lte": args["crime_score_weight_max"]}})
-                    if "flood_risk" in args:
-                        filters.append({"flood_risk": {"$eq": args["flood_risk"]}})
-                    if "laua" in args:
-                        filters.append({"laua": {"$eq": args["laua"]}})
+                    filters.extend(filtersFromArgs(args))
         return filters
     except Exception as e:
         print(f"Error extracting filters from query: {e}")
@@ -0,0 +1,215 @@
+import re
+
+
+# Arguments produced here use the same names as the get_property_filters tool schema
+# in utils/extract.py, so both paths share filtersFromArgs.
+
+_NUM_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+_COUNT = r"(\d+|one|two|three|four|five|six|seven|eight|nine|ten)"
+_ROOM_WORDS = {
+    "bedrooms": r"(?:bed(?:room)?s?|br|bdrm?s?)\b",
+    "bathrooms": r"(?:bath(?:room)?s?|ba)\b",
+}
+_MONEY = r"[£$]?\s*(\d+(?:\.\d+)?)\s*(k|m|mn|mil|million|thousand|grand)?\b"
+_NOT_ROOMS = r"(?!\s*-?\s*(?:bed|bath|br\b|bdrm|ba\b))"
+_MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "grand": 1_000, "m": 1_000_000, "mn": 1_000_000, "mil": 1_000_000, "million": 1_000_000}
+
+_PROPERTY_TYPES = [
+    (r"\bsemi[\s-]?detached(?:\s+(?:houses?|homes?))?\b", "Semi-detached house"),
+    (r"\bend[\s-]+(?:of[\s-]+)?terraced?(?:\s+(?:houses?|homes?))?\b", "End of terrace house"),
+    (r"\bdetached(?:\s+(?:houses?|homes?))?\b", "Detached house"),
+    (r"\bterraced?(?:\s+(?:houses?|homes?))?\b", "Terraced house"),
+    (r"\b(?:flats?|apartments?)\b", "Flat"),
+    (r"\bbungalows?\b", "Bungalow"),
+    (r"\bmaisonettes?\b", "Maisonette"),
+]
+_FLOOD_LEVEL = r"(very\s+low|low|medium|moderate|high)"
+_FLOOD_VALUES = {"very low": "Very Low", "low": "Low", "medium": "Medium", "moderate": "Medium", "high": "High"}
+
+# Anything filter-like left over after the rules ran means the rules did not
+# understand the whole query and the LLM should have a go.
+_RESIDUAL_CUES = re.compile(
+    r"\d|£|\$|\bbed|\bbath|\bpric|\bcheap|\bexpensive|\bafford|\bbudget|\bcost|\bcrime|\bsafe"
+    r"|\bflood|\bnew\b|\bmillion\b|\bthousand\b|\bgrand\b|\bbetween\b"
+)
+_POSTCODE = re.compile(r"\b[a-z]{1,2}\d[a-z\d]?\s*\d[a-z]{2}\b")
+
+
+def _count(token: str) -> int:
+    return _NUM_WORDS.get(token, None) or int(token)
+
+
+def _money(amount: str, unit: str | None) -> float:
+    value = float(amount) * _MULTIPLIERS.get((unit or "").strip(), 1)
+    return int(value) if value.is_integer() else value
+
+
+def _is_price(match: re.Match, amount_group: int) -> bool:
+    text = match.group(0)
+    unit = match.group(amount_group + 1)
+    return bool(unit) or "£" in text or "$" in text or float(match.group(amount_group)) >= 1000
+
+
+class _Masked:
+    """Query text where consumed spans are blanked out so later rules cannot re-match them."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def consume(self, match: re.Match):
+        start, end = match.span()
+        self.text = self.text[:start] + " " * (end - start) + self.text[end:]
+
+
+def _parse_rooms(masked: _Masked, field: str, args: dict):
+    rooms = _ROOM_WORDS[field]
+    sep = r"\s*(?:-\s*)?"
+    patterns = [
+        (rf"\b(?:between\s+)?{_COUNT}\s*(?:-|to|and|or)\s*{_COUNT}{sep}{rooms}", lambda m: (_count(m[1]), _count(m[2]))),
+        (rf"\b(?:at\s+least|min(?:imum)?(?:\s+of)?)\s+{_COUNT}{sep}{rooms}", lambda m: (_count(m[1]), None)),
+        (rf"\b{_COUNT}\s*(?:\+|or\s+more|plus){sep}{rooms}", lambda m: (_count(m[1]), None)),
+        (rf"\b{_COUNT}{sep}{rooms}\s*(?:\+|or\s+more|plus|minimum)", lambda m: (_count(m[1]), None)),
+        (rf"\b(?:up\s+to|at\s+most|max(?:imum)?(?:\s+of)?|no\s+more\s+than)\s+{_COUNT}{sep}{rooms}", lambda m: (None, _count(m[1]))),
+        (rf"\b(?:more\s+than|over)\s+{_COUNT}{sep}{rooms}", lambda m: (_count(m[1]) + 1, None)),
+        (rf"\b{_COUNT}{sep}{rooms}\s*(?:or\s+(?:less|fewer)|max(?:imum)?)", lambda m: (None, _count(m[1]))),
+        (rf"\b(?:fewer\s+than|less\s+than|under)\s+{_COUNT}{sep}{rooms}", lambda m: (None, _count(m[1]) - 1)),
+        (rf"\b{_COUNT}{sep}{rooms}", lambda m: (_count(m[1]), _count(m[1]))),
+    ]
+    for pattern, handler in patterns:
+        for match in re.finditer(pattern, masked.text):
+            low, high = handler(match)
+            if low is not None:
+                args[f"{field}_min"] = low
+            if high is not None:
+                args[f"{field}_max"] = high
+            masked.consume(match)
+
+
+def _parse_price(masked: _Masked, args: dict):
+    patterns = [
+        (rf"(?<![\w.])(?:between\s+)?{_MONEY}\s*(?:-|to|and)\s*{_MONEY}{_NOT_ROOMS}", "range"),
+        (rf"\b(?:under|below|less\s+than|cheaper\s+than|up\s+to|max(?:imum)?|no\s+more\s+than|at\s+most|within|budget(?:\s+of)?)\s*{_MONEY}{_NOT_ROOMS}", "max"),
+        (rf"(?:<=?)\s*{_MONEY}{_NOT_ROOMS}", "max"),
+        (rf"{_MONEY}\s*(?:or\s+(?:less|under|below)|max(?:imum)?)\b", "max"),
+        (rf"\b(?:over|above|more\s+than|at\s+least|min(?:imum)?|from|starting\s+(?:at|from))\s*{_MONEY}{_NOT_ROOMS}", "min"),
+        (rf"(?:>=?)\s*{_MONEY}{_NOT_ROOMS}", "min"),
+        (rf"{_MONEY}\s*(?:\+|or\s+(?:more|over|above))", "min"),
+    ]
+    for pattern, kind in patterns:
+        for match in re.finditer(pattern, masked.text):
+            if kind == "range":
+                if not (_is_price(match, 1) or _is_price(match, 3)):
+                    continue
+                # "300-450k" shares the trailing unit across both ends.
+                low_unit = match.group(2) or match.group(4)
+                args["price_min"] = _money(match.group(1), low_unit)
+                args["price_max"] = _money(match.group(3), match.group(4))
+            else:
+                if not _is_price(match, 1):
+                    continue
+                args[f"price_{kind}"] = _money(match.group(1), match.group(2))
+            masked.consume(match)
+
+
+def _parse_keywords(masked: _Masked, args: dict):
+    for pattern, value in [
+        (r"\b(?:not|no)\s+(?:a\s+)?new[\s-]?builds?\b", False),
+        (r"\b(?:not|no)\s+new\s+homes?\b", False),
+        (r"\b(?:resale|second[\s-]hand)\b", False),
+        (r"\bnew[\s-]?builds?\b", True),
+        (r"\bnewly[\s-]built\b", True),
+        (r"\bbrand[\s-]new\b", True),
+        (r"\bnew\s+(?:homes?|developments?|constructions?)\b", True),
+    ]:
+        for match in re.finditer(pattern, masked.text):
+            args["is_new_home"] = value
+            masked.consume(match)
+
+    for pattern in [
+        rf"\b{_FLOOD_LEVEL}\s+(?:flood(?:ing)?\s+risk|risk\s+of\s+flood(?:ing)?)\b",
+        rf"\bflood(?:ing)?\s+risk\s+(?:is\s+|of\s+)?{_FLOOD_LEVEL}\b",
+    ]:
+        for match in re.finditer(pattern, masked.text):
+            args["flood_risk"] = _FLOOD_VALUES[re.sub(r"\s+", " ", match.group(1))]
+            masked.consume(match)
+
+    crime = r"\bcrime(?:\s+score)?(?:\s+weight)?\s+(?:is\s+)?"
+    for pattern, field in [
+        (crime + r"(?:under|below|less\s+than|at\s+most|<=?)\s*(\d+(?:\.\d+)?)", "crime_score_weight_max"),
+        (crime + r"(?:over|above|more\s+than|at\s+least|>=?)\s*(\d+(?:\.\d+)?)", "crime_score_weight_min"),
+    ]:
+        for match in re.finditer(pattern, masked.text):
+            args[field] = float(match.group(1))
+            masked.consume(match)
+
+    for pattern, value in _PROPERTY_TYPES:
+        for match in re.finditer(pattern, masked.text):
+            args["property_type"] = value
+            masked.consume(match)
+
+
+def parsePropertyFilters(query: str) -> tuple[dict, float]:
+    """
+    Deterministic counterpart of the get_property_filters tool call.
+    Returns (tool arguments, confidence in [0, 1]); confidence drops for every
+    filter-like cue in the query that no rule accounted for.
+    """
+    text = (query or "").lower()
+    text = re.sub(r"(?<=\d),(?=\d{3}\b)", "", text)
+    masked = _Masked(text)
+    args: dict = {}
+
+    for match in re.finditer(r"\b([ensw]\d{8})\b", masked.text):
+        args["laua"] = match.group(1).upper()
+        masked.consume(match)
+    for match in _POSTCODE.finditer(masked.text):
+        masked.consume(match)
+
+    _parse_rooms(masked, "bedrooms", args)
+    _parse_rooms(masked, "bathrooms", args)
+    _parse_price(masked, args)
+    _parse_keywords(masked, args)
+
+    for field in ("bedrooms", "bathrooms", "price", "crime_score_weight"):
+        low, high = args.get(f"{field}_min"), args.get(f"{field}_max")
+        if low is not None and high is not None and low > high:
+            return args, 0.0
+
+    # Bare labels such as "price" or "budget" are explained once a price bound was found.
+    residual_text = masked.text
+    if "price_min" in args or "price_max" in args:
+        residual_text = re.sub(r"\b(?:price[sd]?|pricing|budget|costs?|costing)\b", " ", residual_text)
+    residual = len(_RESIDUAL_CUES.findall(residual_text))
+    return args, max(0.0, 1.0 - 0.5 * residual)
+
+
+def filtersFromArgs(args: dict) -> list[dict]:
+    filters = []
+    if "bedrooms_min" in args:
+        filters.append({"bedrooms": {"$gte": args["bedrooms_min"]}})
+    if "bedrooms_max" in args:
+        filters.append({"bedrooms": {"$lte": args["bedrooms_max"]}})
+    if "bathrooms_min" in args:
+        filters.append({"bathrooms": {"$gte": args["bathrooms_min"]}})
+    if "bathrooms_max" in args:
+        filters.append({"bathrooms": {"$lte": args["bathrooms_max"]}})
+    if "price_min" in args:
+        filters.append({"price": {"$gte": args["price_min"]}})
+    if "price_max" in args:
+        filters.append({"price": {"$lte": args["price_max"]}})
+    if "property_type" in args:
+        filters.append({"property_type_full_description": {"$eq": args["property_type"]}})
+    if "is_new_home" in args:
+        filters.append({"is_new_home": {"$eq": args["is_new_home"]}})
+    if "crime_score_weight_min" in args:
+        filters.append({"crime_score_weight": {"$gte": args["crime_score_weight_min"]}})
+    if "crime_score_weight_max" in args:
+        filters.append({"crime_score_weight": {"$lte": args["crime_score_weight_max"]}})
+    if "flood_risk" in args:
+        filters.append({"flood_risk": {"$eq": args["flood_risk"]}})
+    if "laua" in args:
+        filters.append({"laua": {"$eq": args["laua"]}})
+    return filters
@@ -0,0 +1,323 @@
+import hashlib
+import json
+import os
+from itertools import islice
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Iterator, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from utils.columnar import ColumnarWriter
+from utils.embeddings import embedTexts
+from utils.lexicalindex import LexicalWriter
+from utils.metrics import increment
+from utils.timing import StageTimer
+from utils.vectorstore import deleteVectors, getVectors, upsertVectors
+
+
+ProgressCallback = Callable[[dict], Awaitable[None]]
+
+
+def _take(rows: Iterator[dict], count: int) -> list[dict]:
+    return list(islice(rows, count))
+
+
+def _skip(rows: Iterator[dict], count: int) -> int:
+    return sum(1 for _ in islice(rows, count))
+
+
+def contentHash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _vector_id(chat_id: str, file_id: str, chunk_index: int) -> str:
+    return hashlib.sha256(f"{chat_id}:{file_id}:{chunk_index}".encode()).hexdigest()
+
+
+def _file_where(chat_id: str, user_id: str, file_id: str) -> dict:
+    return {
+        "$and": [
+            {"chat_id": {"$eq": chat_id}},
+            {"user_id": {"$eq": user_id}},
+            {"file_id": {"$eq": file_id}},
+        ]
+    }
+
+
+def _row_key(doc: dict, content_hash: str, key_column: Optional[str]) -> str:
+    # Without a key column a row is identified by its content, so an edit is a delete plus an add.
+    if not key_column:
+        return content_hash
+    value = doc.get(key_column)
+    return "" if value is None else str(value)
+
+
+class _Occurrences:
+    """Suffixes repeated keys with their occurrence number, so duplicates pair up in order."""
+
+    def __init__(self):
+        self.seen: dict[str, int] = {}
+
+    def __call__(self, key: str) -> str:
+        n = self.seen.get(key, 0)
+        self.seen[key] = n + 1
+        return f"{key}#{n}"
+
+
+def _build_metadata(doc: dict, text_val: str, chat_id: str, user_id: str, file_id: str, chunk_index: int, filename: str) -> dict:
+    # Columns are stored once as typed metadata; prompt text is rendered from them at query time.
+    metadata = {
+        "chat_id": chat_id,
+        "user_id": user_id,
+        "file_id": file_id,
+        "chunk_index": chunk_index,
+        "source": filename,
+        "content_hash": contentHash(text_val),
+    }
+    for key, value in doc.items():
+        metadata[key] = value
+    return metadata
+
+
+async def ingestRows(
+    rows: Iterator[dict],
+    chat_id: str,
+    user_id: str,
+    file_id: str,
+    filename: str,
+    start_index: int = 0,
+    on_progress: ProgressCallback | None = None,
+    columns: ColumnarWriter | None = None,
+    lexical: LexicalWriter | None = None,
+    timings: StageTimer | None = None,
+    embedding_model: Optional[str] = None,
+) -> int:
+    """
+    Streams rows through embed and upsert in fixed-size windows so that only one
+    window of documents, texts and vectors is resident at a time.
+
+    When resuming, the first `start_index` rows are skipped without embedding;
+    vector ids are derived from the row position so re-running a window is idempotent.
+    `on_progress` receives cumulative rows_parsed/rows_embedded/rows_upserted counts.
+    Each upserted window is also appended to `columns` and `lexical` before progress
+    is reported, so neither store lags behind rows_upserted.
+    `timings` observes the parse/embed/upsert/columnar/lexical stages of every window.
+    Rows are embedded with `embedding_model`, the model of the chat's collection.
+    Returns the number of vectors upserted by this call.
+    """
+    window_size = int(os.getenv("INGEST_WINDOW_ROWS", "2000"))
+
+    def stage(name: str):
+        return timings.stage(name) if timings is not None else nullcontext()
+
+    async def report(parsed: int, embedded: int, upserted_total: int):
+        if on_progress is not None:
+            await on_progress(
+                {"rows_parsed": parsed, "rows_embedded": embedded, "rows_upserted": upserted_total}
+            )
+
+    if start_index:
+        start_index = await run_in_threadpool(_skip, rows, start_index)
+
+    upserted = 0
+    while True:
+        # Pull the next window off the spool in a worker thread; file reads are blocking.
+        with stage("parse"):
+            documents = await run_in_threadpool(_take, rows, window_size)
+        if not documents:
+            break
+        await report(start_index + len(documents), start_index, start_index)
+        texts = [json.dumps(doc, sort_keys=True) for doc in documents]
+        with stage("embed"):
+            embeddings = await embedTexts(texts, model_id=embedding_model)
+        await report(start_index + len(documents), start_index + len(documents), start_index)
+
+        ids = []
+        metadatas = []
+        for j, doc in enumerate(documents):
+            chunk_index = start_index + j
+            ids.append(_vector_id(chat_id, file_id, chunk_index))
+            metadatas.append(_build_metadata(doc, texts[j], chat_id, user_id, file_id, chunk_index, filename))
+
+        with stage("upsert"):
+            await upsertVectors(ids, embeddings, metadatas)
+        if columns is not None:
+            with stage("columnar"):
+                await run_in_threadpool(columns.append, documents)
+        if lexical is not None:
+            with stage("lexical"):
+                await run_in_threadpool(lexical.append, documents)
+
+        upserted += len(ids)
+        increment("rag_ingest_rows_total", len(ids))
+        start_index += len(documents)
+        await report(start_index, start_index, start_index)
+
+    return upserted
+
+
+async def linkExistingFile(
+    source_chat_id: str,
+    source_user_id: str,
+    source_file_id: str,
+    chat_id: str,
+    user_id: str,
+    file_id: str,
+    filename: str,
+    start_index: int = 0,
+    on_progress: ProgressCallback | None = None,
+) -> int:
+    """
+    Copies the vectors of an identical, already-ingested upload into a new chat
+    without any embedding calls. Returns the number of vectors copied.
+    """
+    page_size = int(os.getenv("CHROMA_UPSERT_BATCH", "100")) * 10
+    where = _file_where(source_chat_id, source_user_id, source_file_id)
+    copied = 0
+    offset = start_index
+    while True:
+        page = await getVectors(where, limit=page_size, offset=offset)
+        source_ids = page.get("ids") or []
+        if not source_ids:
+            break
+        ids = []
+        metadatas = []
+        for meta in page["metadatas"]:
+            metadata = dict(meta)
+            metadata.update({"chat_id": chat_id, "user_id": user_id, "file_id": file_id, "source": filename})
+            ids.append(_vector_id(chat_id, file_id, metadata["chunk_index"]))
+            metadatas.append(metadata)
+        await upsertVectors(ids, page["embeddings"], metadatas)
+        copied += len(ids)
+        offset += len(ids)
+        if on_progress is not None:
+            await on_progress({"rows_parsed": offset, "rows_embedded": offset, "rows_upserted": offset})
+    return copied
+
+
+async def loadFileRows(
+    chat_id: str, user_id: str, file_id: str, key_column: Optional[str]
+) -> tuple[dict[str, tuple[int, str]], int, set[str]]:
+    """
+    The stored rows of a file as row key -> (chunk_index, content_hash), read from
+    the vector metadata without embeddings, the next unused chunk_index and the
+    metadata fields the file's rows carry.
+    """
+    page_size = int(os.getenv("CHROMA_UPSERT_BATCH", "100")) * 10
+    where = _file_where(chat_id, user_id, file_id)
+    stored = []
+    fields: set[str] = set()
+    offset = 0
+    while True:
+        page = await getVectors(where, limit=page_size, offset=offset, include=["metadatas"])
+        metadatas = page.get("metadatas") or []
+        if not metadatas:
+            break
+        for meta in metadatas:
+            fields.update(meta)
+            stored.append((meta["chunk_index"], _row_key(meta, meta.get("content_hash", ""), key_column), meta.get("content_hash")))
+        offset += len(metadatas)
+    # Duplicate keys are numbered in row order, as refreshRows numbers the upload.
+    stored.sort()
+    occurrence = _Occurrences()
+    rows = {occurrence(key): (chunk_index, content_hash) for chunk_index, key, content_hash in stored}
+    return rows, (stored[-1][0] + 1 if stored else 0), fields
+
+
+async def refreshRows(
+    rows: Iterator[dict],
+    chat_id: str,
+    user_id: str,
+    file_id: str,
+    filename: str,
+    existing: dict[str, tuple[int, str]],
+    next_index: int,
+    fields: set[str],
+    key_column: Optional[str] = None,
+    on_progress: ProgressCallback | None = None,
+    columns: ColumnarWriter | None = None,
+    lexical: LexicalWriter | None = None,
+    timings: StageTimer | None = None,
+    embedding_model: Optional[str] = None,
+) -> dict:
+    """
+    Applies a new version of an ingested file as a row-level diff against `existing`
+    (from loadFileRows). Rows are matched by `key_column` and compared by content
+    hash: only new or changed rows are embedded and upserted, changed rows over their
+    old vector ids with every field of `fields` they no longer have set to None (which
+    the stores treat as absent), and rows missing from the upload are deleted in bulk
+    at the end.
+    Kept rows retain their chunk_index and new rows take indexes from `next_index`,
+    so `columns` (which records them as slots) and `lexical` can be rebuilt in upload
+    order. `existing` is consumed. Rows are embedded with `embedding_model`, as in
+    ingestRows. Returns the rows, embedded, unchanged and deleted counts.
+    """
+    window_size = int(os.getenv("INGEST_WINDOW_ROWS", "2000"))
+    occurrence = _Occurrences()
+    counts = {"rows": 0, "embedded": 0, "unchanged": 0, "deleted": 0}
+
+    def stage(name: str):
+        return timings.stage(name) if timings is not None else nullcontext()
+
+    async def report():
+        if on_progress is not None:
+            await on_progress(
+                {
+                    "rows_parsed": counts["rows"],
+                    "rows_embedded": counts["embedded"],
+                    "rows_upserted": counts["embedded"],
+                    "rows_unchanged": counts["unchanged"],
+                    "rows_deleted": counts["deleted"],
+                }
+            )
+
+    while True:
+        with stage("parse"):
+            documents = await run_in_threadpool(_take, rows, window_size)
+        if not documents:
+            break
+        with stage("diff"):
+            texts = [json.dumps(doc, sort_keys=True) for doc in documents]
+            slots = []
+            changed = []
+            for j, (doc, text) in enumerate(zip(documents, texts)):
+                content_hash = contentHash(text)
+                previous = existing.pop(occurrence(_row_key(doc, content_hash, key_column)), None)
+                if previous is None:
+                    slots.append(next_index)
+                    next_index += 1
+                    changed.append(j)
+                else:
+                    slots.append(previous[0])
+                    if previous[1] != content_hash:
+                        changed.append(j)
+        counts["rows"] += len(documents)
+        counts["unchanged"] += len(documents) - len(changed)
+
+        if changed:
+            with stage("embed"):
+                embeddings = await embedTexts([texts[j] for j in changed], model_id=embedding_model)
+            ids = [_vector_id(chat_id, file_id, slots[j]) for j in changed]
+            metadatas = []
+            for j in changed:
+                metadata = _build_metadata(documents[j], texts[j], chat_id, user_id, file_id, slots[j], filename)
+                # Chroma merges upserted metadata into the stored record.
+                metadatas.append({**dict.fromkeys(fields), **metadata})
+            with stage("upsert"):
+                await upsertVectors(ids, embeddings, metadatas)
+            counts["embedded"] += len(changed)
+            increment("rag_ingest_rows_total", len(changed))
+        if columns is not None:
+            with stage("columnar"):
+                await run_in_threadpool(columns.append, documents, slots)
+        if lexical is not None:
+            with stage("lexical"):
+                await run_in_threadpool(lexical.append, documents)
+        await report()
+
+    if existing:
+        with stage("delete"):
+            ids = [_vector_id(chat_id, file_id, chunk_index) for chunk_index, _ in existing.values()]
+            counts["deleted"] = await deleteVectors(ids, _file_where(chat_id, user_id, file_id))
+        await report()
+    return counts
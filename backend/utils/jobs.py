@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from db.models import Chat, ChatFile, IngestionJob
+from utils.columnar import ColumnarWriter, copyFileColumns, replaceFileColumns
+from utils.extract import iterDataFromFile
+from utils.ingest import ingestRows, linkExistingFile, loadFileRows, refreshRows
+from utils.lexicalindex import LexicalWriter, copyFileLexical, replaceFileLexical
+from utils.retrievalcache import getRetrievalCache
+from utils.timing import StageTimer
+from utils.vectorstore import embeddingModelFor
+
+
+_queue: Optional[asyncio.Queue] = None
+_workers: list[asyncio.Task] = []
+
+
+def getUploadDir() -> str:
+    return os.getenv("INGEST_UPLOAD_DIR", "./uploads")
+
+
+def _copy_upload(src, dest_path: str) -> tuple[int, str]:
+    """Copies the spool to disk, hashing it on the way for file-level deduplication."""
+    src.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    with open(dest_path, "wb") as dest:
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dest.write(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+async def createIngestionJob(
+    chat: Chat,
+    file: UploadFile,
+    filename: str,
+    file_id: Optional[str] = None,
+    key_column: Optional[str] = None,
+) -> IngestionJob:
+    """
+    Persists the upload spool to INGEST_UPLOAD_DIR and queues a job for it.
+    The file must outlive the request so the job can be resumed after a restart.
+    With `file_id` the job refreshes that file of the chat instead of adding one.
+    """
+    upload_dir = getUploadDir()
+    os.makedirs(upload_dir, exist_ok=True)
+    job_id = uuid.uuid4()
+    upload_path = os.path.join(upload_dir, f"{job_id}.upload")
+    bytes_total, content_hash = await run_in_threadpool(_copy_upload, file.file, upload_path)
+    job = await IngestionJob.create(
+        id=job_id,
+        chat=chat,
+        file_id=file_id or str(uuid.uuid4()),
+        refresh=file_id is not None,
+        key_column=key_column,
+        filename=filename,
+        content_type=file.content_type or "",
+        upload_path=upload_path,
+        content_hash=content_hash,
+        bytes_total=bytes_total,
+    )
+    await enqueueJob(job.id)
+    return job
+
+
+async def enqueueJob(job_id) -> None:
+    if _queue is None:
+        raise RuntimeError("Ingestion workers are not running")
+    await _queue.put(str(job_id))
+
+
+async def _run_job(job_id: str) -> None:
+    job = await IngestionJob.get_or_none(id=job_id).prefetch_related("chat")
+    if job is None or job.status in ("COMPLETED", "FAILED"):
+        return
+
+    job.status = "RUNNING"
+    job.started_at = datetime.now(timezone.utc)
+    # A refresh re-diffs from the start; rows it already applied then compare unchanged.
+    job.resumed_from = 0 if job.refresh else job.rows_upserted
+    job.resumed_from_bytes = 0 if job.refresh else job.bytes_read
+    job.error = None
+    await job.save(update_fields=["status", "started_at", "resumed_from", "resumed_from_bytes", "error"])
+
+    chat_id = str(job.chat.id)
+    user_id = str(job.chat.user_id)
+    timings = StageTimer("ingest")
+    try:
+        # Rows are embedded with the model of the collection the chat's vectors live in.
+        embedding_model = await embeddingModelFor(chat_id, user_id)
+        if job.refresh:
+            await _refresh_file(job, chat_id, user_id, embedding_model, timings)
+            return
+        linked = 0
+        # An identical upload the same user already embedded with the same model is linked,
+        # not re-embedded. Other users' files are never linked, so a fast upload reveals
+        # nothing about what anyone else uploaded.
+        source = None
+        if job.content_hash:
+            source = (
+                await ChatFile.filter(
+                    content_hash=job.content_hash, embedding_model=embedding_model, chat__user_id=job.chat.user_id
+                )
+                .exclude(chat_id=job.chat_id)
+                .order_by("-created_at")
+                .prefetch_related("chat")
+                .first()
+            )
+        if source is not None:
+
+            async def on_link_progress(counts: dict):
+                await IngestionJob.filter(id=job.id).update(**counts)
+
+            with timings.stage("link"):
+                linked = await linkExistingFile(
+                    str(source.chat_id),
+                    str(source.chat.user_id),
+                    source.file_id,
+                    chat_id,
+                    user_id,
+                    job.file_id,
+                    job.filename,
+                    start_index=job.rows_upserted,
+                    on_progress=on_link_progress,
+                )
+            if linked:
+                await run_in_threadpool(copyFileColumns, str(source.chat_id), source.file_id, chat_id, job.file_id)
+                await run_in_threadpool(copyFileLexical, str(source.chat_id), source.file_id, chat_id, job.file_id)
+                print(f"Ingestion job {job.id} linked {linked} vectors from file {source.file_id}")
+
+        if linked:
+            rows = job.rows_upserted + linked
+        else:
+            # Row vectors still resolve through the persistent content-hash store in embedTexts.
+            columns = await run_in_threadpool(ColumnarWriter, chat_id, job.file_id, job.rows_upserted)
+            lexical = await run_in_threadpool(LexicalWriter, chat_id, job.file_id, job.rows_upserted)
+            schema: dict = {}
+            with open(job.upload_path, "rb") as f:
+
+                async def on_progress(counts: dict):
+                    await IngestionJob.filter(id=job.id).update(
+                        bytes_read=f.tell(), inferred_schema=dict(schema) or None, **counts
+                    )
+
+                rows = job.rows_upserted + await ingestRows(
+                    iterDataFromFile(job.filename, job.content_type or "", f, schema),
+                    chat_id,
+                    user_id,
+                    job.file_id,
+                    job.filename,
+                    start_index=job.rows_upserted,
+                    on_progress=on_progress,
+                    columns=columns,
+                    lexical=lexical,
+                    timings=timings,
+                    embedding_model=embedding_model,
+                )
+            await run_in_threadpool(columns.finalize)
+            await run_in_threadpool(lexical.finalize)
+
+        if job.content_hash:
+            await ChatFile.create(
+                chat_id=job.chat_id,
+                file_id=job.file_id,
+                filename=job.filename,
+                content_hash=job.content_hash,
+                embedding_model=embedding_model,
+                rows=rows,
+                key_column=job.key_column,
+            )
+        await _complete_job(job, chat_id)
+        timings.finish(job_id=str(job.id), chat_id=chat_id, rows=rows, linked=bool(linked), outcome="completed")
+    except Exception as e:
+        print(f"Ingestion job {job.id} failed: {e}")
+        timings.finish(job_id=str(job.id), chat_id=chat_id, outcome="failed", error=str(e))
+        await IngestionJob.filter(id=job.id).update(
+            status="FAILED", error=str(e), finished_at=datetime.now(timezone.utc)
+        )
+
+
+async def _complete_job(job: IngestionJob, chat_id: str) -> None:
+    await IngestionJob.filter(id=job.id).update(
+        status="COMPLETED", bytes_read=job.bytes_total, finished_at=datetime.now(timezone.utc)
+    )
+    # The file's column store only becomes queryable once finalised.
+    await getRetrievalCache().invalidate(chat_id)
+    try:
+        os.remove(job.upload_path)
+    except OSError:
+        pass
+
+
+async def _refresh_file(
+    job: IngestionJob, chat_id: str, user_id: str, embedding_model: str, timings: StageTimer
+) -> None:
+    """
+    Applies the upload as a new version of the chat's file job.file_id: only rows that
+    are new or changed (by key column and content hash) are embedded, and rows no
+    longer present are deleted. The column store and lexical index are rebuilt under
+    a staging id and swapped in once complete.
+    """
+    chat_file = await ChatFile.get_or_none(chat_id=job.chat_id, file_id=job.file_id)
+    if chat_file is None:
+        raise ValueError(f"File {job.file_id} is not part of chat {chat_id}")
+    if chat_file.content_hash == job.content_hash and chat_file.key_column == job.key_column:
+        await IngestionJob.filter(id=job.id).update(rows_parsed=chat_file.rows, rows_unchanged=chat_file.rows)
+        await _complete_job(job, chat_id)
+        timings.finish(job_id=str(job.id), chat_id=chat_id, rows=chat_file.rows, refresh=True, outcome="unchanged")
+        return
+
+    with timings.stage("load"):
+        existing, next_index, fields = await loadFileRows(chat_id, user_id, job.file_id, job.key_column)
+    staging = f".refresh-{job.id}"
+    columns = await run_in_threadpool(ColumnarWriter, staging, job.file_id)
+    lexical = await run_in_threadpool(LexicalWriter, staging, job.file_id)
+    schema: dict = {}
+    try:
+        with open(job.upload_path, "rb") as f:
+
+            async def on_progress(counts: dict):
+                await IngestionJob.filter(id=job.id).update(
+                    bytes_read=f.tell(), inferred_schema=dict(schema) or None, **counts
+                )
+
+            counts = await refreshRows(
+                iterDataFromFile(job.filename, job.content_type or "", f, schema),
+                chat_id,
+                user_id,
+                job.file_id,
+                job.filename,
+                existing,
+                next_index,
+                fields,
+                key_column=job.key_column,
+                on_progress=on_progress,
+                columns=columns,
+                lexical=lexical,
+                timings=timings,
+                embedding_model=embedding_model,
+            )
+        await run_in_threadpool(columns.finalize)
+        await run_in_threadpool(lexical.finalize)
+        await run_in_threadpool(replaceFileColumns, staging, job.file_id, chat_id, job.file_id)
+        await run_in_threadpool(replaceFileLexical, staging, job.file_id, chat_id, job.file_id)
+    except Exception:
+        for writer in (columns, lexical):
+            shutil.rmtree(os.path.dirname(writer.path), ignore_errors=True)
+        raise
+
+    await ChatFile.filter(id=chat_file.id).update(
+        filename=job.filename,
+        content_hash=job.content_hash,
+        embedding_model=embedding_model,
+        rows=counts["rows"],
+        key_column=job.key_column,
+    )
+    await _complete_job(job, chat_id)
+    print(
+        f"Ingestion job {job.id} refreshed file {job.file_id}: {counts['embedded']} embedded, "
+        f"{counts['unchanged']} unchanged, {counts['deleted']} deleted"
+    )
+    timings.finish(job_id=str(job.id), chat_id=chat_id, refresh=True, outcome="completed", **counts)
+
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id)
+        except Exception as e:
+            print(f"Ingestion worker error on job {job_id}: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def startIngestionWorkers() -> None:
+    global _queue
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue()
+    worker_count = max(1, int(os.getenv("INGEST_WORKERS", "2")))
+    for _ in range(worker_count):
+        _workers.append(asyncio.create_task(_worker()))
+
+    # Jobs left PENDING or RUNNING by a previous process resume from their last upserted row.
+    unfinished = await IngestionJob.filter(status__in=["PENDING", "RUNNING"]).order_by("created_at")
+    for job in unfinished:
+        await _queue.put(str(job.id))
+    if unfinished:
+        print(f"Resuming {len(unfinished)} ingestion job(s)")
+
+
+async def stopIngestionWorkers() -> None:
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
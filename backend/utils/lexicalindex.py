@@ -0,0 +1,400 @@
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+from utils.columnar import openFileColumns
+from utils.context import INTERNAL_METADATA_KEYS
+
+
+# BM25 inverted index over the string values of every uploaded row, kept per file under
+# LEXICAL_INDEX_DIR/<chat_id>/<file_id>/ next to the column store. Each ingest window
+# is written as an immutable segment covering a contiguous row range:
+#   vocab.str / vocab.off   sorted terms as UTF-8 bytes plus int64 end offsets
+#   post.off                int64 end offset of each term's postings
+#   docs.u32 / tf.u8        row (relative to the segment start) and term frequency
+#   len.u16                 indexed tokens per row
+# Once LEXICAL_MERGE_FACTOR segments of one size class pile up they are merged into
+# the next class, so a file of n windows keeps O(log n) segments. manifest.json lists
+# the segments; readers memory-map them and binary-search the vocabulary, so a lookup
+# touches only the postings of the query's terms.
+
+_MANIFEST = "manifest.json"
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def getLexicalIndexDir() -> str:
+    return os.getenv("LEXICAL_INDEX_DIR", "./data/lexical")
+
+
+def _file_dir(chat_id: str, file_id: str) -> str:
+    return os.path.join(getLexicalIndexDir(), chat_id, file_id)
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+def _row_tokens(doc: dict) -> list[str]:
+    # Numbers are served by filters and the column store; words, codes and postcodes here.
+    tokens = []
+    for key, value in doc.items():
+        if isinstance(value, str) and key not in INTERNAL_METADATA_KEYS:
+            tokens.extend(tokenize(value))
+    return tokens
+
+
+def _write_manifest(path: str, manifest: dict):
+    tmp = os.path.join(path, _MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path, _MANIFEST))
+
+
+def _write_segment(path: str, name: str, start: int, rows: int, terms: list[str], docs, tfs, ends, lengths) -> dict:
+    seg = os.path.join(path, name)
+    os.makedirs(seg, exist_ok=True)
+    encoded = [t.encode() for t in terms]
+    with open(os.path.join(seg, "vocab.str"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.cumsum([len(b) for b in encoded], dtype=np.int64).tofile(os.path.join(seg, "vocab.off"))
+    np.asarray(ends, dtype=np.int64).tofile(os.path.join(seg, "post.off"))
+    np.asarray(docs, dtype=np.uint32).tofile(os.path.join(seg, "docs.u32"))
+    np.minimum(np.asarray(tfs), 255).astype(np.uint8).tofile(os.path.join(seg, "tf.u8"))
+    np.minimum(np.asarray(lengths), 65535).astype(np.uint16).tofile(os.path.join(seg, "len.u16"))
+    return {"name": name, "start": start, "rows": rows, "tokens": int(np.sum(lengths)), "level": 0}
+
+
+class _Segment:
+    def __init__(self, path: str, spec: dict):
+        self.spec = spec
+        self.start = spec["start"]
+        self.rows = spec["rows"]
+        base = os.path.join(path, spec["name"])
+
+        def load(name: str, dtype):
+            file = os.path.join(base, name)
+            return np.memmap(file, dtype=dtype, mode="r") if os.path.getsize(file) else np.empty(0, dtype=dtype)
+
+        self.vocab = load("vocab.str", np.uint8)
+        self.vocab_ends = load("vocab.off", np.int64)
+        self.post_ends = load("post.off", np.int64)
+        self.docs = load("docs.u32", np.uint32)
+        self.tfs = load("tf.u8", np.uint8)
+        self.lengths = load("len.u16", np.uint16)
+
+    def _term(self, i: int) -> bytes:
+        start = int(self.vocab_ends[i - 1]) if i else 0
+        return self.vocab[start : int(self.vocab_ends[i])].tobytes()
+
+    def find(self, term: str) -> int:
+        target = term.encode()
+        low, high = 0, len(self.vocab_ends)
+        while low < high:
+            mid = (low + high) // 2
+            if self._term(mid) < target:
+                low = mid + 1
+            else:
+                high = mid
+        return low if low < len(self.vocab_ends) and self._term(low) == target else -1
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        i = self.find(term)
+        if i < 0:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint8)
+        start = int(self.post_ends[i - 1]) if i else 0
+        end = int(self.post_ends[i])
+        return self.docs[start:end], self.tfs[start:end]
+
+    def triples(self) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+        """(terms, term index per posting, row, tf) for merging."""
+        terms = [self._term(i).decode() for i in range(len(self.vocab_ends))]
+        counts = np.diff(np.asarray(self.post_ends), prepend=0)
+        term_ids = np.repeat(np.arange(len(terms)), counts)
+        return terms, term_ids, np.asarray(self.docs), np.asarray(self.tfs)
+
+
+def _merge(path: str, name: str, segments: list[_Segment], cut: Optional[int] = None) -> dict:
+    """One segment holding every posting of `segments` (rows below `cut` only)."""
+    start = segments[0].start
+    end = segments[-1].start + segments[-1].rows if cut is None else cut
+    triples = [seg.triples() for seg in segments]
+    vocab: list[str] = sorted({t for terms, _, _, _ in triples for t in terms})
+    index = {t: i for i, t in enumerate(vocab)}
+    term_ids, docs, tfs = [], [], []
+    lengths = np.zeros(end - start, dtype=np.int64)
+    for seg, (terms, local_ids, seg_docs, seg_tfs) in zip(segments, triples):
+        absolute = seg_docs.astype(np.int64) + seg.start
+        keep = absolute < end
+        mapping = np.array([index[t] for t in terms], dtype=np.int64)
+        term_ids.append(mapping[local_ids[keep]] if len(terms) else np.empty(0, dtype=np.int64))
+        docs.append(absolute[keep] - start)
+        tfs.append(seg_tfs[keep])
+        rows = min(seg.rows, end - seg.start)
+        if rows > 0:
+            lengths[seg.start - start : seg.start - start + rows] = seg.lengths[:rows]
+    term_ids = np.concatenate(term_ids) if term_ids else np.empty(0, dtype=np.int64)
+    docs = np.concatenate(docs) if docs else np.empty(0, dtype=np.int64)
+    tfs = np.concatenate(tfs) if tfs else np.empty(0, dtype=np.uint8)
+    order = np.lexsort((docs, term_ids))
+    counts = np.bincount(term_ids, minlength=len(vocab))
+    present = counts > 0
+    vocab = [t for t, keep in zip(vocab, present) if keep]
+    ends = np.cumsum(counts[present])
+    spec = _write_segment(path, name, start, end - start, vocab, docs[order], tfs[order], ends, lengths)
+    spec["level"] = max(seg.spec["level"] for seg in segments) + (1 if cut is None else 0)
+    return spec
+
+
+class LexicalWriter:
+    """
+    Appends ingest windows to a file's inverted index, mirroring ColumnarWriter:
+    opening with start_index drops postings at or past that row so a resumed job
+    re-appends cleanly, and an index holding fewer rows cannot be completed and is
+    dropped.
+    """
+
+    def __init__(self, chat_id: str, file_id: str, start_index: int = 0):
+        self.path = _file_dir(chat_id, file_id)
+        self.merge_factor = max(2, int(os.getenv("LEXICAL_MERGE_FACTOR", "8")))
+        self.disabled = False
+        manifest = None
+        manifest_path = os.path.join(self.path, _MANIFEST)
+        if start_index and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        if start_index and (manifest is None or manifest["rows"] < start_index):
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.disabled = True
+            return
+        if manifest is None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)
+            manifest = {"rows": 0, "complete": False, "next": 0, "segments": []}
+        elif manifest["rows"] > start_index:
+            self.manifest = manifest
+            self._truncate(start_index)
+        self.manifest = manifest
+
+    def _name(self) -> str:
+        self.manifest["next"] += 1
+        return f"s{self.manifest['next']:06d}"
+
+    def _replace(self, old: list[dict], new: list[dict]):
+        names = {spec["name"] for spec in old}
+        kept = [spec for spec in self.manifest["segments"] if spec["name"] not in names]
+        self.manifest["segments"] = sorted(kept + new, key=lambda spec: spec["start"])
+        self.manifest["rows"] = sum(spec["rows"] for spec in self.manifest["segments"])
+        _write_manifest(self.path, self.manifest)
+        for name in names:
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def _truncate(self, rows: int):
+        beyond = [spec for spec in self.manifest["segments"] if spec["start"] + spec["rows"] > rows]
+        straddling = [spec for spec in beyond if spec["start"] < rows]
+        rebuilt = [_merge(self.path, self._name(), [_Segment(self.path, spec)], cut=rows) for spec in straddling]
+        self._replace(beyond, rebuilt)
+
+    def append(self, documents: list[dict]):
+        if self.disabled or not documents:
+            return
+        postings: dict[str, list[tuple[int, int]]] = {}
+        lengths = []
+        for row, doc in enumerate(documents):
+            tokens = _row_tokens(doc)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((row, tf))
+        terms = sorted(postings)
+        docs = [row for t in terms for row, _ in postings[t]]
+        tfs = [tf for t in terms for _, tf in postings[t]]
+        ends = np.cumsum([len(postings[t]) for t in terms], dtype=np.int64)
+        spec = _write_segment(
+            self.path, self._name(), self.manifest["rows"], len(documents), terms, docs, tfs, ends, lengths
+        )
+        self._replace([], [spec])
+        self._compact()
+
+    def _compact(self):
+        while True:
+            segments = self.manifest["segments"]
+            tail = segments[-self.merge_factor :]
+            if len(tail) < self.merge_factor or len({spec["level"] for spec in tail}) != 1:
+                return
+            merged = _merge(self.path, self._name(), [_Segment(self.path, spec) for spec in tail])
+            self._replace(tail, [merged])
+
+    def finalize(self):
+        if self.disabled:
+            return
+        self.manifest["complete"] = True
+        _write_manifest(self.path, self.manifest)
+
+
+def copyFileLexical(source_chat_id: str, source_file_id: str, chat_id: str, file_id: str) -> bool:
+    """Gives a linked upload its own copy of the source file's index."""
+    source = _file_dir(source_chat_id, source_file_id)
+    if not os.path.exists(os.path.join(source, _MANIFEST)):
+        return False
+    dest = _file_dir(chat_id, file_id)
+    shutil.rmtree(dest, ignore_errors=True)
+    shutil.copytree(source, dest)
+    return True
+
+
+def replaceFileLexical(staged_chat_id: str, staged_file_id: str, chat_id: str, file_id: str) -> bool:
+    """Swaps an index rebuilt under a staging chat id in for the file's current one."""
+    source = _file_dir(staged_chat_id, staged_file_id)
+    if not os.path.exists(os.path.join(source, _MANIFEST)):
+        return False
+    dest = _file_dir(chat_id, file_id)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    retired = source + ".old"
+    if os.path.exists(dest):
+        os.replace(dest, retired)
+    os.replace(source, dest)
+    shutil.rmtree(retired, ignore_errors=True)
+    shutil.rmtree(os.path.dirname(source), ignore_errors=True)
+    return True
+
+
+def _load_file(path: str) -> Optional[tuple[dict, list[_Segment]]]:
+    """
+    The file's manifest and its memory-mapped segments; None if it has no index yet.
+    A merge or compaction can replace segments between reading the manifest and
+    opening them, so a failed load is retried once from a freshly read manifest
+    before the file is skipped, with the error logged.
+    """
+    manifest_path = os.path.join(path, _MANIFEST)
+    for attempt in range(2):
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            return manifest, [_Segment(path, spec) for spec in manifest["segments"]]
+        except (OSError, ValueError, KeyError) as e:
+            error = e
+    print(f"Lexical index {path} could not be loaded, searching without it: {error}")
+    return None
+
+
+def searchLexical(chat_id: str, query: str, k: int, allowed: Optional[dict] = None) -> list[tuple[str, int, float]]:
+    """
+    BM25 top-k over every file of the chat as (file_id, row, score), best first.
+    Statistics cover the whole chat, so scores compare across files. `allowed` maps
+    file_id to a boolean row mask (e.g. from the column store's filter evaluation);
+    files missing from it are searched unrestricted.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    chat_dir = os.path.join(getLexicalIndexDir(), chat_id)
+    if not terms or not os.path.isdir(chat_dir):
+        return []
+    files = []
+    for file_id in sorted(os.listdir(chat_dir)):
+        loaded = _load_file(os.path.join(chat_dir, file_id))
+        if loaded is not None and loaded[0]["rows"]:
+            files.append((file_id, loaded[0], loaded[1]))
+    total_rows = sum(manifest["rows"] for _, manifest, _ in files)
+    if not total_rows:
+        return []
+    avg_len = max(1e-9, sum(spec["tokens"] for _, m, _ in files for spec in m["segments"]) / total_rows)
+
+    # Postings are fetched once and reused for document frequency and scoring.
+    fetched = [[{t: seg.postings(t) for t in terms} for seg in segs] for _, _, segs in files]
+    idf = {}
+    for term in terms:
+        df = sum(len(postings[term][0]) for file_postings in fetched for postings in file_postings)
+        idf[term] = math.log(1 + (total_rows - df + 0.5) / (df + 0.5)) if df else 0.0
+    k1, b = 1.2, 0.75
+    results: list[tuple[float, str, int]] = []
+    for (file_id, _, segs), file_postings in zip(files, fetched):
+        mask = (allowed or {}).get(file_id)
+        for seg, postings in zip(segs, file_postings):
+            scores = None
+            for term in terms:
+                docs, tfs = postings[term]
+                if not len(docs) or not idf[term]:
+                    continue
+                if scores is None:
+                    scores = np.zeros(seg.rows, dtype=np.float32)
+                tf = tfs.astype(np.float32)
+                norm = k1 * (1 - b + b * seg.lengths[docs].astype(np.float32) / avg_len)
+                scores[docs] += idf[term] * tf * (k1 + 1) / (tf + norm)
+            if scores is None:
+                continue
+            if mask is not None:
+                window = mask[seg.start : seg.start + seg.rows]
+                scores[: len(window)][~window] = 0
+                scores[len(window) :] = 0
+            hits = np.flatnonzero(scores > 0)
+            if len(hits) > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            results.extend((float(scores[i]), file_id, seg.start + int(i)) for i in hits)
+    results.sort(key=lambda r: -r[0])
+    return [(file_id, row, score) for score, file_id, row in results[:k]]
+
+
+def reciprocalRankFusion(rankings: list[list[str]], k: Optional[int] = None) -> list[str]:
+    """Ids ordered by the sum of 1 / (k + rank) over every ranking they appear in."""
+    k = k if k is not None else int(os.getenv("HYBRID_RRF_K", "60"))
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+# Identifiers that embeddings match poorly: local authority codes, postcodes and
+# numbered street addresses.
+_IDENTIFIER = re.compile(
+    r"\b(?:[ensw]\d{8}|[a-z]{1,2}\d[a-z\d]?\s*\d[a-z]{2}|\d+[a-z]?\s+\w+\s+"
+    r"(?:road|rd|street|st|lane|ln|avenue|ave|close|drive|dr|way|court|ct|place|pl|terrace|crescent|gardens|grove|hill|row|square|walk))\b"
+)
+
+
+def isExactLookup(query: str) -> bool:
+    return bool(_IDENTIFIER.search((query or "").lower()))
+
+
+def lexicalCandidates(chat_id: str, query: str, k: int, filters: Optional[list[dict]] = None) -> list[dict]:
+    """
+    The chat's top-k BM25 rows as metadata shaped like vector store results, read back
+    from the column store. `filters` (Chroma-style clauses) are applied through the
+    column store before ranking.
+    """
+    chat_dir = os.path.join(getLexicalIndexDir(), chat_id)
+    if not os.path.isdir(chat_dir):
+        return []
+    columns = {file_id: openFileColumns(chat_id, file_id) for file_id in os.listdir(chat_dir)}
+    allowed = {file_id: cols.mask(filters) for file_id, cols in columns.items() if cols is not None and filters}
+    metadatas = []
+    for file_id, row, _ in searchLexical(chat_id, query, k, allowed):
+        cols = columns.get(file_id)
+        if cols is None or row >= cols.rows:
+            continue
+        metadatas.append({**cols.row(row), "chat_id": chat_id, "file_id": file_id, "chunk_index": cols.slot(row)})
+    return metadatas
+
+
+def fuseCandidates(vector_metadatas: list[Optional[dict]], lexical_metadatas: list[dict]) -> list[dict]:
+    """Both result lists merged by reciprocal rank fusion on (file_id, chunk_index)."""
+
+    def key(meta: dict) -> str:
+        return f"{meta.get('file_id')}:{meta.get('chunk_index')}"
+
+    by_key: dict[str, dict] = {}
+    rankings = []
+    for metadatas in (vector_metadatas, lexical_metadatas):
+        ranking = []
+        for meta in metadatas:
+            if meta:
+                by_key.setdefault(key(meta), meta)
+                ranking.append(key(meta))
+        rankings.append(ranking)
+    return [by_key[k] for k in reciprocalRankFusion(rankings)]
@@ -0,0 +1,621 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from utils.clients import getEmbeddingProvider
+from utils.sharding import whereScope
+
+
+# Alternative to the shared Chroma collection (VECTOR_STORE=local). Each chat gets its
+# own directory under LOCAL_INDEX_DIR:
+#   vectors.f32  float32 rows x dim, appended and memory-mapped for search
+#   vectors.i8   with LOCAL_INDEX_QUANTIZATION=int8: int8 rows x dim scanned instead,
+#   scales.f32   with one float32 scale per row (symmetric, max |x| -> 127). The
+#                float32 file is then only kept to re-score the top
+#                LOCAL_INDEX_RESCORE x k candidates exactly; 0 drops it.
+#   meta.jsonl   metadata records, appended; meta.idx holds (start, end) per row so an
+#                upsert of an existing id only rewrites that row's pointer, and a
+#                deleted row is marked by a (-1, -1) pointer
+#   ids.txt      vector ids in row order
+#   manifest.json  dim, row count, byte lengths and the storage format chosen when
+#                the index was created; data past the lengths is an interrupted
+#                write and is truncated on open
+# The store answers the same upsert/query/get calls as a Chroma collection, with
+# squared-L2 distances like Chroma's default space, so utils.vectorstore can use either.
+
+_MANIFEST = "manifest.json"
+_STORE_MANIFEST = "store.json"
+
+
+def getLocalIndexDir() -> str:
+    return os.getenv("LOCAL_INDEX_DIR", "./data/vectors")
+
+
+def _chat_scope(where: Optional[dict]) -> str:
+    chat_id = whereScope(where, "chat_id")
+    if chat_id is not None:
+        return chat_id
+    raise ValueError("Local vector index calls must be scoped with a chat_id filter")
+
+
+def _rescore_factor() -> int:
+    return max(0, int(os.getenv("LOCAL_INDEX_RESCORE", "4")))
+
+
+def quantizeRows(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 codes and float32 scales; codes * scale approximates the row."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class _Fields:
+    """Metadata values of every row, split by type so where clauses evaluate as array ops."""
+
+    def __init__(self):
+        self.rows = 0
+        self.num: dict[str, np.ndarray] = {}
+        self.obj: dict[str, np.ndarray] = {}
+
+    def extend(self, metadatas: list[dict]):
+        count = len(metadatas)
+        names = {name for meta in metadatas for name in meta}
+        for name in names | set(self.num):
+            num = np.full(count, np.nan)
+            obj = np.full(count, None, dtype=object)
+            for i, meta in enumerate(metadatas):
+                value = meta.get(name)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    num[i] = value
+                elif value is not None:
+                    obj[i] = value
+            self.num[name] = np.concatenate([self.num.get(name, np.full(self.rows, np.nan)), num])
+            self.obj[name] = np.concatenate([self.obj.get(name, np.full(self.rows, None, dtype=object)), obj])
+        self.rows += count
+
+    def _compare(self, name: str, op: str, target) -> np.ndarray:
+        if name not in self.num:
+            return np.zeros(self.rows, dtype=bool)
+        if op in ("$in", "$nin"):
+            hit = np.zeros(self.rows, dtype=bool)
+            for value in target:
+                hit |= self._compare(name, "$eq", value)
+            return hit if op == "$in" else ~hit & self._present(name)
+        if isinstance(target, (int, float)) and not isinstance(target, bool):
+            column = self.num[name]
+            with np.errstate(invalid="ignore"):
+                result = {
+                    "$eq": lambda: column == target,
+                    "$ne": lambda: (column != target) & ~np.isnan(column),
+                    "$gt": lambda: column > target,
+                    "$gte": lambda: column >= target,
+                    "$lt": lambda: column < target,
+                    "$lte": lambda: column <= target,
+                }.get(op)
+            return result() if result else np.zeros(self.rows, dtype=bool)
+        equal = self.obj[name] == target
+        if op == "$eq":
+            return equal
+        if op == "$ne":
+            return ~equal & self._present(name)
+        return np.zeros(self.rows, dtype=bool)
+
+    def _present(self, name: str) -> np.ndarray:
+        return ~np.isnan(self.num[name]) | (self.obj[name] != None)  # noqa: E711
+
+    def mask(self, where: dict) -> np.ndarray:
+        """Evaluates a Chroma where clause ($and/$or and field operators)."""
+        mask = np.ones(self.rows, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.mask(clause)
+            elif key == "$or":
+                hit = np.zeros(self.rows, dtype=bool)
+                for clause in condition:
+                    hit |= self.mask(clause)
+                mask &= hit
+            elif isinstance(condition, dict):
+                for op, target in condition.items():
+                    mask &= self._compare(key, op, target)
+            else:
+                mask &= self._compare(key, "$eq", condition)
+        return mask
+
+
+class _ChatIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self._loaded = False
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        if self._loaded:
+            return
+        manifest_path = self._file(_MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+            for name, size in self._file_sizes():
+                with open(self._file(name), "r+b") as f:
+                    f.truncate(size)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            quantization = os.getenv("LOCAL_INDEX_QUANTIZATION", "none").lower()
+            if quantization not in ("none", "int8"):
+                raise ValueError(f"Unknown LOCAL_INDEX_QUANTIZATION '{quantization}'")
+            self.manifest = {
+                "dim": None,
+                "rows": 0,
+                "meta_bytes": 0,
+                "ids_bytes": 0,
+                "quantization": quantization,
+                "float32": quantization == "none" or _rescore_factor() > 0,
+            }
+            for name, _ in self._file_sizes():
+                open(self._file(name), "wb").close()
+        self._ids: Optional[list[str]] = None
+        self._id_rows: Optional[dict[str, int]] = None
+        self._norms: Optional[np.ndarray] = None
+        self._fields: Optional[_Fields] = None
+        self._live: Optional[np.ndarray] = None
+        self._hnsw = None
+        self._loaded = True
+
+    def release(self):
+        """Drops resident caches; the next call reloads from disk."""
+        with self.lock:
+            if self._loaded:
+                self._save_hnsw()
+            self._loaded = False
+            self._ids = self._id_rows = self._norms = self._fields = self._live = self._hnsw = None
+
+    @property
+    def rows(self) -> int:
+        return self.manifest["rows"]
+
+    @property
+    def _quantized(self) -> bool:
+        return self.manifest.get("quantization") == "int8"
+
+    @property
+    def _has_float32(self) -> bool:
+        # Indexes created before quantization existed are plain float32.
+        return self.manifest.get("float32", True)
+
+    def _file_sizes(self) -> list[tuple[str, int]]:
+        rows, dim = self.manifest["rows"], self.manifest["dim"] or 0
+        sizes = [("vectors.f32", rows * dim * 4)] if self._has_float32 else []
+        if self._quantized:
+            sizes += [("vectors.i8", rows * dim), ("scales.f32", rows * 4)]
+        return sizes + [("meta.idx", rows * 16), ("meta.jsonl", self.manifest["meta_bytes"]), ("ids.txt", self.manifest["ids_bytes"])]
+
+    def _matrix(self, name: str, dtype) -> np.ndarray:
+        if self.rows == 0:
+            return np.empty((0, self.manifest["dim"] or 0), dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode="r", shape=(self.rows, self.manifest["dim"]))
+
+    def _vectors(self) -> np.ndarray:
+        """The matrix brute-force scans read: int8 codes when quantized, else float32."""
+        return self._matrix("vectors.i8", np.int8) if self._quantized else self._matrix("vectors.f32", np.float32)
+
+    def _scales(self) -> np.ndarray:
+        if self.rows == 0:
+            return np.empty(0, dtype=np.float32)
+        return np.memmap(self._file("scales.f32"), dtype=np.float32, mode="r", shape=(self.rows,))
+
+    def _decode(self, rows) -> np.ndarray:
+        """Scanned rows as float32; dequantized approximations for int8 indexes."""
+        vectors = self._vectors()[rows]
+        if not self._quantized:
+            return np.asarray(vectors)
+        return vectors.astype(np.float32) * self._scales()[rows][:, None]
+
+    def _exact(self, rows) -> np.ndarray:
+        """Rows at full precision where the float32 file is kept."""
+        if self._has_float32:
+            return np.asarray(self._matrix("vectors.f32", np.float32)[rows])
+        return self._decode(rows)
+
+    def _ids_list(self) -> list[str]:
+        if self._ids is None:
+            with open(self._file("ids.txt")) as f:
+                self._ids = f.read().splitlines()
+            live = self._live_rows()
+            self._id_rows = {vid: row for row, vid in enumerate(self._ids) if live[row]}
+        return self._ids
+
+    def _live_rows(self) -> np.ndarray:
+        """False for deleted rows; rows appended since the last call are live."""
+        if self._live is None:
+            if self.manifest.get("deleted") and self.rows:
+                pointers = np.memmap(self._file("meta.idx"), dtype=np.int64, mode="r", shape=(self.rows, 2))
+                self._live = np.asarray(pointers[:, 0] >= 0)
+            else:
+                self._live = np.ones(self.rows, dtype=bool)
+        elif self._live.size < self.rows:
+            self._live = np.concatenate([self._live, np.ones(self.rows - self._live.size, dtype=bool)])
+        return self._live
+
+    def _metadata(self, rows) -> list[dict]:
+        out = []
+        if not len(rows):
+            return out
+        pointers = np.memmap(self._file("meta.idx"), dtype=np.int64, mode="r", shape=(self.rows, 2))
+        with open(self._file("meta.jsonl"), "rb") as f:
+            for row in rows:
+                start, end = pointers[row]
+                if start < 0:
+                    out.append({})
+                    continue
+                f.seek(start)
+                out.append(json.loads(f.read(end - start)))
+        return out
+
+    def _fields_for(self) -> _Fields:
+        if self._fields is None:
+            self._fields = _Fields()
+        if self._fields.rows < self.rows:
+            self._fields.extend(self._metadata(range(self._fields.rows, self.rows)))
+        return self._fields
+
+    def _squared_norms(self) -> np.ndarray:
+        if self._norms is None or self._norms.size != self.rows:
+            start = 0 if self._norms is None else self._norms.size
+            block = int(os.getenv("LOCAL_INDEX_SCAN_BLOCK", "65536"))
+            parts = [self._norms] if self._norms is not None else []
+            for lo in range(start, self.rows, block):
+                chunk = self._decode(slice(lo, min(lo + block, self.rows)))
+                parts.append(np.einsum("ij,ij->i", chunk, chunk))
+            self._norms = np.concatenate(parts) if parts else np.empty(0, dtype=np.float32)
+        return self._norms
+
+    def upsert(self, ids: list[str], embeddings, metadatas: list[dict]):
+        with self.lock:
+            self._load()
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            if self.manifest["dim"] is None:
+                self.manifest["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != self.manifest["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.manifest['dim']}")
+            self._ids_list()
+
+            # Later duplicates in one batch win, as with Chroma.
+            latest = {vid: i for i, vid in enumerate(ids)}
+            updates = [(self._id_rows[vid], i) for vid, i in latest.items() if vid in self._id_rows]
+            appends = [i for vid, i in latest.items() if vid not in self._id_rows]
+
+            # A None value means the field is absent, as with Chroma.
+            records = [
+                json.dumps({k: v for k, v in metadatas[i].items() if v is not None}, separators=(",", ":")).encode() + b"\n"
+                for i in range(len(ids))
+            ]
+            pointers = np.zeros((len(ids), 2), dtype=np.int64)
+            offset = self.manifest["meta_bytes"]
+            with open(self._file("meta.jsonl"), "ab") as f:
+                for i, record in enumerate(records):
+                    f.write(record)
+                    pointers[i] = (offset, offset + len(record) - 1)
+                    offset += len(record)
+            self.manifest["meta_bytes"] = offset
+
+            # What the scan sees: float32 rows, or their int8 codes and scales.
+            stored = {"vectors.f32": vectors} if self._has_float32 else {}
+            scanned = vectors
+            if self._quantized:
+                codes, scales = quantizeRows(vectors)
+                stored.update({"vectors.i8": codes, "scales.f32": scales})
+                scanned = codes.astype(np.float32) * scales[:, None]
+
+            if updates:
+                rows = np.array([row for row, _ in updates])
+                batch = np.array([i for _, i in updates])
+                for name, data in stored.items():
+                    with open(self._file(name), "r+b") as f:
+                        matrix = np.memmap(f, dtype=data.dtype, mode="r+", shape=(self.rows, *data.shape[1:]))
+                        matrix[rows] = data[batch]
+                        matrix.flush()
+                with open(self._file("meta.idx"), "r+b") as f:
+                    index = np.memmap(f, dtype=np.int64, mode="r+", shape=(self.rows, 2))
+                    index[rows] = pointers[batch]
+                    index.flush()
+                if self._norms is not None:
+                    self._norms[rows] = np.einsum("ij,ij->i", scanned[batch], scanned[batch])
+                # Overwritten metadata invalidates the parsed filter columns.
+                self._fields = None
+
+            if appends:
+                for name, data in stored.items():
+                    with open(self._file(name), "ab") as f:
+                        data[appends].tofile(f)
+                with open(self._file("meta.idx"), "ab") as f:
+                    pointers[appends].tofile(f)
+                encoded = "".join(ids[i] + "\n" for i in appends).encode()
+                with open(self._file("ids.txt"), "ab") as f:
+                    f.write(encoded)
+                self.manifest["ids_bytes"] += len(encoded)
+                for i in appends:
+                    self._id_rows[ids[i]] = len(self._ids)
+                    self._ids.append(ids[i])
+            first_new = self.rows
+            self.manifest["rows"] += len(appends)
+            self.manifest.pop("hnsw_rows", None)
+            _write_json(self._file(_MANIFEST), self.manifest)
+
+            if self._hnsw is not None:
+                labels = [row for row, _ in updates] + list(range(first_new, self.rows))
+                order = [i for _, i in updates] + appends
+                if self.rows > self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(max(self.rows, 2 * self._hnsw.get_max_elements()))
+                self._hnsw.add_items(vectors[order], labels)
+
+    def delete(self, ids: list[str]) -> int:
+        """Marks rows deleted in place; their slots stay on disk and are skipped by every read."""
+        with self.lock:
+            self._load()
+            self._ids_list()
+            rows = sorted({self._id_rows.pop(vid) for vid in ids if vid in self._id_rows})
+            if not rows:
+                return 0
+            with open(self._file("meta.idx"), "r+b") as f:
+                index = np.memmap(f, dtype=np.int64, mode="r+", shape=(self.rows, 2))
+                index[rows] = -1
+                index.flush()
+            self._live_rows()[rows] = False
+            self.manifest["deleted"] = self.manifest.get("deleted", 0) + len(rows)
+            _write_json(self._file(_MANIFEST), self.manifest)
+            return len(rows)
+
+    def _brute_force(self, query: np.ndarray, candidates: Optional[np.ndarray], k: int) -> tuple[np.ndarray, np.ndarray]:
+        vectors = self._vectors()
+        norms = self._squared_norms()
+        block = int(os.getenv("LOCAL_INDEX_SCAN_BLOCK", "65536"))
+        best_rows = np.empty(0, dtype=np.int64)
+        best_dist = np.empty(0, dtype=np.float32)
+        total = self.rows if candidates is None else candidates.size
+        scales = self._scales() if self._quantized else None
+        if scales is not None:
+            # Keep each widened float32 block around 8 MB instead of a full scan block.
+            block = min(block, max(1024, (8 << 20) // (4 * max(1, self.manifest["dim"]))))
+        for start in range(0, total, block):
+            if candidates is None:
+                rows = np.arange(start, min(start + block, total))
+                chunk = vectors[start : start + block]
+            else:
+                rows = candidates[start : start + block]
+                chunk = vectors[rows]
+            # Squared L2, expanded so the heavy part is one matrix-vector product;
+            # int8 codes are widened per block and the row scale applied to the dot.
+            dots = chunk @ query if scales is None else (chunk.astype(np.float32) @ query) * scales[rows]
+            dist = norms[rows] - 2 * dots + query @ query
+            rows = np.concatenate([best_rows, rows])
+            dist = np.concatenate([best_dist, dist])
+            if dist.size > k:
+                keep = np.argpartition(dist, k - 1)[:k]
+                rows, dist = rows[keep], dist[keep]
+            best_rows, best_dist = rows, dist
+        order = np.argsort(best_dist, kind="stable")
+        return best_rows[order], np.maximum(best_dist[order], 0)
+
+    def _hnsw_index(self):
+        if self._hnsw is None:
+            import hnswlib
+
+            index = hnswlib.Index(space="l2", dim=self.manifest["dim"])
+            saved = self._file("hnsw.bin")
+            saved_rows = self.manifest.get("hnsw_rows")
+            if os.path.exists(saved) and saved_rows == self.rows:
+                index.load_index(saved, max_elements=self.rows)
+            else:
+                index.init_index(
+                    max_elements=max(self.rows, 1),
+                    ef_construction=int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", "100")),
+                    M=int(os.getenv("LOCAL_INDEX_HNSW_M", "16")),
+                )
+                block = int(os.getenv("LOCAL_INDEX_SCAN_BLOCK", "65536"))
+                for start in range(0, self.rows, block):
+                    stop = min(start + block, self.rows)
+                    index.add_items(self._exact(slice(start, stop)), np.arange(start, stop))
+            index.set_ef(int(os.getenv("LOCAL_INDEX_HNSW_EF", "64")))
+            self._hnsw = index
+        return self._hnsw
+
+    def _save_hnsw(self):
+        if self._hnsw is not None and self._hnsw.get_current_count() == self.rows:
+            self._hnsw.save_index(self._file("hnsw.bin"))
+            self.manifest["hnsw_rows"] = self.rows
+            _write_json(self._file(_MANIFEST), self.manifest)
+
+    def _use_hnsw(self, candidates: Optional[np.ndarray]) -> bool:
+        if os.getenv("LOCAL_INDEX_ALGORITHM", "brute") != "hnsw":
+            return False
+        # Small or highly selective scans are exact and cheaper than a graph walk.
+        scanned = self.rows if candidates is None else candidates.size
+        return scanned > int(os.getenv("LOCAL_INDEX_BRUTE_FORCE_MAX", "20000"))
+
+    def _hnsw_search(self, query: np.ndarray, candidates: Optional[np.ndarray], k: int) -> tuple[np.ndarray, np.ndarray]:
+        allowed = None
+        if candidates is not None:
+            mask = np.zeros(self.rows, dtype=bool)
+            mask[candidates] = True
+            allowed = lambda label: bool(mask[label])  # noqa: E731
+        k = min(k, self.rows if candidates is None else candidates.size)
+        try:
+            labels, dist = self._hnsw_index().knn_query(query, k=k, filter=allowed)
+        except RuntimeError:
+            # The graph walk found fewer than k allowed rows; the exact scan always can.
+            return self._brute_force(query, candidates, k)
+        return labels[0].astype(np.int64), dist[0]
+
+    def _search(self, query: np.ndarray, candidates: Optional[np.ndarray], k: int) -> tuple[np.ndarray, np.ndarray]:
+        rescore = _rescore_factor() if self._quantized and self._has_float32 else 0
+        wanted = k * rescore if rescore else k
+        if self._use_hnsw(candidates):
+            rows, dist = self._hnsw_search(query, candidates, wanted)
+        else:
+            rows, dist = self._brute_force(query, candidates, wanted)
+        if rescore and rows.size:
+            # Exact distances for the shortlist, read from the float32 file.
+            order = np.argsort(rows)
+            exact = self._exact(rows[order]) - query
+            dist = np.empty(rows.size, dtype=np.float32)
+            dist[order] = np.einsum("ij,ij->i", exact, exact)
+            keep = np.argsort(dist, kind="stable")[:k]
+            rows, dist = rows[keep], dist[keep]
+        return rows, dist
+
+    def query(self, query_embeddings, n_results: int, where: Optional[dict], include: list[str]) -> dict:
+        with self.lock:
+            self._load()
+            result = {"ids": [], "distances": [], "metadatas": [], "embeddings": None, "documents": None}
+            candidates = None
+            if self.rows and where:
+                candidates = np.flatnonzero(self._fields_for().mask(where) & self._live_rows())
+            elif self.rows and self.manifest.get("deleted"):
+                candidates = np.flatnonzero(self._live_rows())
+            for query in np.asarray(query_embeddings, dtype=np.float32):
+                if not self.rows or (candidates is not None and candidates.size == 0):
+                    rows, dist = np.empty(0, dtype=np.int64), np.empty(0)
+                else:
+                    rows, dist = self._search(query, candidates, n_results)
+                ids = self._ids_list()
+                result["ids"].append([ids[row] for row in rows])
+                result["distances"].append([float(d) for d in dist])
+                result["metadatas"].append(self._metadata(rows) if "metadatas" in include else None)
+            if "metadatas" not in include:
+                result["metadatas"] = None
+            if "distances" not in include:
+                result["distances"] = None
+            return result
+
+    def get(self, where: Optional[dict], limit: Optional[int], offset: int, include: list[str]) -> dict:
+        with self.lock:
+            self._load()
+            rows = np.flatnonzero(self._live_rows())
+            if self.rows and where:
+                rows = np.flatnonzero(self._fields_for().mask(where) & self._live_rows())
+            rows = rows[offset : None if limit is None else offset + limit]
+            ids = self._ids_list()
+            return {
+                "ids": [ids[row] for row in rows],
+                "embeddings": self._exact(rows) if "embeddings" in include else None,
+                "metadatas": self._metadata(rows) if "metadatas" in include else None,
+                "documents": None,
+            }
+
+
+class LocalVectorStore:
+    """
+    Per-chat indexes behind a Chroma-collection-shaped interface. At most
+    LOCAL_INDEX_RESIDENT_CHATS chats keep their caches (id map, norms, parsed
+    filter columns, HNSW graph) in memory; the least recently used are released.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.max_resident = max(1, int(os.getenv("LOCAL_INDEX_RESIDENT_CHATS", "16")))
+        self._indexes: dict[str, _ChatIndex] = {}
+        self._resident: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        # Embedding model id recorded in the store's store.json, set by getLocalVectorStore.
+        self.embedding_model: Optional[str] = None
+        os.makedirs(root, exist_ok=True)
+
+    def _chat(self, chat_id: str) -> _ChatIndex:
+        evicted = []
+        with self._lock:
+            index = self._indexes.get(chat_id)
+            if index is None:
+                index = self._indexes[chat_id] = _ChatIndex(os.path.join(self.root, chat_id))
+            self._resident[chat_id] = None
+            self._resident.move_to_end(chat_id)
+            while len(self._resident) > self.max_resident:
+                evicted.append(self._indexes[self._resident.popitem(last=False)[0]])
+        for old in evicted:
+            old.release()
+        return index
+
+    def count(self) -> int:
+        total = 0
+        for chat_id in os.listdir(self.root):
+            path = os.path.join(self.root, chat_id, _MANIFEST)
+            if os.path.exists(path):
+                with open(path) as f:
+                    manifest = json.load(f)
+                total += manifest["rows"] - manifest.get("deleted", 0)
+        return total
+
+    def upsert(self, ids: list[str], embeddings, metadatas: list[dict]):
+        by_chat: dict[str, list[int]] = {}
+        for i, meta in enumerate(metadatas):
+            by_chat.setdefault(str(meta["chat_id"]), []).append(i)
+        for chat_id, positions in by_chat.items():
+            self._chat(chat_id).upsert(
+                [ids[i] for i in positions], [embeddings[i] for i in positions], [metadatas[i] for i in positions]
+            )
+
+    def query(self, query_embeddings, n_results: int, where: Optional[dict] = None, include: Optional[list[str]] = None):
+        return self._chat(_chat_scope(where)).query(query_embeddings, n_results, where, include or ["metadatas", "distances"])
+
+    def delete(self, ids: list[str], where: Optional[dict] = None) -> int:
+        return self._chat(_chat_scope(where)).delete(ids)
+
+    def get(self, where: Optional[dict] = None, limit: Optional[int] = None, offset: int = 0, include: Optional[list[str]] = None):
+        return self._chat(_chat_scope(where)).get(where, limit, offset or 0, include or ["metadatas"])
+
+    def close(self):
+        with self._lock:
+            indexes = list(self._indexes.values())
+            self._resident.clear()
+        for index in indexes:
+            index.release()
+
+
+_local_store: Optional[LocalVectorStore] = None
+_local_lock = threading.Lock()
+
+
+def getLocalVectorStore() -> LocalVectorStore:
+    global _local_store
+    if _local_store is None:
+        with _local_lock:
+            if _local_store is None:
+                store = LocalVectorStore(getLocalIndexDir())
+                store.embedding_model = _store_embedding_model(store)
+                _local_store = store
+    return _local_store
+
+
+def closeLocalVectorStore() -> None:
+    global _local_store
+    if _local_store is not None:
+        _local_store.close()
+        _local_store = None
+
+
+def _store_embedding_model(store: LocalVectorStore) -> str:
+    """As for a Chroma collection: the store records the configured provider's model when created."""
+    path = os.path.join(store.root, _STORE_MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            recorded = json.load(f).get("embedding_model")
+        if recorded is not None:
+            return recorded
+    model_id = getEmbeddingProvider().model_id
+    _write_json(path, {"embedding_model": model_id})
+    return model_id
@@ -0,0 +1,126 @@
+import os
+from typing import Optional
+
+from db.models import Chat, Message
+from utils.clients import getAsyncOpenai, getChatModelName
+from utils.pagination import encodeCursor, keysetFilter, messagePage
+from utils.scheduler import estimateTokens
+
+
+# Conversation memory is assembled on the server from the Message table:
+#   - the newest turns that fit HISTORY_TOKEN_BUDGET go into the prompt verbatim;
+#   - turns older than that are folded, HISTORY_FOLD_BATCH at a time and in order,
+#     into Chat.summary, and Chat.summary_cursor marks the last message folded.
+# A turn therefore reads at most HISTORY_MAX_MESSAGES rows through the
+# (chat_id, created_at) index and sends a bounded prompt however long the chat gets.
+# Folding calls the model, so it runs after the response has been streamed.
+
+ROLE_NAMES = {"USER": "user", "ASSISTANT": "assistant"}
+
+_folding: set[str] = set()
+
+
+async def loadConversation(chat: Chat, before: Message) -> tuple[list[dict], Optional[str]]:
+    """
+    Chat-completion messages for the turns preceding `before`: the running summary
+    (if any) followed by the newest turns within the token budget. The second value
+    is the cursor of the oldest turn in the window when older turns are still
+    unsummarised, i.e. when a fold is due, and None otherwise.
+    """
+    rows, more = await messagePage(
+        str(chat.id),
+        int(os.getenv("HISTORY_MAX_MESSAGES", "40")),
+        fields=("id", "role", "content", "created_at"),
+        before=encodeCursor(before.created_at, before.id),
+        after=chat.summary_cursor,
+    )
+    # The summary is part of the same budget, so the prompt's history stays bounded.
+    budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500")) - (estimateTokens(chat.summary) if chat.summary else 0)
+    window: list[dict] = []
+    used = 0
+    for row in reversed(rows):
+        tokens = estimateTokens(row["content"])
+        if used + tokens > budget:
+            break
+        used += tokens
+        window.append(row)
+    window.reverse()
+
+    fold_before = None
+    if more or len(window) < len(rows):
+        # Everything before the window that is not in the summary yet gets folded next.
+        oldest = window[0] if window else rows[-1]
+        fold_before = encodeCursor(oldest["created_at"], oldest["id"])
+
+    messages = []
+    if chat.summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{chat.summary}"})
+    for row in window:
+        if row["content"]:
+            messages.append({"role": ROLE_NAMES.get(row["role"], "user"), "content": row["content"]})
+    return messages, fold_before
+
+
+def _transcript(rows: list[dict]) -> str:
+    limit = int(os.getenv("HISTORY_FOLD_MESSAGE_CHARS", "2000"))
+    return "\n".join(f"{row['role'].lower()}: {row['content'][:limit]}" for row in rows)
+
+
+async def foldHistory(chat_id: str, fold_before: str):
+    """
+    Folds the oldest unsummarised turns before `fold_before` into the chat's running
+    summary. The update only applies if no other fold moved the cursor meanwhile, so
+    workers racing on the same chat never fold a turn twice.
+    """
+    if chat_id in _folding:
+        return
+    _folding.add(chat_id)
+    try:
+        chat = await Chat.get_or_none(id=chat_id)
+        if chat is None:
+            return
+        query = Message.filter(chat_id=chat_id).filter(keysetFilter(fold_before, older=True))
+        if chat.summary_cursor:
+            query = query.filter(keysetFilter(chat.summary_cursor, older=False))
+        rows = await (
+            query.order_by("created_at", "id")
+            .limit(int(os.getenv("HISTORY_FOLD_BATCH", "40")))
+            .values("id", "role", "content", "created_at")
+        )
+        if not rows:
+            return
+
+        max_tokens = int(os.getenv("HISTORY_SUMMARY_TOKENS", "400"))
+        response = await getAsyncOpenai().chat.completions.create(
+            model=os.getenv("HISTORY_SUMMARY_MODEL", getChatModelName()),
+            temperature=0,
+            max_tokens=max_tokens,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You maintain the running summary of a conversation between a user and a real estate "
+                        "assistant. Merge the new turns into the existing summary. Keep the user's stated "
+                        "requirements and preferences, properties, figures and conclusions that later turns may "
+                        f"refer to; drop pleasantries. Answer with the updated summary only, under {max_tokens} tokens."
+                    ),
+                },
+                {
+                    "role": "user",
+                    "content": f"Existing summary:\n{chat.summary or '(none)'}\n\nNew turns:\n{_transcript(rows)}",
+                },
+            ],
+        )
+        summary = (response.choices[0].message.content or "").strip()
+        if not summary:
+            return
+        updated = await Chat.filter(id=chat_id, summary_cursor=chat.summary_cursor).update(
+            summary=summary, summary_cursor=encodeCursor(rows[-1]["created_at"], rows[-1]["id"])
+        )
+        if updated:
+            print(f"Folded {len(rows)} messages into the summary of chat {chat_id}")
+    except Exception as e:
+        # The window still bounds the prompt; folding is retried on the next turn.
+        print(f"History fold failed for chat {chat_id}: {e}")
+    finally:
+        _folding.discard(chat_id)
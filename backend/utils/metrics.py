@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+# Process-local counters and histograms, rendered in the Prometheus text format at
+# /metrics. Stage durations are fed by utils.timing.StageTimer; each worker process
+# exposes its own series, which Prometheus sums across targets.
+# METRICS_ENABLED=false turns every observe/increment into an early return.
+# TRACE_REQUESTS=true prints one JSON line per chat request or ingestion job with
+# the offset and duration of every stage.
+
+_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() not in ("0", "false", "no")
+_TRACING = os.getenv("TRACE_REQUESTS", "false").lower() in ("1", "true", "yes")
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS = {
+    "rag_stage_duration_seconds": ("histogram", "Duration of one stage of a chat request or ingestion job."),
+    "rag_embedding_request_seconds": ("histogram", "Latency of embedding provider calls."),
+    "rag_embedding_requests_total": ("counter", "Successful embedding provider calls."),
+    "rag_embedding_retries_total": ("counter", "Embedding provider calls retried, by reason."),
+    "rag_embedding_tokens_total": ("counter", "Estimated tokens sent for embedding."),
+    "rag_chat_tokens_total": ("counter", "Estimated chat model tokens, by kind (prompt or completion)."),
+    "rag_retrieval_fallbacks_total": ("counter", "Filtered retrievals retried without filters."),
+    "rag_ingest_rows_total": ("counter", "Rows upserted by ingestion jobs."),
+}
+
+_lock = threading.Lock()
+_histograms: dict[tuple[str, tuple], list[float]] = {}
+_counters: dict[tuple[str, tuple], float] = {}
+
+
+def metricsEnabled() -> bool:
+    return _ENABLED
+
+
+def tracingEnabled() -> bool:
+    return _TRACING
+
+
+def observe(name: str, seconds: float, **labels):
+    if not _ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        # One cumulative count per bucket, then +Inf, sum and count.
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0.0] * (len(BUCKETS) + 3)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                series[i] += 1
+        series[-3] += 1
+        series[-2] += seconds
+        series[-1] += 1
+
+
+def increment(name: str, amount: float = 1.0, **labels):
+    if not _ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+
+
+def _labels(pairs: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = pairs + ((extra,) if extra else ())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def renderMetrics() -> str:
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        if kind == "histogram":
+            for (series_name, pairs), series in histograms:
+                if series_name != name:
+                    continue
+                for bound, count in zip(BUCKETS, series):
+                    lines.append(f"{name}_bucket{_labels(pairs, ('le', bound))} {_number(count)}")
+                lines.append(f"{name}_bucket{_labels(pairs, ('le', '+Inf'))} {_number(series[-3])}")
+                lines.append(f"{name}_sum{_labels(pairs)} {series[-2]!r}")
+                lines.append(f"{name}_count{_labels(pairs)} {_number(series[-1])}")
+        else:
+            for (series_name, pairs), value in counters:
+                if series_name == name:
+                    lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def emitTrace(trace: dict):
+    if _TRACING:
+        print(json.dumps({"ts": round(time.time(), 3), **trace}, default=str))
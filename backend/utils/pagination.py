@@ -0,0 +1,109 @@
+import base64
+import os
+from datetime import datetime
+from typing import Optional
+
+from tortoise.expressions import Q
+
+from db.models import Chat, Message
+
+
+# Keyset pagination: a cursor is the sort key of the last row a page returned, so the
+# next page is an index range scan that starts right after it instead of an OFFSET
+# that reads and discards every earlier row. Messages and chats both sort by
+# (created_at, id); the id breaks ties between rows created in the same instant.
+
+MESSAGE_FIELDS = ("id", "chat_id", "role", "content", "created_at")
+
+
+def pageLimit(limit: Optional[int], default_env: str, default: int) -> int:
+    maximum = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+    if limit is None:
+        limit = int(os.getenv(default_env, str(default)))
+    return max(1, min(limit, maximum))
+
+
+def encodeCursor(*parts) -> str:
+    raw = "|".join(part.isoformat() if isinstance(part, datetime) else str(part) for part in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decodeCursor(cursor: str, parts: int) -> list[str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Malformed cursor")
+    values = raw.split("|")
+    if len(values) != parts:
+        raise ValueError("Malformed cursor")
+    return values
+
+
+def keysetFilter(cursor: str, older: bool) -> Q:
+    """Rows strictly before (older=True) or after the row the cursor points at."""
+    created_at, row_id = decodeCursor(cursor, 2)
+    try:
+        created_at = datetime.fromisoformat(created_at)
+    except ValueError:
+        raise ValueError("Malformed cursor")
+    op = "lt" if older else "gt"
+    tie = Q(**{f"created_at__{op}": created_at}) | Q(created_at=created_at, **{f"id__{op}": row_id})
+    # The redundant inclusive bound is what lets the planner range-scan the index;
+    # on its own the OR above is evaluated against every row of the chat or user.
+    return Q(Q(**{f"created_at__{op}e": created_at}), tie)
+
+
+def parseMessageFields(fields: Optional[str]) -> tuple[str, ...]:
+    if not fields:
+        return MESSAGE_FIELDS
+    requested = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in MESSAGE_FIELDS]
+    if unknown or not requested:
+        raise ValueError(f"Unknown message fields: {', '.join(unknown)}; expected a subset of {', '.join(MESSAGE_FIELDS)}")
+    return requested
+
+
+async def messagePage(
+    chat_id: str,
+    limit: int,
+    fields: tuple[str, ...] = MESSAGE_FIELDS,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    latest: bool = False,
+) -> tuple[list[dict], Optional[str]]:
+    """
+    One page of a chat's messages in chronological order, as projected `.values()`
+    rows, plus the cursor of the next page (None on the last one). `latest` and
+    `before` walk backwards from the newest message, so their cursor is meant for
+    `before`; otherwise pages run forwards and the cursor is meant for `after`.
+    Passing both bounds pages through the range between them.
+    """
+    backwards = latest or before is not None
+    query = Message.filter(chat_id=chat_id)
+    if before is not None:
+        query = query.filter(keysetFilter(before, older=True))
+    if after is not None:
+        query = query.filter(keysetFilter(after, older=False))
+    order = ("-created_at", "-id") if backwards else ("created_at", "id")
+    # The sort key is always read so the cursor can be built, then dropped if not requested.
+    columns = tuple(dict.fromkeys(fields + ("created_at", "id")))
+    rows = await query.order_by(*order).limit(limit + 1).values(*columns)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encodeCursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
+    if backwards:
+        rows.reverse()
+    if len(columns) != len(fields):
+        rows = [{key: row[key] for key in fields} for row in rows]
+    return rows, next_cursor
+
+
+async def chatPage(user_id: str, limit: int, after: Optional[str] = None) -> tuple[list[Chat], Optional[str]]:
+    """One page of a user's chats, newest first, plus the cursor of the next (older) page."""
+    query = Chat.filter(user_id=user_id)
+    if after is not None:
+        query = query.filter(keysetFilter(after, older=True))
+    chats = await query.order_by("-created_at", "-id").limit(limit + 1)
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+    return chats, encodeCursor(chats[-1].created_at, chats[-1].id) if has_more else None
@@ -0,0 +1,78 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+from fastapi import HTTPException
+
+
+# bcrypt costs 100ms+ of CPU per call at the default cost, so hashing and checking
+# run on a small dedicated pool instead of the event loop. The pool is separate
+# from the one serving Chroma calls, so a burst of logins cannot take the threads
+# chat queries need; bcrypt releases the GIL while it works. Requests beyond
+# PASSWORD_HASH_MAX_PENDING are turned away with a 503 instead of queueing
+# without bound.
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = 0
+_completed = 0
+_failed = 0
+_rejected = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        max_workers = max(1, int(os.getenv("PASSWORD_HASH_CONCURRENCY", "2")))
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+    return _executor
+
+
+async def _run(fn, *args):
+    global _pending, _completed, _failed, _rejected
+    if _pending >= int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64")):
+        _rejected += 1
+        raise HTTPException(status_code=503, detail="Too many sign-ins in progress", headers={"Retry-After": "1"})
+    _pending += 1
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    except BaseException:
+        # Malformed stored hashes and cancelled requests are not completed work.
+        _failed += 1
+        raise
+    finally:
+        _pending -= 1
+    _completed += 1
+    return result
+
+
+def _hash(password: bytes) -> bytes:
+    # bcrypt accepts costs 4-31; stored hashes keep the cost they were created with.
+    rounds = min(31, max(4, int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))))
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+async def hashPassword(password: str) -> str:
+    return (await _run(_hash, password.encode("utf-8"))).decode("utf-8")
+
+
+async def verifyPassword(password: str, hashed: str) -> bool:
+    return await _run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def passwordHashStats() -> dict:
+    return {
+        "workers": max(1, int(os.getenv("PASSWORD_HASH_CONCURRENCY", "2"))),
+        "pending": _pending,
+        "completed": _completed,
+        "failed": _failed,
+        "rejected": _rejected,
+    }
+
+
+def shutdownPasswordHashing() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+
+# Final assistant text keyed by the user it was generated for and everything the model
+# sees: model name, temperature and the full message list (system prompt with its
+# retrieved context, the history window and the question). Any change in retrieved
+# rows changes the prompt and so the key; nothing needs invalidating. Answers are never
+# shared across users, so a hit reveals nothing about what anyone else asked. Only
+# completed streams are stored.
+
+
+def responseKey(user_id: str, model: str, messages: list[dict], temperature: float) -> str:
+    payload = json.dumps([str(user_id), model, temperature, messages], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def replayChunks(text: str, chunk_chars: Optional[int] = None) -> Iterator[str]:
+    """Split a stored answer into stream-sized pieces so clients render it as usual."""
+    size = chunk_chars or max(1, int(os.getenv("RESPONSE_CACHE_REPLAY_CHUNK_CHARS", "64")))
+    for start in range(0, len(text), size):
+        yield text[start : start + size]
+
+
+class ResponseCache:
+    """In-process LRU bounded by entry count and total text size, with TTL."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.chars_replayed = 0
+
+    def _drop(self, key: str):
+        _, text = self._entries.pop(key)
+        self._bytes -= len(text)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and (self.ttl_seconds <= 0 or time.time() - entry[0] <= self.ttl_seconds):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.chars_replayed += len(entry[1])
+            return entry[1]
+        if entry is not None:
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    def set(self, key: str, text: str):
+        if self.max_entries <= 0 or not text or len(text) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.time(), text)
+        self._bytes += len(text)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "model_calls_saved": self.hits,
+            "chars_replayed": self.chars_replayed,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def getResponseCache() -> ResponseCache:
+    """RESPONSE_CACHE_SIZE=0 disables storing; chats can also opt out individually."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+        )
+    return _response_cache
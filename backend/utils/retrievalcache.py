@@ -0,0 +1,200 @@
+import hashlib
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from utils.embeddings import normalizeQuery
+
+
+# Assembled prompt context per (chat, normalised query, filters, n_results). Every
+# chat has a generation number that is part of each key; upserting vectors into the
+# chat bumps it, so stale entries are never read again and age out by LRU or TTL.
+# get() returns the generation-qualified entry key alongside the value and set()
+# stores under that key, so a context assembled while an upsert landed is filed
+# under the old generation instead of the new one. In process, generation numbers
+# come from one counter and are never reused, so the per-chat records can be kept
+# as an LRU: a chat whose record was evicted gets a fresh number and its old
+# entries simply stop matching.
+
+
+def retrievalKey(query: str, filter_args: dict, n_results: int) -> str:
+    payload = json.dumps([normalizeQuery(query), filter_args, n_results], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RetrievalCache:
+    """In-process LRU bounded by entry count and total UTF-8 context size, with TTL."""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, str, int]] = OrderedDict()
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        self._counter = itertools.count()
+        # Enough records for every chat with live entries plus as many recently invalidated ones.
+        self.max_generations = max(1024, 2 * max_entries)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _new_generation(self, chat_id: str) -> int:
+        generation = self._generations[chat_id] = next(self._counter)
+        self._generations.move_to_end(chat_id)
+        while len(self._generations) > self.max_generations:
+            self._generations.popitem(last=False)
+        return generation
+
+    def _entry_key(self, chat_id: str, key: str) -> str:
+        generation = self._generations.get(chat_id)
+        if generation is None:
+            generation = self._new_generation(chat_id)
+        else:
+            self._generations.move_to_end(chat_id)
+        return f"{chat_id}:{generation}:{key}"
+
+    def _drop(self, entry_key: str):
+        _, _, size = self._entries.pop(entry_key)
+        self._bytes -= size
+
+    async def get(self, chat_id: str, key: str) -> tuple[Optional[str], str]:
+        entry_key = self._entry_key(chat_id, key)
+        entry = self._entries.get(entry_key)
+        if entry is not None and (self.ttl_seconds <= 0 or time.time() - entry[0] <= self.ttl_seconds):
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return entry[1], entry_key
+        if entry is not None:
+            self._drop(entry_key)
+        self.misses += 1
+        return None, entry_key
+
+    async def set(self, entry_key: str, context: str):
+        size = len(context.encode())
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        if entry_key in self._entries:
+            self._drop(entry_key)
+        self._entries[entry_key] = (time.time(), context, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    async def invalidate(self, chat_id: str):
+        self._new_generation(chat_id)
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "generations": len(self._generations),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class RedisRetrievalCache:
+    """
+    Shared variant for several app processes, on any Redis-compatible server. Size
+    bounds are left to the server's maxmemory policy (allkeys-lru); entries carry
+    the TTL. Hit counters are per process.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client, ttl_seconds: float, prefix: str = "retrieval:"):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    async def _entry_key(self, chat_id: str, key: str) -> str:
+        generation = await self.client.get(f"{self.prefix}gen:{chat_id}")
+        return f"{self.prefix}ctx:{chat_id}:{int(generation or 0)}:{key}"
+
+    async def get(self, chat_id: str, key: str) -> tuple[Optional[str], Optional[str]]:
+        # The cache is an optimisation; an unreachable server is treated as a miss.
+        entry_key = value = None
+        try:
+            entry_key = await self._entry_key(chat_id, key)
+            value = await self.client.get(entry_key)
+        except Exception as e:
+            self.errors += 1
+            print(f"Retrieval cache read failed: {e}")
+        if value is None:
+            self.misses += 1
+            return None, entry_key
+        self.hits += 1
+        return (value.decode() if isinstance(value, bytes) else value), entry_key
+
+    async def set(self, entry_key: Optional[str], context: str):
+        if entry_key is None:
+            return
+        ttl = int(self.ttl_seconds) if self.ttl_seconds > 0 else None
+        try:
+            await self.client.set(entry_key, context, ex=ttl)
+        except Exception as e:
+            self.errors += 1
+            print(f"Retrieval cache write failed: {e}")
+
+    async def invalidate(self, chat_id: str):
+        # Ingestion must not fail on the cache; a lost bump is bounded by the TTL and
+        # repeated when the job completes.
+        try:
+            await self.client.incr(f"{self.prefix}gen:{chat_id}")
+            self.invalidations += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Retrieval cache invalidation failed for chat {chat_id}: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+_retrieval_cache = None
+
+
+def getRetrievalCache():
+    """
+    RETRIEVAL_CACHE_URL selects the backend: empty for the in-process cache
+    (RETRIEVAL_CACHE_SIZE=0 disables it), or a redis:// URL (requires the redis
+    package) shared by every worker.
+    """
+    global _retrieval_cache
+    if _retrieval_cache is None:
+        ttl = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "600"))
+        url = os.getenv("RETRIEVAL_CACHE_URL", "")
+        if url:
+            import redis.asyncio as redis
+
+            _retrieval_cache = RedisRetrievalCache(redis.from_url(url), ttl)
+        else:
+            _retrieval_cache = RetrievalCache(
+                max_entries=int(os.getenv("RETRIEVAL_CACHE_SIZE", "2000")),
+                max_bytes=int(os.getenv("RETRIEVAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+                ttl_seconds=ttl,
+            )
+    return _retrieval_cache
+
@@ -0,0 +1,218 @@
+import asyncio
+import base64
+import os
+import random
+import time
+from typing import Optional
+
+import numpy as np
+from openai import RateLimitError, APIError, APIConnectionError
+
+from utils.clients import getAsyncOpenai, getEmbeddingDimensions, getEmbeddingModelName
+from utils.metrics import increment, observe
+
+
+def estimateTokens(text: str) -> int:
+    # Row JSON is punctuation-heavy, so the default assumes fewer chars per token than prose.
+    chars_per_token = float(os.getenv("EMBED_CHARS_PER_TOKEN", "3"))
+    return max(1, int(len(text) / chars_per_token) + 1)
+
+
+class _TokenBucket:
+    """Per-minute budget refilled continuously; shared by every caller in the process."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class EmbeddingScheduler:
+    """
+    Packs texts into requests by estimated token count and runs them under an
+    AIMD concurrency limit: +1 slot per limit's worth of fast successes, halved on
+    429s and trimmed when latency exceeds EMBED_TARGET_LATENCY_MS. Token and
+    request budgets are shared by all concurrent uploads in the process.
+    """
+
+    def __init__(self):
+        self.max_batch_tokens = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "250000"))
+        self.max_batch_items = int(os.getenv("EMBED_MAX_BATCH_ITEMS", "2048"))
+        self.max_input_tokens = int(os.getenv("EMBED_MAX_INPUT_TOKENS", "8191"))
+        self.min_concurrency = 1.0
+        self.max_concurrency = float(os.getenv("EMBED_MAX_CONCURRENCY", "16"))
+        self.limit = min(self.max_concurrency, float(max(1, int(os.getenv("EMBED_CONCURRENCY", "3")))))
+        self.target_latency_ms = float(os.getenv("EMBED_TARGET_LATENCY_MS", "5000"))
+        self.max_retries = int(os.getenv("EMBED_RETRIES", "6"))
+        self.base_delay_ms = int(os.getenv("EMBED_RETRY_BASE_MS", "500"))
+        self._tpm = _TokenBucket(float(os.getenv("EMBED_TPM", "1000000")))
+        self._rpm = _TokenBucket(float(os.getenv("EMBED_RPM", "3000")))
+        self._in_flight = 0
+        self._slots = asyncio.Condition()
+        self.rows = 0
+        self.tokens = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.busy_seconds = 0.0
+        self._active = 0
+        self._busy_since = 0.0
+
+    def pack(self, texts: list[str]) -> list[tuple[list[int], list[str], int]]:
+        """Splits texts into (indices, inputs, estimated tokens) batches within provider limits."""
+        batches = []
+        indices: list[int] = []
+        inputs: list[str] = []
+        batch_tokens = 0
+        max_chars = int(self.max_input_tokens * float(os.getenv("EMBED_CHARS_PER_TOKEN", "3")))
+        for i, text in enumerate(texts):
+            tokens = estimateTokens(text)
+            if tokens > self.max_input_tokens:
+                text = text[:max_chars]
+                tokens = self.max_input_tokens
+            if inputs and (batch_tokens + tokens > self.max_batch_tokens or len(inputs) >= self.max_batch_items):
+                batches.append((indices, inputs, batch_tokens))
+                indices, inputs, batch_tokens = [], [], 0
+            indices.append(i)
+            inputs.append(text)
+            batch_tokens += tokens
+        if inputs:
+            batches.append((indices, inputs, batch_tokens))
+        return batches
+
+    async def _acquire_slot(self):
+        async with self._slots:
+            while self._in_flight >= int(self.limit):
+                await self._slots.wait()
+            self._in_flight += 1
+
+    async def _release_slot(self):
+        async with self._slots:
+            self._in_flight -= 1
+            self._slots.notify_all()
+
+    def _on_success(self, latency_ms: float):
+        if latency_ms > self.target_latency_ms:
+            self.limit = max(self.min_concurrency, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def _on_rate_limited(self):
+        self.rate_limited += 1
+        self.limit = max(self.min_concurrency, self.limit / 2)
+
+    async def _request(
+        self, inputs: list[str], tokens: int, interactive: bool, model: str, dimensions: Optional[int]
+    ) -> np.ndarray:
+        client = getAsyncOpenai()
+        # Vectors come back as base64 float32 and are decoded straight into one array,
+        # never as Python float lists. `dimensions` asks for shortened vectors.
+        options = {"encoding_format": "base64"}
+        if dimensions:
+            options["dimensions"] = dimensions
+        for attempt in range(self.max_retries):
+            # Interactive (chat query) requests are tiny and latency-sensitive, so they
+            # skip the bulk budgets and slots rather than queueing behind uploads.
+            if not interactive:
+                await self._tpm.acquire(tokens)
+                await self._rpm.acquire(1)
+                await self._acquire_slot()
+            started = time.perf_counter()
+            error = None
+            try:
+                resp = await client.embeddings.create(model=model, input=inputs, **options)
+            except (RateLimitError, APIError, APIConnectionError) as e:
+                error = e
+            finally:
+                if not interactive:
+                    await self._release_slot()
+
+            if error is None:
+                latency = time.perf_counter() - started
+                if not interactive:
+                    self._on_success(latency * 1000)
+                self.requests += 1
+                self.tokens += tokens
+                kind = "query" if interactive else "bulk"
+                observe("rag_embedding_request_seconds", latency, kind=kind)
+                increment("rag_embedding_requests_total", kind=kind)
+                increment("rag_embedding_tokens_total", tokens, kind=kind)
+                return np.stack([np.frombuffer(base64.b64decode(item.embedding), dtype="<f4") for item in resp.data])
+
+            retry_after = None
+            if isinstance(error, RateLimitError):
+                self._on_rate_limited()
+                headers = getattr(getattr(error, "response", None), "headers", None) or {}
+                try:
+                    retry_after = float(headers.get("retry-after"))
+                except (TypeError, ValueError):
+                    retry_after = None
+            if attempt == self.max_retries - 1:
+                raise error
+            reason = "rate_limited" if isinstance(error, RateLimitError) else "error"
+            increment("rag_embedding_retries_total", reason=reason)
+            delay = retry_after if retry_after is not None else (2 ** attempt) * self.base_delay_ms / 1000
+            await asyncio.sleep(delay + random.uniform(0, 0.25))
+        return np.empty((0, 0), dtype=np.float32)
+
+    async def embed(
+        self, texts: list[str], interactive: bool = False, model: Optional[str] = None, dimensions: Optional[int] = None
+    ) -> np.ndarray:
+        """Embeds with `model` and `dimensions`, by default OPENAI_EMBEDDING_MODEL and EMBED_DIMENSIONS."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        self._active += 1
+        if self._active == 1:
+            self._busy_since = time.monotonic()
+        try:
+            if model is None:
+                model, dimensions = getEmbeddingModelName(), getEmbeddingDimensions()
+            batches = self.pack(texts)
+            results = await asyncio.gather(
+                *(self._request(inputs, tokens, interactive, model, dimensions) for _, inputs, tokens in batches)
+            )
+            vectors = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+            for (indices, _, _), group in zip(batches, results):
+                vectors[indices] = group
+            self.rows += len(texts)
+            return vectors
+        finally:
+            self._active -= 1
+            if self._active == 0:
+                self.busy_seconds += time.monotonic() - self._busy_since
+
+    def stats(self) -> dict:
+        busy = self.busy_seconds + (time.monotonic() - self._busy_since if self._active else 0.0)
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self._in_flight,
+            "rows": self.rows,
+            "tokens": self.tokens,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "rows_per_sec": round(self.rows / busy, 2) if busy > 0 else None,
+        }
+
+
+_scheduler: Optional[EmbeddingScheduler] = None
+
+
+def getEmbeddingScheduler() -> EmbeddingScheduler:
+    """Scheduler for the OpenAI provider; used through OpenAIEmbeddingProvider."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = EmbeddingScheduler()
+    return _scheduler
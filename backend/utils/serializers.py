@@ -1,8 +1,10 @@
-from db.models import Chat, Message
+from datetime import datetime, timezone
+
+from db.models import Chat, IngestionJob, Message
 
 
 def serialize_chat(chat: Chat) -> dict:
-    return {"id": str(chat.id), "title": chat.title}
+    return {"id": str(chat.id), "title": chat.title, "bypass_response_cache": chat.bypass_response_cache}
 
 
 def serialize_message(message: Message) -> dict:
@@ -13,3 +15,53 @@ def serialize_message(message: Message) -> dict:
         "content": message.content,
         "created_at": message.created_at.isoformat() if getattr(message, "created_at", None) else None,
     }
+
+
+def serialize_message_values(values: dict) -> dict:
+    """Counterpart of serialize_message for projected `.values()` rows."""
+    out = {}
+    for key, value in values.items():
+        if key in ("id", "chat_id"):
+            value = str(value)
+        elif key == "created_at":
+            value = value.isoformat() if value else None
+        out[key] = value
+    return out
+
+
+def serialize_job(job: IngestionJob) -> dict:
+    rows_per_sec = None
+    eta_seconds = None
+    if job.started_at:
+        end = job.finished_at or datetime.now(timezone.utc)
+        elapsed = (end - job.started_at).total_seconds()
+        if elapsed > 0:
+            rows_per_sec = round((job.rows_upserted - job.resumed_from) / elapsed, 2)
+            # Row totals are unknown while streaming, so the ETA is extrapolated from the
+            # bytes this run has consumed (a resumed run starts part-way through the file).
+            read = job.bytes_read - job.resumed_from_bytes
+            if job.status == "RUNNING" and read > 0 and job.bytes_read < job.bytes_total:
+                eta_seconds = round(elapsed * (job.bytes_total - job.bytes_read) / read, 1)
+    return {
+        "id": str(job.id),
+        "chat_id": str(job.chat_id),
+        "file_id": job.file_id,
+        "filename": job.filename,
+        "status": job.status,
+        "error": job.error,
+        "rows_parsed": job.rows_parsed,
+        "rows_embedded": job.rows_embedded,
+        "rows_upserted": job.rows_upserted,
+        "rows_unchanged": job.rows_unchanged,
+        "rows_deleted": job.rows_deleted,
+        "refresh": job.refresh,
+        "key_column": job.key_column,
+        "bytes_read": job.bytes_read,
+        "bytes_total": job.bytes_total,
+        "inferred_schema": job.inferred_schema,
+        "rows_per_sec": rows_per_sec,
+        "eta_seconds": eta_seconds,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
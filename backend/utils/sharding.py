@@ -0,0 +1,74 @@
+import hashlib
+import os
+from typing import Optional
+
+
+# How vectors are spread over Chroma collections (CHROMA_SHARDING):
+#   none  everything in CHROMA_COLLECTION_NAME, isolated by the chat_id filter
+#   chat  one collection per chat; dropping a chat is dropping its collection
+#   user  one collection per user
+#   hash  CHROMA_SHARD_BUCKETS collections, chats assigned by a hash of chat_id
+# A chat always lands in exactly one collection, so chat-scoped queries touch one shard.
+
+SHARDING_STRATEGIES = ("none", "chat", "user", "hash")
+
+
+def getShardingStrategy() -> str:
+    strategy = os.getenv("CHROMA_SHARDING", "none").lower()
+    if strategy not in SHARDING_STRATEGIES:
+        raise ValueError(f"Unknown CHROMA_SHARDING '{strategy}', expected one of {', '.join(SHARDING_STRATEGIES)}")
+    return strategy
+
+
+def shardName(chat_id: Optional[str], user_id: Optional[str], strategy: Optional[str] = None) -> str:
+    strategy = strategy or getShardingStrategy()
+    base = os.getenv("CHROMA_COLLECTION_NAME", "simplyphi")
+    if strategy == "none":
+        return base
+    if strategy == "user":
+        if not user_id:
+            raise ValueError("CHROMA_SHARDING=user needs a user_id to route to a collection")
+        return f"{base}-user-{user_id}"
+    if not chat_id:
+        raise ValueError(f"CHROMA_SHARDING={strategy} needs a chat_id to route to a collection")
+    if strategy == "chat":
+        return f"{base}-chat-{chat_id}"
+    buckets = max(1, int(os.getenv("CHROMA_SHARD_BUCKETS", "16")))
+    bucket = int(hashlib.sha256(str(chat_id).encode()).hexdigest()[:8], 16) % buckets
+    return f"{base}-{bucket:03d}"
+
+
+def isShardName(name: str, strategy: str) -> bool:
+    """Whether collection `name` belongs to the given layout."""
+    base = os.getenv("CHROMA_COLLECTION_NAME", "simplyphi")
+    if strategy == "none":
+        return name == base
+    if strategy in ("chat", "user"):
+        return name.startswith(f"{base}-{strategy}-")
+    suffix = name[len(base) + 1 :]
+    return name.startswith(f"{base}-") and len(suffix) == 3 and suffix.isdigit()
+
+
+def whereScope(where: Optional[dict], key: str) -> Optional[str]:
+    """Value of an equality clause on `key`, at the top level or inside $and."""
+    if not where:
+        return None
+    condition = where.get(key)
+    if isinstance(condition, dict) and "$eq" in condition:
+        return str(condition["$eq"])
+    if isinstance(condition, str):
+        return condition
+    for clause in where.get("$and", []):
+        value = whereScope(clause, key)
+        if value is not None:
+            return value
+    return None
+
+
+def shardForWhere(where: Optional[dict]) -> str:
+    """Collection a chat-scoped query or get must go to."""
+    return shardName(whereScope(where, "chat_id"), whereScope(where, "user_id"))
+
+
+def shardForMetadata(metadata: dict) -> str:
+    return shardName(metadata.get("chat_id"), metadata.get("user_id"))
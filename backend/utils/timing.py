@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Optional, TypeVar
+
+from utils.metrics import emitTrace, observe, tracingEnabled
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """
+    Collects wall-clock durations per request stage and renders a Server-Timing header.
+    With an `operation` name, every stage is also observed in the stage duration
+    histogram, and finish() records the total and emits the request trace.
+    """
+
+    def __init__(self, operation: Optional[str] = None):
+        self.operation = operation
+        self.stages: dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.spans: Optional[list[dict]] = [] if operation and tracingEnabled() else None
+        self.finished = False
+
+    def record(self, name: str, seconds: float, started: Optional[float] = None):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+        if self.operation:
+            observe("rag_stage_duration_seconds", seconds, operation=self.operation, stage=name)
+            if self.spans is not None:
+                offset = (started if started is not None else time.perf_counter() - seconds) - self.started
+                self.spans.append({"stage": name, "start_ms": round(offset * 1000, 2), "ms": round(seconds * 1000, 2)})
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, started)
+
+    async def measure(self, name: str, awaitable: Awaitable[T]) -> T:
+        with self.stage(name):
+            return await awaitable
+
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.stages.items())
+
+    def finish(self, **attributes):
+        """Records the total once; `attributes` (ids, outcome) only go into the trace."""
+        if self.finished or not self.operation:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        observe("rag_stage_duration_seconds", total, operation=self.operation, stage="total")
+        if self.spans is not None:
+            emitTrace(
+                {"operation": self.operation, **attributes, "total_ms": round(total * 1000, 2), "spans": self.spans}
+            )
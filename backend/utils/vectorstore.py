@@ -0,0 +1,156 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from utils.clients import getChromaCollection, getCollectionEmbeddingModel
+from utils.localindex import closeLocalVectorStore, getLocalVectorStore
+from utils.retrievalcache import getRetrievalCache
+from utils.sharding import shardForMetadata, shardForWhere, shardName, whereScope
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_upsert_sem: Optional[asyncio.Semaphore] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        max_workers = max(2, int(os.getenv("CHROMA_MAX_WORKERS", "8")))
+        _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chroma")
+    return _executor
+
+
+def _get_upsert_sem() -> asyncio.Semaphore:
+    # Process-wide, so concurrent uploads together never occupy every pool thread
+    # and chat queries always find a free worker.
+    global _upsert_sem
+    if _upsert_sem is None:
+        max_workers = max(2, int(os.getenv("CHROMA_MAX_WORKERS", "8")))
+        concurrency = int(os.getenv("CHROMA_UPSERT_CONCURRENCY", "4"))
+        _upsert_sem = asyncio.Semaphore(max(1, min(concurrency, max_workers - 1)))
+    return _upsert_sem
+
+
+def _use_local() -> bool:
+    return os.getenv("VECTOR_STORE", "chroma").lower() == "local"
+
+
+def _get_backend(shard: str | None):
+    """The Chroma collection for `shard`, or per-chat local indexes with VECTOR_STORE=local."""
+    if _use_local():
+        return getLocalVectorStore()
+    return getChromaCollection(shard)
+
+
+async def _run(method: str, shard: str | None = None, **kwargs):
+    def call():
+        return getattr(_get_backend(shard), method)(**kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), call)
+
+
+async def embeddingModelFor(chat_id: str, user_id: str) -> str:
+    """
+    Embedding model id of the collection (or local index) a chat's vectors live in;
+    rows and queries for the chat are embedded with it.
+    """
+
+    def resolve():
+        if _use_local():
+            return getLocalVectorStore().embedding_model
+        return getCollectionEmbeddingModel(shardName(chat_id, user_id))
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), resolve)
+
+
+async def upsertVectors(ids: list[str], embeddings, metadatas: list[dict]) -> int:
+    """
+    Upserts in CHROMA_UPSERT_BATCH slices, running up to CHROMA_UPSERT_CONCURRENCY
+    slices at once on the vector-store thread pool. Each slice goes to the shard
+    its rows' chat routes to.
+    """
+    upsert_batch = int(os.getenv("CHROMA_UPSERT_BATCH", "100"))
+    sem = _get_upsert_sem()
+    # Slices stay float32 arrays all the way into the store client.
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    by_shard: dict[str | None, list[int]] = {}
+    for i, metadata in enumerate(metadatas):
+        by_shard.setdefault(None if _use_local() else shardForMetadata(metadata), []).append(i)
+
+    async def upsert_slice(shard: str | None, positions: list[int]):
+        async with sem:
+            await _run(
+                "upsert",
+                shard=shard,
+                ids=[ids[i] for i in positions],
+                embeddings=embeddings[positions],
+                metadatas=[metadatas[i] for i in positions],
+            )
+
+    await asyncio.gather(
+        *(
+            upsert_slice(shard, positions[i : i + upsert_batch])
+            for shard, positions in by_shard.items()
+            for i in range(0, len(positions), upsert_batch)
+        )
+    )
+    # Cached contexts of these chats no longer reflect what retrieval would return.
+    for chat_id in {str(metadata["chat_id"]) for metadata in metadatas if metadata.get("chat_id")}:
+        await getRetrievalCache().invalidate(chat_id)
+    print(f"Upserted {len(ids)} vectors")
+    return len(ids)
+
+
+async def deleteVectors(ids: list[str], where: dict) -> int:
+    """
+    Deletes ids in CHROMA_UPSERT_BATCH x 10 slices. `where` scopes the call to one
+    chat (and its shard); ids outside it are left alone.
+    """
+    batch = int(os.getenv("CHROMA_UPSERT_BATCH", "100")) * 10
+    shard = None if _use_local() else shardForWhere(where)
+    for i in range(0, len(ids), batch):
+        await _run("delete", shard=shard, ids=ids[i : i + batch], where=where)
+    chat_id = whereScope(where, "chat_id")
+    if ids and chat_id is not None:
+        await getRetrievalCache().invalidate(chat_id)
+    print(f"Deleted {len(ids)} vectors")
+    return len(ids)
+
+
+async def queryVectors(
+    query_embeddings: list, n_results: int, where: dict | None = None, include: list[str] | None = None
+) -> dict:
+    # Documents are never stored, so they are left out of the response payload.
+    return await _run(
+        "query",
+        shard=None if _use_local() else shardForWhere(where),
+        query_embeddings=query_embeddings,
+        n_results=n_results,
+        where=where,
+        include=include or ["metadatas", "distances"],
+    )
+
+
+async def getVectors(where: dict, limit: int, offset: int = 0, include: list[str] | None = None) -> dict:
+    return await _run(
+        "get",
+        shard=None if _use_local() else shardForWhere(where),
+        where=where,
+        limit=limit,
+        offset=offset,
+        include=include or ["embeddings", "metadatas"],
+    )
+
+
+def shutdownVectorStore() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    closeLocalVectorStore()
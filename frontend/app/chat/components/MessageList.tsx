@@ -3,6 +3,9 @@ import { StoredMessage, StoredMessagePart } from '@/app/chat/types';
 
 type MessageListProps = {
   messages: StoredMessage[];
+  hasOlder?: boolean;
+  loadingOlder?: boolean;
+  onLoadOlder?: () => void;
 };
 
 function escapeHtml(input: string): string {
@@ -21,9 +24,21 @@ function simpleMarkdownToHtml(input: string): string {
   return html;
 }
 
-export default function MessageList({ messages }: MessageListProps) {
+export default function MessageList({ messages, hasOlder, loadingOlder, onLoadOlder }: MessageListProps) {
   return (
     <div className="flex-1 overflow-y-auto px-4 md:px-8 py-6 scrollbar-dark">
+      {hasOlder && onLoadOlder && (
+        <div className="mb-6 flex justify-center">
+          <button
+            type="button"
+            onClick={onLoadOlder}
+            disabled={loadingOlder}
+            className="rounded-md border border-zinc-200 dark:border-zinc-800 px-3 py-1.5 text-xs text-zinc-600 dark:text-zinc-400 hover:bg-zinc-100 dark:hover:bg-zinc-900 disabled:opacity-50"
+          >
+            {loadingOlder ? 'Loading…' : 'Load earlier messages'}
+          </button>
+        </div>
+      )}
       {messages.map(message => {
         const isAssistant = message.role !== 'user';
         const textParts = message.parts.filter(p => p.type === 'text') as StoredMessagePart[];
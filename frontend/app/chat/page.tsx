@@ -14,6 +14,9 @@ export default function Chat() {
   const [isMobileMenuOpen, setIsMobileMenuOpen] = useState(false);
   const [chats, setChats] = useState<ChatSession[]>([]);
   const [messages, setMessages] = useState<StoredMessage[]>([]);
+  // Cursor of the page before the oldest message shown; null once the whole history is loaded.
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [newChatDialog, setNewChatDialog] = useState(false);
   const [isStreaming, setIsStreaming] = useState(false);
   
@@ -21,8 +24,15 @@ export default function Chat() {
   const apiBase = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:3001';
 
   async function fetchChats() {
-    const res = await fetch(`${apiBase}/app/chats`, { credentials: 'include' });
-    const data = await res.json();
+    // Newest first, one page at a time; follow X-Next-Cursor to the last page.
+    const data: ChatSession[] = [];
+    let cursor: string | null = null;
+    do {
+      const query: string = cursor ? `?after=${encodeURIComponent(cursor)}` : '';
+      const res = await fetch(`${apiBase}/app/chats${query}`, { credentials: 'include' });
+      data.push(...((await res.json()) as ChatSession[]));
+      cursor = res.headers.get('X-Next-Cursor');
+    } while (cursor);
     setChats(data);
     if (!currentChatId) {
       if (Array.isArray(data) && data.length > 0) {
@@ -33,10 +43,7 @@ export default function Chat() {
     }
   }
 
-  async function fetchMessages(chatId: string) {
-    if (!chatId) return;
-    const res = await fetch(`${apiBase}/app/chats/${chatId}/messages`, { credentials: 'include' });
-    const raw = (await res.json()) as { id: string; role: string; content: string; created_at?: string }[];
+  function toStoredMessages(raw: { id: string; role: string; content: string; created_at?: string }[]): StoredMessage[] {
     const decorated = raw.map(m => ({
       id: m.id,
       role: m.role,
@@ -44,8 +51,39 @@ export default function Chat() {
       createdAtMs: m.created_at ? Date.parse(m.created_at) : 0,
     }));
     decorated.sort((a, b) => a.createdAtMs - b.createdAtMs);
-    const mapped: StoredMessage[] = decorated.map(m => ({ id: m.id, role: m.role.toLowerCase(), parts: [{ type: 'text', text: m.content }] }));
-    setMessages(mapped);
+    return decorated.map(m => ({ id: m.id, role: m.role.toLowerCase(), parts: [{ type: 'text', text: m.content }] }));
+  }
+
+  async function fetchMessages(chatId: string, keepOlder = false) {
+    if (!chatId) return;
+    const res = await fetch(`${apiBase}/app/chats/${chatId}/messages?latest=true&limit=200`, { credentials: 'include' });
+    const page = toStoredMessages(await res.json());
+    if (!keepOlder) {
+      setMessages(page);
+      setOlderCursor(res.headers.get('X-Next-Cursor'));
+      return;
+    }
+    // After a reply, swap in the newest page but keep the older history already loaded above it.
+    setMessages(prev => {
+      const join = page.length ? prev.findIndex(m => m.id === page[0].id) : -1;
+      return join >= 0 ? [...prev.slice(0, join), ...page] : page;
+    });
+  }
+
+  async function fetchOlderMessages() {
+    if (!currentChatId || !olderCursor || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const res = await fetch(
+        `${apiBase}/app/chats/${currentChatId}/messages?before=${encodeURIComponent(olderCursor)}&limit=200`,
+        { credentials: 'include' },
+      );
+      const page = toStoredMessages(await res.json());
+      setMessages(prev => [...page, ...prev]);
+      setOlderCursor(res.headers.get('X-Next-Cursor'));
+    } finally {
+      setLoadingOlder(false);
+    }
   }
 
   useEffect(() => {
@@ -101,7 +139,12 @@ export default function Chat() {
           onToggleSidebar={() => setIsMobileMenuOpen(s => !s)}
           onNewChat={createNewSession}
         />
-        <MessageList messages={messages} />
+        <MessageList
+          messages={messages}
+          hasOlder={olderCursor !== null}
+          loadingOlder={loadingOlder}
+          onLoadOlder={fetchOlderMessages}
+        />
 
         <TextInput
           input={input}
@@ -110,10 +153,6 @@ export default function Chat() {
           onSend={async (text) => {
             if (!currentChatId) return;
             if (isStreaming) return;
-            const prior = messages.slice(-5).map(m => ({
-              role: m.role === 'assistant' ? 'ASSISTANT' : 'USER',
-              content: (m.parts.find(p => p.type === 'text') as any)?.text || '',
-            }));
             const newUserMsg: StoredMessage = { id: `${Date.now()}`, role: 'user', parts: [{ type: 'text', text }] };
             const assistantId = `${Date.now()}-a`;
             const assistantShell: StoredMessage = { id: assistantId, role: 'assistant', parts: [{ type: 'text', text: '' }] };
@@ -124,7 +163,7 @@ export default function Chat() {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 credentials: 'include',
-                body: JSON.stringify({ role: 'USER', content: text, history: prior }),
+                body: JSON.stringify({ role: 'USER', content: text }),
               });
               const reader = res.body?.getReader();
               if (!reader) return;
@@ -139,7 +178,7 @@ export default function Chat() {
               }
             } finally {
               setIsStreaming(false);
-              fetchMessages(currentChatId);
+              fetchMessages(currentChatId, true);
             }
           }}
         />
@@ -154,6 +193,7 @@ export default function Chat() {
         setChats(prev => [chat, ...prev]);
         setCurrentChatId(chat.id);
         setMessages([]);
+        setOlderCursor(null);
       }}
     />
     </>